@@ -0,0 +1,50 @@
+"""
+Measure memory use per entity, with and without ``federation.entities.compact``.
+
+Maps the ActivityPub and Diaspora post payloads from the test fixtures. Run from the repository root::
+
+    python benchmarks/compact_entities.py
+"""
+import json
+import tracemalloc
+
+from federation.entities.activitypub.mappers import message_to_objects as activitypub_message_to_objects
+from federation.entities.activitypub.receivers import set_receiver_resolver
+from federation.entities.compact import compact
+from federation.entities.diaspora.mappers import message_to_objects as diaspora_message_to_objects
+from federation.tests.fixtures.payloads import ACTIVITYPUB_POST, DIASPORA_POST_SIMPLE
+
+ENTITIES = 2000
+
+ACTIVITYPUB_PAYLOAD = json.dumps(ACTIVITYPUB_POST)
+
+
+def map_activitypub():
+    return activitypub_message_to_objects(json.loads(ACTIVITYPUB_PAYLOAD), "https://diaspodon.fr/users/jaywink")[0]
+
+
+def map_diaspora():
+    return diaspora_message_to_objects(DIASPORA_POST_SIMPLE, "alice@alice.diaspora.example.org")[0]
+
+
+def measure(factory):
+    tracemalloc.start()
+    entities = [factory() for _i in range(ENTITIES)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entities
+    return size / ENTITIES
+
+
+def main():
+    # No network access for receivers
+    set_receiver_resolver(None)
+    print("%-12s %12s %12s %8s" % ("payload", "entity", "compact", "ratio"))
+    for name, factory in (("activitypub", map_activitypub), ("diaspora", map_diaspora)):
+        plain = measure(factory)
+        compacted = measure(lambda: compact(factory()))
+        print("%-12s %10.0f B %10.0f B %7.1fx" % (name, plain, compacted, plain / compacted))
+
+
+if __name__ == "__main__":
+    main()
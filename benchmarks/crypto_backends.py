@@ -0,0 +1,37 @@
+"""
+Compare the crypto backends in ``federation.utils.crypto``.
+
+Uses the keys and payloads from the test fixtures. Run from the repository root::
+
+    python benchmarks/crypto_backends.py
+"""
+import timeit
+
+from Crypto.PublicKey import RSA
+
+from federation.tests.fixtures.keys import PRIVATE_KEY, XML
+from federation.utils.crypto import BACKENDS
+
+ROUNDS = 200
+
+
+def main():
+    private_key = RSA.importKey(PRIVATE_KEY)
+    public_key = private_key.publickey()
+    message = XML.encode("utf-8")
+    print("%-14s %12s %12s %12s %12s" % ("backend", "sign", "verify", "encrypt", "decrypt"))
+    for name, backend_class in BACKENDS.items():
+        backend = backend_class()
+        signature = backend.sign(private_key, message)
+        encrypted = backend.encrypt(public_key, message[:64])
+        timings = [
+            timeit.timeit(lambda: backend.sign(private_key, message), number=ROUNDS),
+            timeit.timeit(lambda: backend.verify(public_key, message, signature), number=ROUNDS),
+            timeit.timeit(lambda: backend.encrypt(public_key, message[:64]), number=ROUNDS),
+            timeit.timeit(lambda: backend.decrypt(private_key, encrypted), number=ROUNDS),
+        ]
+        print("%-14s %s" % (name, " ".join("%10.1fus" % (timing / ROUNDS * 1000000) for timing in timings)))
+
+
+if __name__ == "__main__":
+    main()
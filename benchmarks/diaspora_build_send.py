@@ -0,0 +1,48 @@
+"""
+Compare building Diaspora magic envelopes from a serialized message and directly from the entity XML element.
+
+Uses the key from the test fixtures and a post with a long text. Run from the repository root::
+
+    python benchmarks/diaspora_build_send.py
+"""
+import timeit
+
+from Crypto.PublicKey import RSA
+from lxml import etree
+
+from federation.entities.diaspora.entities import DiasporaPost
+from federation.protocols.diaspora.magic_envelope import MagicEnvelope
+from federation.tests.fixtures.keys import PRIVATE_KEY
+
+ROUNDS = 200
+
+
+def main():
+    private_key = RSA.importKey(PRIVATE_KEY)
+    entity = DiasporaPost(
+        raw_content="Lorem ipsum dolor sit amet. " * 200, guid="0123456789abcdef", handle="alice@example.com",
+    )
+    xml = entity.to_xml()
+
+    def from_string():
+        MagicEnvelope(etree.tostring(xml), private_key=private_key, author_handle="alice@example.com").create_payload()
+
+    def from_element():
+        MagicEnvelope(xml, private_key=private_key, author_handle="alice@example.com").create_payload()
+
+    def render_from_string():
+        MagicEnvelope(etree.tostring(xml), private_key=private_key, author_handle="alice@example.com").render()
+
+    def render_from_element():
+        MagicEnvelope(xml, private_key=private_key, author_handle="alice@example.com").render()
+
+    print("%-10s %12s %12s" % ("message", "payload", "render"))
+    for name, payload, render in (
+            ("string", from_string, render_from_string), ("element", from_element, render_from_element),
+    ):
+        timings = [timeit.timeit(payload, number=ROUNDS), timeit.timeit(render, number=ROUNDS)]
+        print("%-10s %s" % (name, " ".join("%10.1fus" % (timing / ROUNDS * 1000000) for timing in timings)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure how many body sized buffers receiving a payload needs.
+
+Runs protocol identification and ``receive`` for a public Diaspora payload and an ActivityPub payload of a few
+sizes, with authorship verification skipped. The peak memory traced by ``tracemalloc`` while receiving is reported
+in multiples of the body size, which is roughly the number of copies of the body alive at the same time. Memory
+allocated inside lxml is not traced, so parsed XML trees are not counted. Run from the repository root::
+
+    python benchmarks/inbound_copies.py
+"""
+import json
+import timeit
+import tracemalloc
+
+from Crypto.PublicKey import RSA
+
+from federation.entities.diaspora.entities import DiasporaPost
+from federation.protocols.activitypub.protocol import Protocol as ActivitypubProtocol
+from federation.protocols.activitypub.protocol import identify_request as activitypub_identify_request
+from federation.protocols.diaspora.magic_envelope import MagicEnvelope
+from federation.protocols.diaspora.protocol import Protocol as DiasporaProtocol
+from federation.protocols.diaspora.protocol import identify_request as diaspora_identify_request
+from federation.tests.fixtures.keys import PRIVATE_KEY
+from federation.types import RequestType
+
+SIZES = (64 * 1024, 1024 * 1024)
+ROUNDS = 20
+
+
+def diaspora_body(size: int) -> bytes:
+    private_key = RSA.importKey(PRIVATE_KEY)
+    # Base64 grows the message by a third
+    entity = DiasporaPost(
+        raw_content="x" * (size * 3 // 4), guid="0123456789abcdef", handle="alice@example.com",
+    )
+    envelope = MagicEnvelope(entity.to_xml(), private_key=private_key, author_handle="alice@example.com")
+    return envelope.render().encode("utf-8")
+
+
+def activitypub_body(size: int) -> bytes:
+    return json.dumps({
+        "@context": "https://www.w3.org/ns/activitystreams",
+        "id": "https://example.com/activities/1",
+        "type": "Create",
+        "actor": "https://example.com/users/alice",
+        "object": {
+            "id": "https://example.com/notes/1",
+            "type": "Note",
+            "attributedTo": "https://example.com/users/alice",
+            "content": "x" * size,
+        },
+    }).encode("utf-8")
+
+
+def receive_diaspora(body: bytes):
+    request = RequestType(body=body)
+    assert diaspora_identify_request(request)
+    DiasporaProtocol().receive(request, skip_author_verification=True)
+
+
+def receive_activitypub(body: bytes):
+    request = RequestType(body=body)
+    assert activitypub_identify_request(request)
+    ActivitypubProtocol().receive(request, skip_author_verification=True)
+
+
+def measure(receive, body: bytes):
+    receive(body)
+    tracemalloc.start()
+    try:
+        receive(body)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    seconds = timeit.timeit(lambda: receive(body), number=ROUNDS) / ROUNDS
+    return peak / len(body), seconds
+
+
+def main():
+    print("%-12s %10s %10s %10s" % ("protocol", "body", "copies", "time"))
+    for name, build, receive in (
+        ("diaspora", diaspora_body, receive_diaspora),
+        ("activitypub", activitypub_body, receive_activitypub),
+    ):
+        for size in SIZES:
+            body = build(size)
+            copies, seconds = measure(receive, body)
+            print("%-12s %9dK %10.2f %8.2fms" % (name, len(body) // 1024, copies, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compare rendering Diaspora host-meta and legacy webfinger documents through the ``minidom`` tree of ``python-xrd``,
+with the direct XRD serializer and with the templates used by the generators.
+
+Run from the repository root::
+
+    python benchmarks/xrd_render.py
+"""
+import timeit
+
+from federation.hostmeta.generators import DiasporaHostMeta, DiasporaWebFinger
+from federation.hostmeta.serializers import serialize_xrd
+
+ROUNDS = 2000
+
+
+def webfinger(guid):
+    return DiasporaWebFinger(
+        handle="user%s@server.example" % guid, host="https://server.example", guid=guid, public_key="ABCDEF==",
+    )
+
+
+def main():
+    cases = (
+        (
+            "host-meta",
+            lambda: DiasporaHostMeta(webfinger_host="https://server.example"),
+        ),
+        (
+            "webfinger",
+            lambda: webfinger("0123456789abcdef"),
+        ),
+    )
+    print("%-10s %12s %12s %12s" % ("document", "minidom", "serializer", "template"))
+    for name, build in cases:
+        minidom = timeit.timeit(
+            lambda: build().xrd.to_xml().toprettyxml(indent="  ", encoding="UTF-8"), number=ROUNDS,
+        )
+        serializer = timeit.timeit(lambda: serialize_xrd(build().xrd).encode("UTF-8"), number=ROUNDS)
+        template = timeit.timeit(lambda: build().render(), number=ROUNDS)
+        print("%-10s %10.1fus %10.1fus %10.1fus" % (
+            name, minidom / ROUNDS * 1e6, serializer / ROUNDS * 1e6, template / ROUNDS * 1e6,
+        ))
+
+
+if __name__ == "__main__":
+    main()
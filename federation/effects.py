@@ -0,0 +1,120 @@
+"""
+Deferred side effects of received entities.
+
+Entity ``post_receive`` hooks must not do outbound work, like sending an automatic Accept for a Follow, while the
+payload is being received. Instead they register a ``SideEffect`` on the entity with ``add_side_effect``. The
+side effects are run afterwards by ``dispatch_side_effects``, which ``federation.inbound.handle_receive`` calls
+with its ``side_effect_executor``. By default they are run on a shared background thread pool, so that receiving
+doesn't wait for them.
+"""
+import logging
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import attr
+
+logger = logging.getLogger("federation")
+
+# Maximum number of side effects run at the same time in the background
+SIDE_EFFECT_WORKERS = 4
+
+_executor = None
+_lock = threading.Lock()
+
+
+@attr.s
+class SideEffect:
+    """
+    An action to run after an entity has been received.
+
+    Calling the side effect runs it.
+    """
+    name: str = attr.ib()
+    function: Callable = attr.ib()
+    args: Tuple = attr.ib(default=())
+    kwargs: Dict = attr.ib(factory=dict)
+
+    def __call__(self) -> Any:
+        return self.function(*self.args, **self.kwargs)
+
+
+SideEffectExecutor = Union[Callable[[SideEffect], Any], Executor]
+
+
+def run_side_effect(effect: SideEffect) -> None:
+    """
+    Run a side effect right away, logging any exception.
+    """
+    try:
+        effect()
+    except Exception:
+        logger.exception("run_side_effect - side effect %s failed", effect.name)
+
+
+def _run_side_effect_in_thread(effect: SideEffect) -> None:
+    try:
+        run_side_effect(effect)
+    finally:
+        _close_database_connections()
+
+
+def _close_database_connections() -> None:
+    # Side effects may use the database through the configured functions. Connections are per thread in Django,
+    # don't leave the ones of the pool threads open.
+    try:
+        from django.conf import settings
+        from django.db import connections
+    except ImportError:
+        return
+    if settings.configured:
+        connections.close_all()
+
+
+def run_side_effect_in_background(effect: SideEffect) -> Future:
+    """
+    Run a side effect on a shared background thread pool, logging any exception.
+
+    This is the default executor of ``handle_receive``. The pool has ``SIDE_EFFECT_WORKERS`` threads.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=SIDE_EFFECT_WORKERS, thread_name_prefix="federation-effects")
+    return _executor.submit(_run_side_effect_in_thread, effect)
+
+
+def collect_side_effects(entities: List) -> List[SideEffect]:
+    """
+    Take the registered side effects from entities and their children.
+
+    The side effects are removed from the entities, so they are only collected once.
+    """
+    effects = []
+    for entity in entities:
+        if entity._side_effects:
+            effects.extend(entity._side_effects)
+            entity._side_effects = []
+        # Children not created yet, see `BaseEntity.defer`, have not registered any side effects
+        if not entity.is_deferred("_children") and entity._children:
+            effects.extend(collect_side_effects(entity._children))
+    return effects
+
+
+def dispatch_side_effects(entities: List, executor: SideEffectExecutor = run_side_effect) -> List[SideEffect]:
+    """
+    Collect the side effects of entities and hand them to an executor.
+
+    :arg entities: Received entities.
+    :arg executor: Either a function that takes a ``SideEffect``, for example to put it on a task queue, or a
+        ``concurrent.futures.Executor`` to run the side effects on. Defaults to running them right away.
+    :returns: The dispatched side effects.
+    """
+    effects = collect_side_effects(entities)
+    for effect in effects:
+        if isinstance(executor, Executor):
+            executor.submit(run_side_effect, effect)
+        else:
+            executor(effect)
+    return effects
@@ -10,4 +10,10 @@ CONTEXTS_DEFAULT = [
     CONTEXT_PYTHON_FEDERATION,
 ]
 
+# Preallocated contexts used by the entities. Tuples so that they can't be changed by accident.
+# The `to_as2` output of entities contains copies of these as lists.
+CONTEXTS_ACTIVITY = tuple(CONTEXTS_DEFAULT)
+CONTEXTS_NOTE = CONTEXTS_ACTIVITY + (CONTEXT_HASHTAG, CONTEXT_LD_SIGNATURES, CONTEXT_SENSITIVE)
+CONTEXTS_PROFILE = CONTEXTS_ACTIVITY + (CONTEXT_LD_SIGNATURES, CONTEXT_MANUALLY_APPROVES_FOLLOWERS)
+
 NAMESPACE_PUBLIC = "https://www.w3.org/ns/activitystreams#Public"
@@ -1,22 +1,49 @@
+import itertools
 import logging
 import re
 import uuid
-from typing import Dict, List
+from typing import Any, Dict, List
 
-from federation.entities.activitypub.constants import (
-    CONTEXTS_DEFAULT, CONTEXT_MANUALLY_APPROVES_FOLLOWERS, CONTEXT_SENSITIVE, CONTEXT_HASHTAG,
-    CONTEXT_LD_SIGNATURES)
+from django.core.exceptions import ImproperlyConfigured
+
+from federation.entities.activitypub.constants import CONTEXTS_ACTIVITY, CONTEXTS_NOTE, CONTEXTS_PROFILE
 from federation.entities.activitypub.enums import ActorType, ObjectType, ActivityType
 from federation.entities.base import Profile, Post, Follow, Accept, Comment, Retraction, Share, Image
 from federation.entities.mixins import RawContentMixin, BaseEntity, PublicMixin
-from federation.entities.utils import get_base_attributes
+from federation.entities.utils import convert_entity
 from federation.outbound import handle_send
 from federation.types import UserType
-from federation.utils.django import get_configuration
+from federation.utils.django import get_configuration, get_resolved_configuration
 from federation.utils.text import with_slash, validate_handle
 
 logger = logging.getLogger("federation")
 
+# Source of AS2 cache versions. Globally unique so that a version never repeats for different content
+_as2_versions = itertools.count()
+# Attributes of the AS2 cache itself, setting these doesn't change the version
+_AS2_CACHE_ATTRIBUTES = frozenset(("_as2_cache", "_as2_version"))
+
+
+def _get_configuration_key() -> Any:
+    """Get the configuration snapshot ``build_as2`` reads, for the AS2 cache key. A new one is made on changes."""
+    try:
+        return get_resolved_configuration()
+    except (AttributeError, ImproperlyConfigured):
+        return None
+
+
+def copy_as2(value: Any) -> Any:
+    """
+    Copy an AS2 structure.
+
+    Dictionaries, lists and tuples are copied, tuples become lists. Other values are shared.
+    """
+    if isinstance(value, dict):
+        return {key: copy_as2(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [copy_as2(item) for item in value]
+    return value
+
 
 class AttachImagesMixin(RawContentMixin):
     def pre_send(self) -> None:
@@ -24,28 +51,76 @@ class AttachImagesMixin(RawContentMixin):
         Attach any embedded images from raw_content.
         """
         super().pre_send()
-        if self._media_type != "text/markdown":
-            return
-        regex = r"!\[([\w ]*)\]\((https?://[\w\d\-\./]+\.[\w]*((?<=jpg)|(?<=gif)|(?<=png)|(?<=jpeg)))\)"
-        matches = re.finditer(regex, self.raw_content, re.MULTILINE | re.IGNORECASE)
-        for match in matches:
-            groups = match.groups()
+        for url, name in self.embedded_images:
             self._children.append(
                 ActivitypubImage(
-                    url=groups[1],
-                    name=groups[0] or "",
+                    url=url,
+                    name=name,
                     inline=True,
                 )
             )
 
 
 class ActivitypubEntityMixin(BaseEntity):
+    """
+    Serialization of an entity to AS2.
+
+    ``to_as2`` caches the result of ``build_as2``. Setting any attribute of the entity invalidates the cache, as does
+    adding or removing children or mentions, changes to child entities or changing the Django configuration. Entities
+    with children that are not ActivityPub entities are not cached. Changing a mutable attribute value in place, for
+    example a key in a dictionary, is not detected. Use ``invalidate_as2`` after doing that.
+    """
     _type = None
+    _as2_cache = None
+    _as2_version = 0
+
+    def __setattr__(self, name, value):
+        if name not in _AS2_CACHE_ATTRIBUTES:
+            object.__setattr__(self, "_as2_version", next(_as2_versions))
+        super().__setattr__(name, value)
+
+    def _get_as2_cache_key(self):
+        """Get the key of the AS2 cache, or ``None`` if the representation can't be cached."""
+        children = []
+        for child in self._children or ():
+            # Changes to children that are not ActivityPub entities can't be detected
+            get_child_key = getattr(child, "_get_as2_cache_key", None)
+            child_key = get_child_key() if get_child_key else None
+            if child_key is None:
+                return None
+            children.append((id(child), child_key))
+        return (
+            self._as2_version,
+            frozenset(self._mentions) if self._mentions else None,
+            tuple(children),
+            _get_configuration_key(),
+        )
+
+    def build_as2(self) -> Dict:
+        """Build the AS2 representation of the entity. Override in subclasses."""
+        raise NotImplementedError
+
+    def invalidate_as2(self) -> None:
+        """Drop the cached AS2 representation."""
+        self._as2_cache = None
+
+    def to_as2(self) -> Dict:
+        """
+        Get the AS2 representation of the entity.
+
+        The representation is cached until the entity changes. A new copy is returned on each call, so it is safe
+        to modify.
+        """
+        cache = self._as2_cache
+        if cache is None or cache[0] is None or cache[0] != self._get_as2_cache_key():
+            as2 = self.build_as2()
+            # Get key only after building, building may fill in attributes
+            cache = self._as2_cache = (self._get_as2_cache_key(), as2)
+        return copy_as2(cache[1])
 
     @classmethod
     def from_base(cls, entity):
-        # noinspection PyArgumentList
-        return cls(**get_base_attributes(entity))
+        return convert_entity(entity, cls)
 
     def to_string(self):
         # noinspection PyUnresolvedReferences
@@ -61,21 +136,22 @@ class CleanContentMixin(RawContentMixin):
             return f"#{match.groups()[0]}"
 
         super().post_receive()
-        self.raw_content = re.sub(
+        # Applied only when the content is converted, if that is deferred
+        self.map_attribute("raw_content", lambda raw_content: re.sub(
             r'\[#([\w\-_]+)\]\(http?s://[a-zA-Z0-9/._-]+\)',
             cleaner,
-            self.raw_content,
+            raw_content,
             re.MULTILINE,
-        )
+        ))
 
 
 class ActivitypubAccept(ActivitypubEntityMixin, Accept):
     _type = ActivityType.ACCEPT.value
     object: Dict = None
 
-    def to_as2(self) -> Dict:
+    def build_as2(self) -> Dict:
         as2 = {
-            "@context": CONTEXTS_DEFAULT,
+            "@context": CONTEXTS_ACTIVITY,
             "id": self.activity_id,
             "type": self._type,
             "actor": self.actor_id,
@@ -87,11 +163,15 @@ class ActivitypubAccept(ActivitypubEntityMixin, Accept):
 class ActivitypubNoteMixin(AttachImagesMixin, CleanContentMixin, PublicMixin, ActivitypubEntityMixin):
     _type = ObjectType.NOTE.value
 
-    def add_object_tags(self) -> List[Dict]:
+    def add_object_tags(self, tags: List[str] = None) -> List[Dict]:
         """
         Populate tags to the object.tag list.
+
+        :arg tags: (Optional) Already extracted tags of the entity.
         """
-        tags = []
+        if tags is None:
+            tags = self.tags
+        object_tags = []
         try:
             config = get_configuration()
         except ImportError:
@@ -101,15 +181,15 @@ class ActivitypubNoteMixin(AttachImagesMixin, CleanContentMixin, PublicMixin, Ac
                 tags_path = f"{config['base_url']}{config['tags_path']}"
             else:
                 tags_path = None
-        for tag in self.tags:
+        for tag in tags:
             _tag = {
                 'type': 'Hashtag',
                 'name': f'#{tag}',
             }
             if tags_path:
                 _tag["href"] = tags_path.replace(":tag:", tag)
-            tags.append(_tag)
-        return tags
+            object_tags.append(_tag)
+        return object_tags
 
     def extract_mentions(self):
         """
@@ -128,13 +208,11 @@ class ActivitypubNoteMixin(AttachImagesMixin, CleanContentMixin, PublicMixin, Ac
         super().pre_send()
         self.extract_mentions()
 
-    def to_as2(self) -> Dict:
+    def build_as2(self) -> Dict:
+        tags = self.tags
+        published = self.created_at.isoformat()
         as2 = {
-            "@context": CONTEXTS_DEFAULT + [
-                CONTEXT_HASHTAG,
-                CONTEXT_LD_SIGNATURES,
-                CONTEXT_SENSITIVE,
-            ],
+            "@context": CONTEXTS_NOTE,
             "type": self.activity.value,
             "id": self.activity_id,
             "actor": self.actor_id,
@@ -143,9 +221,9 @@ class ActivitypubNoteMixin(AttachImagesMixin, CleanContentMixin, PublicMixin, Ac
                 "type": self._type,
                 "attributedTo": self.actor_id,
                 "content": self.rendered_content,
-                "published": self.created_at.isoformat(),
+                "published": published,
                 "inReplyTo": None,
-                "sensitive": True if "nsfw" in self.tags else False,
+                "sensitive": True if "nsfw" in tags else False,
                 "summary": None,  # TODO Short text? First sentence? First line?
                 "url": self.url,
                 'source': {
@@ -154,7 +232,7 @@ class ActivitypubNoteMixin(AttachImagesMixin, CleanContentMixin, PublicMixin, Ac
                 },
                 "tag": [],
             },
-            "published": self.created_at.isoformat(),
+            "published": published,
         }
 
         if len(self._children):
@@ -180,13 +258,13 @@ class ActivitypubNoteMixin(AttachImagesMixin, CleanContentMixin, PublicMixin, Ac
                         'name': mention,
                     })
 
-        as2["object"]["tag"].extend(self.add_object_tags())
+        as2["object"]["tag"].extend(self.add_object_tags(tags))
         return as2
 
 
 class ActivitypubComment(ActivitypubNoteMixin, Comment):
-    def to_as2(self) -> Dict:
-        as2 = super().to_as2()
+    def build_as2(self) -> Dict:
+        as2 = super().build_as2()
         as2["object"]["inReplyTo"] = self.target_id
         return as2
 
@@ -196,23 +274,28 @@ class ActivitypubFollow(ActivitypubEntityMixin, Follow):
 
     def post_receive(self) -> None:
         """
-        Post receive hook - send back follow ack.
+        Post receive hook - register sending back follow ack as a side effect.
         """
         super().post_receive()
         if not self.following:
             return
+        self.add_side_effect("send_accept", self.send_accept)
 
+    def send_accept(self) -> None:
+        """
+        Send back follow ack.
+        """
         from federation.utils.activitypub import retrieve_and_parse_profile  # Circulars
         try:
             from federation.utils.django import get_function_from_config
         except ImportError:
-            logger.warning("ActivitypubFollow.post_receive - Unable to send automatic Accept back, only supported on "
+            logger.warning("ActivitypubFollow.send_accept - Unable to send automatic Accept back, only supported on "
                            "Django currently")
             return
         get_private_key_function = get_function_from_config("get_private_key_function")
         key = get_private_key_function(self.target_id)
         if not key:
-            logger.warning("ActivitypubFollow.post_receive - Failed to send automatic Accept back: could not find "
+            logger.warning("ActivitypubFollow.send_accept - Failed to send automatic Accept back: could not find "
                            "profile to sign it with")
             return
         accept = ActivitypubAccept(
@@ -226,7 +309,7 @@ class ActivitypubFollow(ActivitypubEntityMixin, Follow):
         except Exception:
             profile = None
         if not profile:
-            logger.warning("ActivitypubFollow.post_receive - Failed to fetch remote profile for sending back Accept")
+            logger.warning("ActivitypubFollow.send_accept - Failed to fetch remote profile for sending back Accept")
             return
         try:
             handle_send(
@@ -240,12 +323,12 @@ class ActivitypubFollow(ActivitypubEntityMixin, Follow):
                 }],
             )
         except Exception:
-            logger.exception("ActivitypubFollow.post_receive - Failed to send Accept back")
+            logger.exception("ActivitypubFollow.send_accept - Failed to send Accept back")
 
-    def to_as2(self) -> Dict:
+    def build_as2(self) -> Dict:
         if self.following:
             as2 = {
-                "@context": CONTEXTS_DEFAULT,
+                "@context": CONTEXTS_ACTIVITY,
                 "id": self.activity_id,
                 "type": self._type,
                 "actor": self.actor_id,
@@ -253,7 +336,7 @@ class ActivitypubFollow(ActivitypubEntityMixin, Follow):
             }
         else:
             as2 = {
-                "@context": CONTEXTS_DEFAULT,
+                "@context": CONTEXTS_ACTIVITY,
                 "id": self.activity_id,
                 "type": ActivityType.UNDO.value,
                 "actor": self.actor_id,
@@ -270,11 +353,11 @@ class ActivitypubFollow(ActivitypubEntityMixin, Follow):
 class ActivitypubImage(ActivitypubEntityMixin, Image):
     _type = ObjectType.IMAGE.value
 
-    def to_as2(self) -> Dict:
+    def build_as2(self) -> Dict:
         return {
             "type": self._type,
             "url": self.url,
-            "mediaType": self.media_type,
+            "mediaType": self.resolve_media_type(),
             "name": self.name,
             "pyfed:inlineImage": self.inline,
         }
@@ -288,12 +371,9 @@ class ActivitypubProfile(ActivitypubEntityMixin, Profile):
     _type = ActorType.PERSON.value
     public = True
 
-    def to_as2(self) -> Dict:
+    def build_as2(self) -> Dict:
         as2 = {
-            "@context": CONTEXTS_DEFAULT + [
-                CONTEXT_LD_SIGNATURES,
-                CONTEXT_MANUALLY_APPROVES_FOLLOWERS,
-            ],
+            "@context": CONTEXTS_PROFILE,
             "endpoints": {
                 "sharedInbox": self.inboxes["public"],
             },
@@ -319,7 +399,7 @@ class ActivitypubProfile(ActivitypubEntityMixin, Profile):
         if self.image_urls.get('large'):
             try:
                 profile_icon = ActivitypubImage(url=self.image_urls.get('large'))
-                if profile_icon.media_type:
+                if profile_icon.resolve_media_type():
                     as2['icon'] = profile_icon.to_as2()
             except Exception as ex:
                 logger.warning("ActivitypubProfile.to_as2 - failed to set profile icon: %s", ex)
@@ -341,9 +421,9 @@ class ActivitypubRetraction(ActivitypubEntityMixin, Retraction):
             "Share": ActivityType.UNDO.value,
         }.get(self.entity_type)
 
-    def to_as2(self) -> Dict:
+    def build_as2(self) -> Dict:
         as2 = {
-            "@context": CONTEXTS_DEFAULT,
+            "@context": CONTEXTS_ACTIVITY,
             "id": self.activity_id,
             "type": self.resolve_type(),
             "actor": self.actor_id,
@@ -359,9 +439,9 @@ class ActivitypubRetraction(ActivitypubEntityMixin, Retraction):
 class ActivitypubShare(ActivitypubEntityMixin, Share):
     _type = ActivityType.ANNOUNCE.value
 
-    def to_as2(self) -> Dict:
+    def build_as2(self) -> Dict:
         as2 = {
-            "@context": CONTEXTS_DEFAULT,
+            "@context": CONTEXTS_ACTIVITY,
             "id": self.activity_id,
             "type": self._type,
             "actor": self.actor_id,
@@ -1,15 +1,16 @@
 import logging
-from typing import List, Callable, Dict, Union, Optional
-
-from markdownify import markdownify
+from typing import List, Callable, Dict, Union, Optional, Tuple
 
 from federation.entities.activitypub.constants import NAMESPACE_PUBLIC
 from federation.entities.activitypub.entities import (
     ActivitypubFollow, ActivitypubProfile, ActivitypubAccept, ActivitypubPost, ActivitypubComment,
     ActivitypubRetraction, ActivitypubShare, ActivitypubImage)
+from federation.entities.activitypub.receivers import ReceiverType, get_receiver_resolver
 from federation.entities.base import Follow, Profile, Accept, Post, Comment, Retraction, Share, Image
+from federation.entities.lazy import DeferredValue, extract_mentions, pop_deferred_values, resolve_deferred_values
 from federation.entities.mixins import BaseEntity
 from federation.types import UserType, ReceiverVariant
+from federation.utils.conversion import html_to_markdown
 
 logger = logging.getLogger("federation")
 
@@ -48,12 +49,11 @@ UNDO_MAPPINGS = {
 }
 
 
-def element_to_objects(payload: Dict) -> List:
+def get_entity_class(payload: Dict) -> Tuple[Optional[type], bool]:
     """
-    Transform an Element to a list of entities.
+    Get the entity class for a payload and whether the payload is an object.
     """
     cls = None
-    entities = []
     is_object = True if payload.get('type') in OBJECTS else False
     if payload.get('type') == "Delete":
         cls = ActivitypubRetraction
@@ -67,24 +67,52 @@ def element_to_objects(payload: Dict) -> List:
             cls = MAPPINGS.get(payload["object"]["type"])
     else:
         cls = MAPPINGS.get(payload.get('type'))
+    return cls, is_object
+
+
+def element_to_objects(payload: Dict, lazy: bool = False) -> List:
+    """
+    Transform an Element to a list of entities.
+
+    If ``lazy`` is given, the receivers, mentions, converted content and attachments of the entity are extracted
+    only when first accessed. See ``federation.entities.lazy``.
+    """
+    entities = []
+    cls, is_object = get_entity_class(payload)
     if not cls:
         return []
 
-    transformed = transform_attributes(payload, cls, is_object=is_object)
+    transformed = transform_attributes(payload, cls, is_object=is_object, lazy=lazy)
+    deferred = pop_deferred_values(transformed)
     entity = cls(**transformed)
+    for name, value in deferred.items():
+        entity.defer(name, lambda _entity, value=value: value.compute(), value.source)
     # Add protocol name
     entity._source_protocol = "activitypub"
     # Save element object to entity for possible later use
     entity._source_object = payload
     # Extract receivers
-    entity._receivers = extract_receivers(payload)
+    if lazy:
+        entity.defer("_receivers", lambda _entity: extract_receivers(payload))
+    else:
+        entity._receivers = extract_receivers(payload)
     # Extract children
     if payload.get("object") and isinstance(payload.get("object"), dict):
         # Try object if exists
-        entity._children = extract_attachments(payload.get("object"))
+        attachments_payload = payload.get("object")
     else:
         # Try payload itself
-        entity._children = extract_attachments(payload)
+        attachments_payload = payload
+    if lazy:
+        # Validation checks the classes of the children only
+        has_images = any(_is_image_attachment(item) for item in attachments_payload.get("attachment", []))
+        entity.defer(
+            "_children",
+            lambda _entity: extract_attachments(attachments_payload),
+            [ActivitypubImage] if has_images else [],
+        )
+    else:
+        entity._children = extract_attachments(attachments_payload)
 
     if hasattr(entity, "post_receive"):
         entity.post_receive()
@@ -98,13 +126,24 @@ def element_to_objects(payload: Dict) -> List:
         return []
     # Extract mentions
     if hasattr(entity, "extract_mentions"):
-        entity.extract_mentions()
+        if lazy:
+            entity.defer("_mentions", extract_mentions)
+        else:
+            entity.extract_mentions()
 
     entities.append(entity)
 
     return entities
 
 
+def _is_image_attachment(item: Dict) -> bool:
+    # noinspection PyProtectedMember
+    if item.get("type") in ("Document", "Image") and item.get("mediaType") in Image._valid_media_types:
+        # Skip images indicated to be inline in content and source already
+        return not item.get('pyfed:inlineImage', False)
+    return False
+
+
 def extract_attachments(payload: Dict) -> List[Image]:
     """
     Extract images from attachments.
@@ -113,11 +152,7 @@ def extract_attachments(payload: Dict) -> List[Image]:
     """
     attachments = []
     for item in payload.get('attachment', []):
-        # noinspection PyProtectedMember
-        if item.get("type") in ("Document", "Image") and item.get("mediaType") in Image._valid_media_types:
-            if item.get('pyfed:inlineImage', False):
-                # Skip this image as it's indicated to be inline in content and source already
-                continue
+        if _is_image_attachment(item):
             attachments.append(
                 ActivitypubImage(
                     url=item.get('url'),
@@ -128,26 +163,37 @@ def extract_attachments(payload: Dict) -> List[Image]:
     return attachments
 
 
-def extract_receiver(payload: Dict, receiver: str) -> Optional[UserType]:
+def extract_receiver(
+        payload: Dict, receiver: str, classifications: Dict[str, Optional[Tuple[ReceiverType, str]]] = None,
+) -> Optional[UserType]:
     """
     Transform a single receiver ID to a UserType.
+
+    The receiver is classified with the receiver resolver, see ``federation.entities.activitypub.receivers``.
+    Collections other than followers collections are skipped.
+
+    :arg classifications: (Optional) Receivers of the payload classified with ``ReceiverResolver.resolve_all``.
     """
     actor = payload.get("actor") or payload.get("attributedTo") or ""
     if receiver == NAMESPACE_PUBLIC:
         # Ignore since we already store "public" as a boolean on the entity
         return
-    # Check for this being a list reference to followers of an actor?
-    # TODO: terrible hack! the way some platforms deliver to sharedInbox using just
-    #   the followers collection as a target is annoying to us since we would have to
-    #   store the followers collection references on application side, which we don't
-    #   want to do since it would make application development another step more complex.
-    #   So for now we're going to do a terrible assumption that
-    #     1) if "followers" in ID and
-    #     2) if ID starts with actor ID
-    #     then; assume this is the followers collection of said actor ID.
-    #   When we have a caching system, just fetch each receiver and check what it is.
-    #   Without caching this would be too expensive to do.
-    elif receiver.find("followers") > -1 and receiver.startswith(actor):
+    if classifications is not None and receiver in classifications:
+        classification = classifications[receiver]
+    else:
+        resolver = get_receiver_resolver()
+        classification = resolver.resolve_all([receiver], actor)[receiver] if resolver is not None else None
+    if classification:
+        receiver_type, owner = classification
+        if receiver_type == ReceiverType.FOLLOWERS:
+            return UserType(id=owner, receiver_variant=ReceiverVariant.FOLLOWERS)
+        if receiver_type == ReceiverType.ACTOR:
+            return UserType(id=receiver, receiver_variant=ReceiverVariant.ACTOR)
+        return
+    # The receiver could not be classified. Guess that it is the followers collection of the actor if
+    #   1) "followers" is in the ID and
+    #   2) the ID starts with the actor ID
+    if receiver.find("followers") > -1 and receiver.startswith(actor):
         return UserType(id=actor, receiver_variant=ReceiverVariant.FOLLOWERS)
     # Assume actor ID
     return UserType(id=receiver, receiver_variant=ReceiverVariant.ACTOR)
@@ -157,18 +203,24 @@ def extract_receivers(payload: Dict) -> List[UserType]:
     """
     Exctract receivers from a payload.
     """
-    receivers = []
+    ids = []
     for key in ("to", "cc"):
         receiver = payload.get(key)
         if isinstance(receiver, list):
-            for item in receiver:
-                extracted = extract_receiver(payload, item)
-                if extracted:
-                    receivers.append(extracted)
+            ids.extend(item for item in receiver if isinstance(item, str))
         elif isinstance(receiver, str):
-            extracted = extract_receiver(payload, receiver)
-            if extracted:
-                receivers.append(extracted)
+            ids.append(receiver)
+    resolver = get_receiver_resolver()
+    classifications = None
+    if resolver is not None:
+        actor = payload.get("actor") or payload.get("attributedTo") or ""
+        # Classify all receivers at once, so the payload as a whole stays within the fetch limits of the resolver
+        classifications = resolver.resolve_all([id for id in ids if id != NAMESPACE_PUBLIC], actor)
+    receivers = []
+    for id in ids:
+        extracted = extract_receiver(payload, id, classifications)
+        if extracted:
+            receivers.append(extracted)
     return receivers
 
 
@@ -212,15 +264,7 @@ def get_outbound_entity(entity: BaseEntity, private_key):
         outbound = ActivitypubShare.from_base(entity)
     if not outbound:
         raise ValueError("Don't know how to convert this base entity to ActivityPub protocol entities.")
-    # TODO LDS signing
-    # if isinstance(outbound, DiasporaRelayableMixin) and not outbound.signature:
-    #     # Sign by author if not signed yet. We don't want to overwrite any existing signature in the case
-    #     # that this is being sent by the parent author
-    #     outbound.sign(private_key)
-    #     # If missing, also add same signature to `parent_author_signature`. This is required at the moment
-    #     # in all situations but is apparently being removed.
-    #     # TODO: remove this once Diaspora removes the extra signature
-    #     outbound.parent_signature = outbound.signature
+    # LD signatures are added by `handle_send` to public payloads, once the final addressing is known
     if hasattr(outbound, "pre_send"):
         outbound.pre_send()
     return outbound
@@ -228,12 +272,180 @@ def get_outbound_entity(entity: BaseEntity, private_key):
 
 def message_to_objects(
         message: Dict, sender: str, sender_key_fetcher: Callable[[str], str] = None, user: UserType = None,
+        lazy: bool = False,
 ) -> List:
     """
     Takes in a message extracted by a protocol and maps it to entities.
+
+    If ``lazy`` is given, derived values of the entities are computed only when first accessed.
     """
     # We only really expect one element here for ActivityPub.
-    return element_to_objects(message)
+    return element_to_objects(message, lazy=lazy)
+
+
+def _rename(name: str) -> Callable:
+    def handler(key, value, transformed, cls, payload):
+        transformed[name] = value
+    return handler
+
+
+def _map_default(key, value, transformed, cls, payload):
+    transformed[key] = value
+
+
+def _map_retraction_target(key, value, transformed, cls, payload):
+    transformed["target_id"] = value
+    transformed["entity_type"] = "Object"
+
+
+def _map_content(key, value, transformed, cls, payload):
+    # Converting HTML is deferred, validation checks the HTML content instead
+    content = payload.get('content').strip()
+    if payload.get('source') and isinstance(payload.get("source"), dict):
+        transformed["_rendered_content"] = content
+        if payload.get('source').get('mediaType') == "text/markdown":
+            transformed["_media_type"] = "text/markdown"
+            transformed["raw_content"] = payload.get('source').get('content').strip()
+        else:
+            transformed["raw_content"] = DeferredValue(lambda: html_to_markdown(content), content)
+            transformed["_media_type"] = payload.get('source').get('mediaType')
+    else:
+        transformed["raw_content"] = DeferredValue(lambda: html_to_markdown(content).strip(), content)
+        # Assume HTML by convention
+        transformed["_rendered_content"] = payload.get('content').strip()
+        transformed["_media_type"] = "text/html"
+
+
+def _map_source(key, value, transformed, cls, payload):
+    # Content and source are mapped together, only once
+    if "content" not in payload:
+        _map_content(key, value, transformed, cls, payload)
+
+
+def _map_inboxes(key, value, transformed, cls, payload):
+    if not isinstance(value, dict):
+        transformed[key] = value
+        return
+    if "inboxes" not in transformed:
+        transformed["inboxes"] = {"private": None, "public": None}
+    if value.get('sharedInbox'):
+        transformed["endpoints"]["public"] = value.get("sharedInbox")
+
+
+def _map_icon(key, value, transformed, cls, payload):
+    # TODO maybe we should ditch these size constants and instead have a more flexible dict for images
+    # so based on protocol there would either be one url or many by size name
+    if isinstance(value, dict):
+        transformed["image_urls"] = {
+            "small": value['url'],
+            "medium": value['url'],
+            "large": value['url'],
+        }
+    else:
+        transformed["image_urls"] = {
+            "small": value,
+            "medium": value,
+            "large": value,
+        }
+
+
+def _map_inbox(key, value, transformed, cls, payload):
+    if "inboxes" not in transformed:
+        transformed["inboxes"] = {"private": None, "public": None}
+    transformed["inboxes"]["private"] = value
+    if not transformed["inboxes"]["public"]:
+        transformed["inboxes"]["public"] = value
+
+
+def _map_name(key, value, transformed, cls, payload):
+    transformed["name"] = value or ""
+
+
+def _map_object(key, value, transformed, cls, payload):
+    if isinstance(value, dict):
+        # Deferred values are resolved by the outer call, if needed
+        transform_attributes(value, cls, transformed, is_object=True, lazy=True)
+    else:
+        transformed["target_id"] = value
+
+
+def _object_target_mapper(object_key: str) -> Callable:
+    def handler(key, value, transformed, cls, payload):
+        transformed["target_id"] = value.get(object_key) if isinstance(value, dict) else value
+    return handler
+
+
+def _map_public_key(key, value, transformed, cls, payload):
+    transformed["public_key"] = value.get('publicKeyPem', '')
+
+
+def _map_audience(key, value, transformed, cls, payload):
+    if isinstance(value, list) and NAMESPACE_PUBLIC in value:
+        transformed["public"] = True
+    elif value == NAMESPACE_PUBLIC:
+        transformed["public"] = True
+
+
+def _map_type(key, value, transformed, cls, payload):
+    if value == "Undo":
+        transformed["following"] = False
+
+
+def build_attribute_table(cls, is_object: bool) -> Dict[str, Callable]:
+    """
+    Build the table of payload key handlers for an entity class.
+
+    Handlers are called with the key, the value, the attributes transformed so far, the entity class and the
+    payload. Keys not in the table are copied as is.
+
+    :arg cls: Entity class.
+    :arg is_object: Whether the payload is the object of an activity, rather than the activity.
+    """
+    table = {
+        "actor": _rename("actor_id"),
+        "content": _map_content,
+        "icon": _map_icon,
+        "inbox": _map_inbox,
+        "inboxes": _map_inboxes,
+        "inReplyTo": _rename("target_id"),
+        "name": _map_name,
+        "preferredUsername": _rename("username"),
+        "publicKey": _map_public_key,
+        "source": _map_source,
+        "to": _map_audience,
+        "cc": _map_audience,
+        "type": _map_type,
+    }
+    if is_object:
+        table["id"] = _map_retraction_target if cls == ActivitypubRetraction else _rename("id")
+        table["attributedTo"] = _rename("actor_id")
+    else:
+        table["id"] = _rename("id") if cls in (ActivitypubProfile, ActivitypubShare) else _rename("activity_id")
+        if cls == ActivitypubAccept:
+            table["object"] = _object_target_mapper("id")
+        elif cls == ActivitypubFollow:
+            table["object"] = _object_target_mapper("object")
+        else:
+            table["object"] = _map_object
+    if cls == ActivitypubProfile:
+        table["summary"] = _rename("raw_content")
+    return table
+
+
+# Key handler tables per entity class and whether the payload is an object, see `build_attribute_table`
+ATTRIBUTE_TABLES = {
+    (cls, is_object): build_attribute_table(cls, is_object)
+    # Comments are not in the mappings, `get_entity_class` picks them by `inReplyTo`
+    for cls in set(MAPPINGS.values()) | set(UNDO_MAPPINGS.values()) | {ActivitypubComment}
+    for is_object in (False, True)
+}
+
+
+def get_attribute_table(cls, is_object: bool) -> Dict[str, Callable]:
+    table = ATTRIBUTE_TABLES.get((cls, is_object))
+    if table is None:
+        table = ATTRIBUTE_TABLES[(cls, is_object)] = build_attribute_table(cls, is_object)
+    return table
 
 
 def transform_attribute(
@@ -241,96 +453,24 @@ def transform_attribute(
 ) -> None:
     if value is None:
         value = ""
-    if key == "id":
-        if is_object:
-            if cls == ActivitypubRetraction:
-                transformed["target_id"] = value
-                transformed["entity_type"] = "Object"
-            else:
-                transformed["id"] = value
-        elif cls in (ActivitypubProfile, ActivitypubShare):
-            transformed["id"] = value
-        else:
-            transformed["activity_id"] = value
-    elif key == "actor":
-        transformed["actor_id"] = value
-    elif key == "attributedTo" and is_object:
-        transformed["actor_id"] = value
-    elif key in ("content", "source"):
-        if payload.get('source') and isinstance(payload.get("source"), dict):
-            transformed["_rendered_content"] = payload.get('content').strip()
-            if payload.get('source').get('mediaType') == "text/markdown":
-                transformed["_media_type"] = "text/markdown"
-                transformed["raw_content"] = payload.get('source').get('content').strip()
-            else:
-                transformed["raw_content"] = markdownify(payload.get('content').strip())
-                transformed["_media_type"] = payload.get('source').get('mediaType')
-        else:
-            transformed["raw_content"] = markdownify(payload.get('content').strip()).strip()
-            # Assume HTML by convention
-            transformed["_rendered_content"] = payload.get('content').strip()
-            transformed["_media_type"] = "text/html"
-    elif key == "inboxes" and isinstance(value, dict):
-        if "inboxes" not in transformed:
-            transformed["inboxes"] = {"private": None, "public": None}
-        if value.get('sharedInbox'):
-            transformed["endpoints"]["public"] = value.get("sharedInbox")
-    elif key == "icon":
-        # TODO maybe we should ditch these size constants and instead have a more flexible dict for images
-        # so based on protocol there would either be one url or many by size name
-        if isinstance(value, dict):
-            transformed["image_urls"] = {
-                "small": value['url'],
-                "medium": value['url'],
-                "large": value['url'],
-            }
-        else:
-            transformed["image_urls"] = {
-                "small": value,
-                "medium": value,
-                "large": value,
-            }
-    elif key == "inbox":
-        if "inboxes" not in transformed:
-            transformed["inboxes"] = {"private": None, "public": None}
-        transformed["inboxes"]["private"] = value
-        if not transformed["inboxes"]["public"]:
-            transformed["inboxes"]["public"] = value
-    elif key == "inReplyTo":
-        transformed["target_id"] = value
-    elif key == "name":
-        transformed["name"] = value or ""
-    elif key == "object" and not is_object:
-        if isinstance(value, dict):
-            if cls == ActivitypubAccept:
-                transformed["target_id"] = value.get("id")
-            elif cls == ActivitypubFollow:
-                transformed["target_id"] = value.get("object")
-            else:
-                transform_attributes(value, cls, transformed, is_object=True)
-        else:
-            transformed["target_id"] = value
-    elif key == "preferredUsername":
-        transformed["username"] = value
-    elif key == "publicKey":
-        transformed["public_key"] = value.get('publicKeyPem', '')
-    elif key == "summary" and cls == ActivitypubProfile:
-        transformed["raw_content"] = value
-    elif key in ("to", "cc"):
-        if isinstance(value, list) and NAMESPACE_PUBLIC in value:
-            transformed["public"] = True
-        elif value == NAMESPACE_PUBLIC:
-            transformed["public"] = True
-    elif key == "type":
-        if value == "Undo":
-            transformed["following"] = False
-    else:
-        transformed[key] = value
+    get_attribute_table(cls, is_object).get(key, _map_default)(key, value, transformed, cls, payload)
+
 
+def transform_attributes(
+        payload: Dict, cls, transformed: Dict = None, is_object: bool = False, lazy: bool = False,
+) -> Dict:
+    """
+    Transform payload attributes to entity attributes.
 
-def transform_attributes(payload: Dict, cls, transformed: Dict = None, is_object: bool = False) -> Dict:
+    :arg lazy: Leave values that take work to compute as ``federation.entities.lazy.DeferredValue`` instances.
+    """
     if not transformed:
         transformed = {}
+    table = get_attribute_table(cls, is_object)
     for key, value in payload.items():
-        transform_attribute(key, value, transformed, cls, is_object, payload)
+        if value is None:
+            value = ""
+        table.get(key, _map_default)(key, value, transformed, cls, payload)
+    if not lazy:
+        resolve_deferred_values(transformed)
     return transformed
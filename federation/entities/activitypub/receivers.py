@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger("federation")
+
+ACTOR_TYPES = frozenset(("Application", "Group", "Organization", "Person", "Service"))
+COLLECTION_TYPES = frozenset(("Collection", "CollectionPage", "OrderedCollection", "OrderedCollectionPage"))
+
+# How long to remember a receiver classification, in seconds
+RECEIVER_TTL = 24 * 60 * 60
+# How long to remember that a receiver could not be classified, in seconds
+RECEIVER_FAILURE_TTL = 5 * 60
+# How many receivers to remember
+RECEIVER_CACHE_SIZE = 10000
+# Maximum number of documents fetched to classify the receivers of one payload
+MAX_RECEIVER_FETCHES = 3
+
+
+class ReceiverType(Enum):
+    ACTOR = "actor"
+    # Followers collection of an actor
+    FOLLOWERS = "followers"
+    # Any other collection
+    COLLECTION = "collection"
+
+
+def _fetch_document(id: str) -> Optional[Dict]:
+    """Fetch a remote ActivityPub document, see ``federation.utils.activitypub.fetch_activitypub_document``."""
+    from federation.utils.activitypub import fetch_activitypub_document  # Circulars
+    return fetch_activitypub_document(id)
+
+
+class ReceiverResolver:
+    """
+    Classifies receiver ID's of payloads, caching the results.
+
+    Unknown receivers are fetched once and classified as an actor, the followers collection of an actor or some
+    other collection. The results are kept for ``ttl`` seconds, so classifying receivers of later payloads is a
+    dictionary lookup. Receivers that could not be classified are remembered for ``failure_ttl`` seconds.
+
+    A payload can't make the resolver fetch documents from other servers, or many documents. Only receivers on the
+    host of the payload actor are fetched, and at most ``max_fetches`` documents per payload.
+
+    :arg ttl: Seconds to remember a classification.
+    :arg failure_ttl: Seconds to remember a failed classification.
+    :arg max_size: Maximum number of receivers to remember.
+    :arg fetcher: Function that fetches a remote document by ID and returns it as a dictionary, or ``None``.
+    :arg max_fetches: Maximum number of documents to fetch for the receivers of one payload.
+    """
+    def __init__(
+            self, ttl: int = RECEIVER_TTL, failure_ttl: int = RECEIVER_FAILURE_TTL,
+            max_size: int = RECEIVER_CACHE_SIZE, fetcher: Callable[[str], Optional[Dict]] = _fetch_document,
+            max_fetches: int = MAX_RECEIVER_FETCHES,
+    ):
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_size = max_size
+        self.fetcher = fetcher
+        self.max_fetches = max_fetches
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, id: str) -> Tuple[bool, Optional[Tuple[ReceiverType, str]], Optional[str]]:
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is None:
+                return False, None, None
+            expires, classification, followers = entry
+            if expires < time.monotonic():
+                del self._entries[id]
+                return False, None, None
+            self._entries.move_to_end(id)
+            return True, classification, followers
+
+    def get(self, id: str) -> Optional[Tuple[ReceiverType, str]]:
+        """
+        Get the cached classification of a receiver without fetching anything.
+
+        :returns: Tuple of receiver type and the ID of the actor the receiver belongs to, or ``None``.
+        """
+        return self._lookup(id)[1]
+
+    def set(
+            self, id: str, receiver_type: Optional[ReceiverType], owner: str = None, ttl: int = None,
+            followers: str = None,
+    ) -> None:
+        """
+        Store the classification of a receiver.
+
+        :arg id: Receiver ID.
+        :arg receiver_type: Type of the receiver. ``None`` marks the receiver as not classifiable.
+        :arg owner: ID of the actor the receiver belongs to. Defaults to the receiver ID.
+        :arg ttl: Seconds to remember the classification, defaults to ``ttl`` or ``failure_ttl`` of the resolver.
+        :arg followers: (Optional) ID of the followers collection of an actor.
+        """
+        if ttl is None:
+            ttl = self.ttl if receiver_type else self.failure_ttl
+        classification = (receiver_type, owner or id) if receiver_type else None
+        with self._lock:
+            self._entries[id] = (time.monotonic() + ttl, classification, followers)
+            self._entries.move_to_end(id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _classify_document(self, id: str, document: Optional[Dict]) -> None:
+        if not document:
+            self.set(id, None)
+            return
+        document_type = document.get("type")
+        if document_type in ACTOR_TYPES:
+            # The followers collection is kept on the entry of the actor, so it can't be evicted on its own
+            followers = document.get("followers")
+            self.set(id, ReceiverType.ACTOR, followers=followers if isinstance(followers, str) else None)
+        elif document_type in COLLECTION_TYPES:
+            self.set(id, ReceiverType.COLLECTION)
+        else:
+            self.set(id, None)
+
+    def resolve_all(self, ids: Iterable[str], actor: str) -> Dict[str, Optional[Tuple[ReceiverType, str]]]:
+        """
+        Classify the receivers of a payload, fetching the ones that are not known yet.
+
+        Only receivers on the host of the actor are fetched, and at most ``max_fetches`` documents. The actor
+        document tells which collection its followers collection is, so it is fetched first if it is not known.
+        Receivers that are not fetched are not remembered as failed.
+
+        :arg ids: Receiver ID's.
+        :arg actor: Actor of the payload.
+        :returns: Dictionary of receiver ID to a tuple of receiver type and the ID of the actor the receiver belongs
+            to, or ``None`` if the receiver could not be classified.
+        """
+        host = urlparse(actor).netloc if actor else ""
+        fetches = 0
+        results = {}
+        for id in ids:
+            actor_found, _actor_classification, followers = self._lookup(actor) if actor else (False, None, None)
+            if actor_found and followers == id:
+                results[id] = (ReceiverType.FOLLOWERS, actor)
+                continue
+            found, classification, _followers = self._lookup(id)
+            same_host = host and urlparse(id).netloc == host
+            # Without the actor it can't be told whether a collection is its followers collection
+            needs_actor = same_host and actor != id and not actor_found and (
+                not found or (classification and classification[0] == ReceiverType.COLLECTION)
+            )
+            if needs_actor and fetches < self.max_fetches:
+                self._classify_document(actor, self.fetcher(actor))
+                fetches += 1
+                if self._lookup(actor)[2] == id:
+                    results[id] = (ReceiverType.FOLLOWERS, actor)
+                    continue
+            if not found and same_host and fetches < self.max_fetches:
+                self._classify_document(id, self.fetcher(id))
+                fetches += 1
+                classification = self.get(id)
+            results[id] = classification
+        return results
+
+    def resolve(self, id: str, actor: str = None) -> Optional[Tuple[ReceiverType, str]]:
+        """
+        Classify a receiver, fetching it if it is not known yet.
+
+        :arg id: Receiver ID.
+        :arg actor: (Optional) Actor of the payload, see ``resolve_all``. Without an actor the receiver itself is
+            fetched if needed.
+        :returns: Tuple of receiver type and the ID of the actor the receiver belongs to, or ``None`` if the receiver
+            could not be classified.
+        """
+        return self.resolve_all([id], actor or id)[id]
+
+
+_resolver = None
+
+
+def get_receiver_resolver() -> Optional[ReceiverResolver]:
+    """Get the receiver resolver in use. ``None`` if receivers are not resolved."""
+    return _resolver
+
+
+def set_receiver_resolver(resolver: Optional[ReceiverResolver]) -> None:
+    """
+    Set the receiver resolver to use.
+
+    Receivers are not resolved by default. Followers collections are then guessed from the receiver ID. Pass
+    ``None`` to stop resolving receivers.
+    """
+    global _resolver
+    _resolver = resolver
@@ -1,3 +1,4 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Dict, Tuple
 
 from dirty_validators.basic import Email
@@ -6,7 +7,7 @@ from federation.entities.activitypub.enums import ActivityType
 from federation.entities.mixins import (
     PublicMixin, TargetIDMixin, ParticipationMixin, CreatedAtMixin, RawContentMixin, OptionalRawContentMixin,
     EntityTypeMixin, ProviderDisplayNameMixin, RootTargetIDMixin, BaseEntity)
-from federation.utils.network import fetch_content_type
+from federation.utils.media import PROBE_TIMEOUT, guess_media_type, probe_media_type
 
 
 class Accept(CreatedAtMixin, TargetIDMixin, BaseEntity):
@@ -34,6 +35,8 @@ class Image(OptionalRawContentMixin, CreatedAtMixin, BaseEntity):
         "image/gif",
     )
 
+    _media_type_probe = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._required += ["url"]
@@ -41,13 +44,33 @@ class Image(OptionalRawContentMixin, CreatedAtMixin, BaseEntity):
         self._required.remove("actor_id")
         if self.url and not self.media_type:
             self.media_type = self.get_media_type()
+            if not self.media_type:
+                # Probe the remote server in the background, see `resolve_media_type`
+                self._media_type_probe = probe_media_type(self.url)
 
     def get_media_type(self) -> str:
-        media_type = fetch_content_type(self.url)
+        """Infer the media type from the url. Does not do network access."""
+        media_type = guess_media_type(self.url)
         if media_type in self._valid_media_types:
             return media_type
         return ""
 
+    def resolve_media_type(self) -> str:
+        """
+        Fill the media type from a background probe of the url, if one is running.
+
+        Waits up to ``PROBE_TIMEOUT`` seconds for the probe to finish. Called before the image is serialized.
+        """
+        if self._media_type_probe is not None:
+            try:
+                media_type = self._media_type_probe.result(timeout=PROBE_TIMEOUT)
+            except FutureTimeoutError:
+                media_type = ""
+            self._media_type_probe = None
+            if not self.media_type and media_type in self._valid_media_types:
+                self.media_type = media_type
+        return self.media_type
+
 
 class Comment(RawContentMixin, ParticipationMixin, CreatedAtMixin, RootTargetIDMixin, BaseEntity):
     """Represents a comment, linked to another object."""
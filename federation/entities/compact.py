@@ -0,0 +1,119 @@
+"""
+Compact entities for holding large numbers of entities in memory, for example in batch processing or backfills.
+
+``compact`` trims an entity in place:
+
+* Deferred values, see ``federation.entities.lazy``, are computed.
+* The source payload is dropped, unless ``keep_source`` is given.
+* Cached values, like the cached AS2 representation, are dropped.
+* The ``_required`` list is replaced with a tuple shared by all entities with the same required attributes.
+* Empty containers are replaced with shared immutable empty ones, other containers with immutable copies.
+* Values repeated across many entities, like ``actor_id``, are interned.
+
+The containers of a compact entity cannot be modified. ``expand`` makes them mutable again, which is needed before
+for example ``pre_send`` or ``post_receive`` is called on the entity.
+"""
+import sys
+import threading
+from typing import Dict, List, Tuple
+
+from federation.entities.mixins import BaseEntity
+
+# List attributes of entities
+LIST_ATTRIBUTES = ("_children", "_receivers", "_side_effects")
+# Set attributes of entities
+SET_ATTRIBUTES = ("_mentions",)
+# Attributes holding the source payload, in any form
+SOURCE_ATTRIBUTES = ("_source_bytes", "_source_element", "_source_object")
+# Attributes holding cached values that can be computed again
+CACHE_ATTRIBUTES = ("_as2_cache", "_content_cache")
+# String attributes with values that repeat across many entities
+INTERNED_ATTRIBUTES = (
+    "_media_type", "_source_protocol", "actor_id", "base_url", "handle", "provider_display_name",
+    "root_target_id", "target_id",
+)
+
+EMPTY_TUPLE = ()
+EMPTY_FROZENSET = frozenset()
+
+_required: Dict[Tuple, Tuple] = {}
+_lock = threading.Lock()
+
+
+def _shared_required(required) -> Tuple:
+    required = tuple(required)
+    shared = _required.get(required)
+    if shared is None:
+        with _lock:
+            shared = _required.setdefault(required, required)
+    return shared
+
+
+def _set(entity: BaseEntity, name: str, value) -> None:
+    # Bypass `__setattr__` hooks, none of these change the entity content
+    object.__setattr__(entity, name, value)
+
+
+def compact(entity: BaseEntity, keep_source: bool = False) -> BaseEntity:
+    """
+    Make an entity and its children compact, in place.
+
+    :arg entity: Entity to make compact.
+    :arg keep_source: Keep the source payload. It is needed for example to relay Diaspora relayables, which must be
+        signed using the original payload.
+    :returns: The same entity.
+    """
+    # Deferred values may need the source, and compact values can't be computed later
+    entity.resolve_deferred()
+    if not keep_source and any(entity.__dict__.get(name) is not None for name in SOURCE_ATTRIBUTES):
+        # Through the setter, which drops any parsed form of the source too
+        entity._source_object = None
+    for name in CACHE_ATTRIBUTES:
+        if entity.__dict__.get(name) is not None:
+            _set(entity, name, None)
+    if entity.__dict__.get("_required") is not None:
+        _set(entity, "_required", _shared_required(entity._required))
+    for name in LIST_ATTRIBUTES:
+        value = entity.__dict__.get(name)
+        if value is not None:
+            _set(entity, name, tuple(value) if value else EMPTY_TUPLE)
+    for name in SET_ATTRIBUTES:
+        value = entity.__dict__.get(name)
+        if value is not None:
+            _set(entity, name, frozenset(value) if value else EMPTY_FROZENSET)
+    for name in INTERNED_ATTRIBUTES:
+        value = entity.__dict__.get(name)
+        if type(value) is str:
+            _set(entity, name, sys.intern(value))
+    for child in entity._children or ():
+        compact(child, keep_source=keep_source)
+    return entity
+
+
+def compact_entities(entities: List[BaseEntity], keep_source: bool = False) -> List[BaseEntity]:
+    """Make a list of entities compact in place. See ``compact``."""
+    for entity in entities:
+        compact(entity, keep_source=keep_source)
+    return entities
+
+
+def expand(entity: BaseEntity) -> BaseEntity:
+    """Make the containers of a compact entity and its children mutable again, in place."""
+    if isinstance(entity.__dict__.get("_required"), tuple):
+        _set(entity, "_required", list(entity._required))
+    for name in LIST_ATTRIBUTES:
+        value = entity.__dict__.get(name)
+        if isinstance(value, tuple):
+            _set(entity, name, list(value))
+    for name in SET_ATTRIBUTES:
+        value = entity.__dict__.get(name)
+        if isinstance(value, frozenset):
+            _set(entity, name, set(value))
+    for child in entity._children or ():
+        expand(child)
+    return entity
+
+
+def is_compact(entity: BaseEntity) -> bool:
+    """Check whether an entity has been made compact."""
+    return isinstance(entity.__dict__.get("_required"), tuple)
@@ -1,6 +1,7 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Callable, List
+from typing import Callable, List, Dict, Iterable, Optional, Tuple
 
 # noinspection PyPackageRequirements
 from Crypto.PublicKey.RSA import RsaKey
@@ -12,13 +13,18 @@ from federation.entities.diaspora.entities import (
     DiasporaProfile, DiasporaReshare, DiasporaRetraction,
     DiasporaImage)
 from federation.entities.diaspora.mixins import DiasporaRelayableMixin
+from federation.entities.lazy import extract_mentions
 from federation.entities.mixins import BaseEntity
+from federation.protocols.diaspora.parsing import fromstring
 from federation.protocols.diaspora.signatures import get_element_child_info
 from federation.types import UserType, ReceiverVariant
 from federation.utils.diaspora import retrieve_and_parse_profile
 
 logger = logging.getLogger("federation")
 
+# Maximum number of sender keys to resolve concurrently
+MAX_KEY_RESOLVER_WORKERS = 8
+
 MAPPINGS = {
     "status_message": DiasporaPost,
     "comment": DiasporaComment,
@@ -74,20 +80,43 @@ def check_sender_and_entity_handle_match(sender_handle, entity_handle):
     return True
 
 
-def element_to_objects(
-        element: etree.ElementTree, sender: str, sender_key_fetcher: Callable[[str], str] = None, user: UserType = None,
-) -> List:
-    """Transform an Element to a list of entities recursively.
+def resolve_sender_keys(handles: Iterable[str], sender_key_fetcher: Callable[[str], str] = None) -> Dict[str, str]:
+    """Resolve the public keys of a set of senders.
 
-    Possible child entities are added to each entity ``_children`` list.
+    Each handle is resolved only once. A given ``sender_key_fetcher`` is called in the calling thread, since it
+    may for example use a database connection of the thread. Keys fetched over the network are fetched
+    concurrently if there are several handles.
+
+    :param handles: Sender handles to resolve keys for.
+    :param sender_key_fetcher: Function to fetch sender public key. If not given, the key is fetched over the network
+        from the sender profile.
+    :returns: Dictionary of handle to public key. Handles which could not be resolved are not included.
+    """
+    def fetch(handle):
+        profile = retrieve_and_parse_profile(handle)
+        if profile:
+            return profile.public_key
+
+    handles = list(dict.fromkeys(handle for handle in handles if handle))
+    if sender_key_fetcher:
+        keys = {handle: sender_key_fetcher(handle) for handle in handles}
+    elif len(handles) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(handles), MAX_KEY_RESOLVER_WORKERS)) as executor:
+            keys = dict(zip(handles, executor.map(fetch, handles)))
+    else:
+        keys = {handle: fetch(handle) for handle in handles}
+    return {handle: key for handle, key in keys.items() if key}
 
-    Optional parameter ``sender_key_fetcher`` can be a function to fetch sender public key.
-    If not given, key will always be fetched over the network. The function should take sender as the only parameter.
+
+def _build_entity_tree(element: etree.ElementTree, sender: str, user: UserType = None) -> Optional[Tuple]:
+    """Transform an element and its child elements to entities without validating them.
+
+    :returns: Tuple of entity, attributes, transformed attributes and list of child tuples. ``None`` if the
+        element doesn't map to an entity or the sender is not the author of a non-relayable entity.
     """
-    entities = []
     cls = MAPPINGS.get(element.tag)
     if not cls:
-        return []
+        return None
 
     attrs = xml_children_as_dict(element)
     transformed = transform_attributes(attrs, cls)
@@ -96,8 +125,8 @@ def element_to_objects(
     entity = cls(**transformed)
     # Add protocol name
     entity._source_protocol = "diaspora"
-    # Save element object to entity for possible later use
-    entity._source_object = etree.tostring(element)
+    # Save element object to entity for possible later use. It is serialized to `_source_object` only if accessed
+    entity._source_element = element
 
     # Save receivers on the entity
     if user:
@@ -108,18 +137,30 @@ def element_to_objects(
         entity._receivers = [UserType(id=sender, receiver_variant=ReceiverVariant.FOLLOWERS)]
 
     if issubclass(cls, DiasporaRelayableMixin):
-        # If relayable, fetch sender key for validation
         entity._xml_tags = get_element_child_info(element, "tag")
-        if sender_key_fetcher:
-            entity._sender_key = sender_key_fetcher(entity.actor_id)
-        else:
-            profile = retrieve_and_parse_profile(entity.handle)
-            if profile:
-                entity._sender_key = profile.public_key
-    else:
+    elif not check_sender_and_entity_handle_match(sender, entity.handle):
         # If not relayable, ensure handles match
-        if not check_sender_and_entity_handle_match(sender, entity.handle):
-            return []
+        return None
+
+    children = []
+    for child in element:
+        node = _build_entity_tree(child, sender, user)
+        if node:
+            children.append(node)
+    return entity, attrs, transformed, children
+
+
+def _collect_relayables(node: Tuple, relayables: List) -> List:
+    entity, _attrs, _transformed, children = node
+    if isinstance(entity, DiasporaRelayableMixin):
+        relayables.append(entity)
+    for child in children:
+        _collect_relayables(child, relayables)
+    return relayables
+
+
+def _validate_entity_tree(node: Tuple, lazy: bool = False) -> List:
+    entity, attrs, transformed, children = node
     try:
         entity.validate()
     except ValueError as ex:
@@ -131,19 +172,55 @@ def element_to_objects(
 
     # Extract mentions
     if hasattr(entity, "extract_mentions"):
-        entity.extract_mentions()
+        if lazy:
+            entity.defer("_mentions", extract_mentions)
+        else:
+            entity.extract_mentions()
 
-    # Do child elements
-    for child in element:
+    # Do child entities
+    for child in children:
         # noinspection PyProtectedMember
-        entity._children.extend(element_to_objects(child, sender, user=user))
-    # Add to entities list
-    entities.append(entity)
-    return entities
+        entity._children.extend(_validate_entity_tree(child, lazy))
+    return [entity]
+
+
+def element_to_objects(
+        element: etree.ElementTree, sender: str, sender_key_fetcher: Callable[[str], str] = None, user: UserType = None,
+        lazy: bool = False,
+) -> List:
+    """Transform an Element to a list of entities recursively.
+
+    Possible child entities are added to each entity ``_children`` list.
+
+    The entities of the whole element tree are created first. Then the sender keys of all relayable entities
+    in the tree are resolved in one go, see ``resolve_sender_keys``. Only after that are the entities validated.
+
+    Optional parameter ``sender_key_fetcher`` can be a function to fetch sender public key. It is called with the
+    actor ID of each relayable as the only parameter. If not given, the key will always be fetched over the network
+    from the profile of the relayable handle.
+
+    If ``lazy`` is given, the mentions of the entities are extracted only when first accessed. See
+    ``federation.entities.lazy``.
+    """
+    node = _build_entity_tree(element, sender, user)
+    if not node:
+        return []
+
+    relayables = _collect_relayables(node, [])
+    if relayables:
+        # The fetcher is given the actor ID, while profiles are retrieved by handle
+        identifiers = [entity.actor_id if sender_key_fetcher else entity.handle for entity in relayables]
+        keys = resolve_sender_keys(identifiers, sender_key_fetcher)
+        for entity, identifier in zip(relayables, identifiers):
+            if identifier in keys:
+                entity._sender_key = keys[identifier]
+
+    return _validate_entity_tree(node, lazy)
 
 
 def message_to_objects(
         message: str, sender: str, sender_key_fetcher:Callable[[str], str]=None, user: UserType =None,
+        lazy: bool = False,
 ) -> List:
     """Takes in a message extracted by a protocol and maps it to entities.
 
@@ -154,14 +231,134 @@ def message_to_objects(
     :param sender_key_fetcher: Function to fetch sender public key. If not given, key will always be fetched
         over network. The function should take sender handle as the only parameter.
     :param user: Optional receiving user object. If given, should have a `handle`.
+    :param lazy: Compute derived values of the entities only when first accessed.
     :returns: list of entities
     """
-    doc = etree.fromstring(message)
+    doc = fromstring(message)
     if doc.tag in TAGS:
-        return element_to_objects(doc, sender, sender_key_fetcher, user)
+        return element_to_objects(doc, sender, sender_key_fetcher, user, lazy=lazy)
     return []
 
 
+def _rename(*names: str) -> Callable:
+    def handler(key, value, transformed, attrs):
+        for name in names:
+            transformed[name] = value
+    return handler
+
+
+def _map_default(key, value, transformed, attrs):
+    transformed[key] = value
+
+
+def _map_ignore(key, value, transformed, attrs):
+    pass
+
+
+def _map_author(key, value, transformed, attrs):
+    transformed["actor_id"] = value
+    transformed["handle"] = value
+
+
+def _map_profile_author(key, value, transformed, attrs):
+    # Diaspora Profile XML message contains no GUID. We need the guid. Fetch it.
+    profile = retrieve_and_parse_profile(value)
+    transformed['id'] = value
+    transformed["guid"] = profile.guid
+    transformed["handle"] = value
+
+
+def _map_name(key, value, transformed, attrs):
+    values = [attrs.get('first_name'), attrs.get('last_name')]
+    values = [v for v in values if v]
+    transformed["name"] = " ".join(values)
+
+
+def _image_url_mapper(size: str) -> Callable:
+    def handler(key, value, transformed, attrs):
+        if "image_urls" not in transformed:
+            transformed["image_urls"] = {}
+        transformed["image_urls"][size] = value
+    return handler
+
+
+def _map_tag_string(key, value, transformed, attrs):
+    if value:
+        transformed["tag_list"] = value.replace("#", "").split(" ")
+
+
+def _map_searchable(key, value, transformed, attrs):
+    transformed["public"] = True if value == "true" else False
+
+
+def _map_target_type(key, value, transformed, attrs):
+    transformed["entity_type"] = DiasporaRetraction.entity_type_from_remote(value)
+
+
+def _map_remote_photo_path(key, value, transformed, attrs):
+    transformed["url"] = f"{value}{attrs.get('remote_photo_name')}"
+
+
+def _map_boolean(key, value, transformed, attrs):
+    transformed[key] = True if value == "true" else False
+
+
+def _map_datetime(key, value, transformed, attrs):
+    transformed[key] = datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+
+
+def _map_integer(key, value, transformed, attrs):
+    transformed[key] = int(value)
+
+
+def build_attribute_table(cls) -> Dict[str, Callable]:
+    """
+    Build the table of XML tag handlers for an entity class.
+
+    Handlers are called with the tag, the value, the attributes transformed so far and all attributes from the XML.
+    Tags not in the table are copied as is.
+    """
+    table = {}
+    table.update((key, _map_boolean) for key in BOOLEAN_KEYS)
+    table.update((key, _map_datetime) for key in DATETIME_KEYS)
+    table.update((key, _map_integer) for key in INTEGER_KEYS)
+    table.update({
+        "author": _map_profile_author if cls == DiasporaProfile else _map_author,
+        "author_signature": _rename("signature"),
+        "bio": _rename("raw_content"),
+        "first_name": _map_name,
+        "guid": _map_ignore if cls == DiasporaProfile else _rename("id", "guid"),
+        "image_url": _image_url_mapper("large"),
+        "image_url_medium": _image_url_mapper("medium"),
+        "image_url_small": _image_url_mapper("small"),
+        "last_name": _map_name,
+        "parent_guid": _rename("target_id", "target_guid"),
+        "recipient": _rename("target_id", "target_handle"),
+        "remote_photo_path": _map_remote_photo_path,
+        "root_author": _rename("target_id", "target_handle"),
+        "root_guid": _rename("target_id", "target_guid"),
+        "searchable": _map_searchable,
+        "tag_string": _map_tag_string,
+        "target_guid": _rename("target_id", "target_guid"),
+        "text": _rename("raw_content"),
+        "thread_parent_guid": _rename("root_target_id", "root_target_guid"),
+    })
+    if cls == DiasporaRetraction:
+        table["target_type"] = _map_target_type
+    return table
+
+
+# XML tag handler tables per entity class, see `build_attribute_table`
+ATTRIBUTE_TABLES = {cls: build_attribute_table(cls) for cls in MAPPINGS.values()}
+
+
+def get_attribute_table(cls) -> Dict[str, Callable]:
+    table = ATTRIBUTE_TABLES.get(cls)
+    if table is None:
+        table = ATTRIBUTE_TABLES[cls] = build_attribute_table(cls)
+    return table
+
+
 def transform_attributes(attrs, cls):
     """Transform some attribute keys.
 
@@ -171,70 +368,11 @@ def transform_attributes(attrs, cls):
     :type cls: class
     """
     transformed = {}
+    table = get_attribute_table(cls)
     for key, value in attrs.items():
         if value is None:
             value = ""
-        if key == "text":
-            transformed["raw_content"] = value
-        elif key == "author":
-            if cls == DiasporaProfile:
-                # Diaspora Profile XML message contains no GUID. We need the guid. Fetch it.
-                profile = retrieve_and_parse_profile(value)
-                transformed['id'] = value
-                transformed["guid"] = profile.guid
-            else:
-                transformed["actor_id"] = value
-            transformed["handle"] = value
-        elif key == 'guid':
-            if cls != DiasporaProfile:
-                transformed["id"] = value
-                transformed["guid"] = value
-        elif key in ("root_author", "recipient"):
-            transformed["target_id"] = value
-            transformed["target_handle"] = value
-        elif key in ("target_guid", "root_guid", "parent_guid"):
-            transformed["target_id"] = value
-            transformed["target_guid"] = value
-        elif key == "thread_parent_guid":
-            transformed["root_target_id"] = value
-            transformed["root_target_guid"] = value
-        elif key in ("first_name", "last_name"):
-            values = [attrs.get('first_name'), attrs.get('last_name')]
-            values = [v for v in values if v]
-            transformed["name"] = " ".join(values)
-        elif key == "image_url":
-            if "image_urls" not in transformed:
-                transformed["image_urls"] = {}
-            transformed["image_urls"]["large"] = value
-        elif key == "image_url_small":
-            if "image_urls" not in transformed:
-                transformed["image_urls"] = {}
-            transformed["image_urls"]["small"] = value
-        elif key == "image_url_medium":
-            if "image_urls" not in transformed:
-                transformed["image_urls"] = {}
-            transformed["image_urls"]["medium"] = value
-        elif key == "tag_string":
-            if value:
-                transformed["tag_list"] = value.replace("#", "").split(" ")
-        elif key == "bio":
-            transformed["raw_content"] = value
-        elif key == "searchable":
-            transformed["public"] = True if value == "true" else False
-        elif key in ["target_type"] and cls == DiasporaRetraction:
-            transformed["entity_type"] = DiasporaRetraction.entity_type_from_remote(value)
-        elif key == "remote_photo_path":
-            transformed["url"] = f"{value}{attrs.get('remote_photo_name')}"
-        elif key == "author_signature":
-            transformed["signature"] = value
-        elif key in BOOLEAN_KEYS:
-            transformed[key] = True if value == "true" else False
-        elif key in DATETIME_KEYS:
-            transformed[key] = datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
-        elif key in INTEGER_KEYS:
-            transformed[key] = int(value)
-        else:
-            transformed[key] = value
+        table.get(key, _map_default)(key, value, transformed, attrs)
     return transformed
 
 
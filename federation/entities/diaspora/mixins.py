@@ -1,16 +1,39 @@
+from copy import deepcopy
+
 from Crypto.PublicKey import RSA
 from lxml import etree
 
 from federation.entities.diaspora.utils import add_element_to_doc
 from federation.entities.mixins import BaseEntity
-from federation.entities.utils import get_base_attributes
+from federation.entities.utils import convert_entity
 from federation.exceptions import SignatureVerificationError
+from federation.protocols.diaspora.parsing import fromstring
 from federation.protocols.diaspora.signatures import verify_relayable_signature, create_relayable_signature
 
 
 class DiasporaEntityMixin(BaseEntity):
     # Normally outbound document is generated from entity. Store one here if at some point we already have a doc
     outbound_doc = None
+    # Parsed element of the received document. Serialized to `_source_object` only when needed
+    _source_element = None
+    _source_bytes = None
+
+    @property
+    def _source_object(self):
+        if self._source_bytes is None and self._source_element is not None:
+            self._source_bytes = etree.tostring(self._source_element)
+        return self._source_bytes
+
+    @_source_object.setter
+    def _source_object(self, value):
+        self._source_bytes = value
+        self._source_element = None
+
+    def _get_source_element(self):
+        """Get the source document as an element, parsing the serialized source object only if needed."""
+        if self._source_element is None and self._source_bytes:
+            self._source_element = fromstring(self._source_bytes)
+        return self._source_element
 
     def to_string(self) -> str:
         """
@@ -24,7 +47,7 @@ class DiasporaEntityMixin(BaseEntity):
 
     @classmethod
     def from_base(cls, entity):
-        return cls(**get_base_attributes(entity))
+        return convert_entity(entity, cls)
 
     @staticmethod
     def fill_extra_attributes(attributes):
@@ -53,16 +76,17 @@ class DiasporaRelayableMixin(DiasporaEntityMixin):
         super()._validate_signatures()
         if not self._sender_key:
             raise SignatureVerificationError("Cannot verify entity signature - no sender key available")
-        source_doc = etree.fromstring(self._source_object)
-        if not verify_relayable_signature(self._sender_key, source_doc, self.signature):
+        if not verify_relayable_signature(self._sender_key, self._get_source_element(), self.signature):
             raise SignatureVerificationError("Signature verification failed.")
 
     def sign(self, private_key: RSA) -> None:
         self.signature = create_relayable_signature(private_key, self.to_xml())
 
     def sign_with_parent(self, private_key):
-        if self._source_object:
-            doc = etree.fromstring(self._source_object)
+        source_doc = self._get_source_element()
+        if source_doc is not None:
+            # Copy so the parent signature is not added to the received document
+            doc = deepcopy(source_doc)
         else:
             doc = self.to_xml()
         self.parent_signature = create_relayable_signature(private_key, doc)
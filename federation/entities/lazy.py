@@ -0,0 +1,86 @@
+"""
+Deferred computation of entity values.
+
+Inbound mappers called with ``lazy=True`` return the same verified and validated entities of the same classes as
+without it. Values that take work to compute from the payload are not computed up front, but on first access:
+
+* The receivers and mentions.
+* For ActivityPub, ``raw_content`` converted from HTML, and the attachments in ``_children``. Validation checks the
+  source fields instead, see ``BaseEntity.defer``. ``post_receive`` changes to the content are applied when it is
+  computed.
+
+Entities dropped after looking at for example ``id``, ``actor_id`` and the type never pay for them. Signatures are
+still verified, and the sender keys needed for that still fetched, before the entities are returned.
+"""
+from typing import Any, Callable, Dict, Set
+
+
+class DeferredAttribute:
+    """
+    Class attribute whose instance value can be computed on first access.
+
+    Reads the value set on the instance. If there is none, and a function computing the value has been registered
+    with ``BaseEntity.defer``, the function is called with the entity and the result stored on the instance. If
+    neither, the default is returned. Setting the value drops any registered function.
+    """
+    def __init__(self, default: Any = None):
+        self.default = default
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.default
+        values = instance.__dict__
+        if self.name in values:
+            return values[self.name]
+        deferred = values.get("_deferred")
+        if deferred and self.name in deferred:
+            value = deferred[self.name](instance)
+            self.__set__(instance, value)
+            return value
+        return self.default
+
+    def __set__(self, instance, value):
+        values = instance.__dict__
+        deferred = values.get("_deferred")
+        if deferred and self.name in deferred:
+            # Replace rather than change, copies of the entity may share the dictionary
+            values["_deferred"] = {name: compute for name, compute in deferred.items() if name != self.name}
+        values[self.name] = value
+
+
+class DeferredValue:
+    """
+    Attribute value of a mapped entity that can be computed later.
+
+    :arg compute: Function without arguments that returns the value.
+    :arg source: Value validated in place of the value until it is computed.
+    """
+    def __init__(self, compute: Callable[[], Any], source: Any = None):
+        self.compute = compute
+        self.source = source
+
+
+def resolve_deferred_values(attributes: Dict) -> None:
+    """Replace the ``DeferredValue`` values of mapped attributes with the computed values."""
+    for name, value in attributes.items():
+        if isinstance(value, DeferredValue):
+            attributes[name] = value.compute()
+
+
+def pop_deferred_values(attributes: Dict) -> Dict[str, DeferredValue]:
+    """Remove the ``DeferredValue`` values from mapped attributes and return them."""
+    deferred = {name: value for name, value in attributes.items() if isinstance(value, DeferredValue)}
+    for name in deferred:
+        del attributes[name]
+    return deferred
+
+
+def extract_mentions(entity) -> Set:
+    """Compute the mentions of an entity, for deferring ``_mentions``."""
+    entity._mentions = set()
+    entity.extract_mentions()
+    return entity._mentions
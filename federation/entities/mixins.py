@@ -2,23 +2,32 @@ import datetime
 import importlib
 import re
 import warnings
-from typing import List, Set, Union, Dict
-
-from commonmark import commonmark
+from typing import Callable, List, Set, Tuple, Union, Dict
 
+from federation.effects import SideEffect
 from federation.entities.activitypub.enums import ActivityType
+from federation.entities.lazy import DeferredAttribute
+from federation.utils.conversion import markdown_to_html
 
 
 # TODO someday, rewrite entities as dataclasses or attr's
 class BaseEntity:
     _allowed_children: tuple = ()
-    _children: List = None
-    _mentions: Set = None
-    _receivers: List = None
+    _children: List = DeferredAttribute()
+    # Functions computing deferred attribute values and the values validated in their place, see `defer`
+    _deferred: Dict = None
+    _deferred_sources: Dict = None
+    _mentions: Set = DeferredAttribute()
+    _receivers: List = DeferredAttribute()
     _source_protocol: str = ""
     # Contains the original object from payload as a string
     _source_object: Union[str, Dict] = None
     _sender_key: str = ""
+    # Side effects registered by `post_receive`, see `federation.effects`
+    _side_effects: List = None
+    # Public attributes and `validate_<attr>` method names, see `_build_validation_plan`
+    _validation_attributes: frozenset = frozenset()
+    _validation_methods: tuple = ()
     # ActivityType
     activity: ActivityType = None
     activity_id: str = ""
@@ -35,6 +44,7 @@ class BaseEntity:
         self._children = []
         self._mentions = set()
         self._receivers = []
+        self._side_effects = []
         for key, value in kwargs.items():
             if hasattr(self, key):
                 setattr(self, key, value)
@@ -51,9 +61,61 @@ class BaseEntity:
         klass = getattr(entities, f"{protocol.title()}{self.__class__.__name__}")
         return klass.from_base(self)
 
+    def defer(self, name: str, compute: Callable, source=None) -> None:
+        """
+        Compute the value of an attribute only when it is first accessed.
+
+        Only attributes declared as ``federation.entities.lazy.DeferredAttribute`` can be deferred.
+
+        :arg name: Attribute name.
+        :arg compute: Function that takes the entity and returns the value.
+        :arg source: (Optional) Value validated in place of the attribute until it is computed, for example the
+            source field the value is converted from.
+        """
+        self.__dict__.pop(name, None)
+        object.__setattr__(self, "_deferred", dict(self._deferred or (), **{name: compute}))
+        object.__setattr__(self, "_deferred_sources", dict(self._deferred_sources or (), **{name: source}))
+
+    def is_deferred(self, name: str) -> bool:
+        """Whether the value of an attribute is deferred and not computed yet."""
+        return name in (self._deferred or ())
+
+    def map_attribute(self, name: str, function: Callable) -> None:
+        """
+        Replace the value of an attribute with ``function(value)``.
+
+        If the attribute is deferred, the function is applied only when the value is computed.
+        """
+        if self.is_deferred(name):
+            compute = self._deferred[name]
+            self.defer(name, lambda entity: function(compute(entity)), self._deferred_sources.get(name))
+        else:
+            setattr(self, name, function(getattr(self, name)))
+
+    def resolve_deferred(self) -> None:
+        """Compute the values of all deferred attributes of the entity."""
+        for name in list(self._deferred or ()):
+            getattr(self, name)
+
+    def _get_validation_value(self, name: str):
+        """Get the value of an attribute to validate, the source of the value if it is deferred."""
+        if self.is_deferred(name):
+            return self._deferred_sources.get(name)
+        return getattr(self, name)
+
+    def add_side_effect(self, name: str, function: Callable, *args, **kwargs) -> None:
+        """
+        Register an action to be run after the entity has been received.
+
+        Use this in ``post_receive`` for anything that needs outbound network access. See ``federation.effects``.
+        """
+        self._side_effects.append(SideEffect(name, function, args, kwargs))
+
     def post_receive(self):
         """
         Run any actions after deserializing the payload into an entity.
+
+        Must not do outbound network access, register a side effect with ``add_side_effect`` instead.
         """
         pass
 
@@ -63,6 +125,35 @@ class BaseEntity:
         """
         pass
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_validation_plan()
+
+    @classmethod
+    def _build_validation_plan(cls) -> None:
+        """
+        Collect the public attributes of the class and their ``validate_<attr>`` methods, once per class.
+
+        Only the class is inspected, so properties are not evaluated.
+        """
+        attributes = frozenset(attr for attr in dir(cls) if not attr.startswith("_"))
+        cls._validation_attributes = attributes
+        cls._validation_methods = tuple(sorted(
+            "validate_%s" % attr for attr in attributes if callable(getattr(cls, "validate_%s" % attr, None))
+        ))
+
+    def _get_validation_plan(self):
+        attributes = self._validation_attributes
+        # Attributes set only on the instance, for example validators replaced in tests
+        extra = [attr for attr in self.__dict__ if not attr.startswith("_") and attr not in attributes]
+        if not extra:
+            return attributes, self._validation_methods
+        attributes = attributes.union(extra)
+        methods = tuple(sorted(
+            "validate_%s" % attr for attr in attributes if callable(getattr(self, "validate_%s" % attr, None))
+        ))
+        return attributes, methods
+
     def validate(self):
         """Do validation.
 
@@ -71,17 +162,11 @@ class BaseEntity:
         3) Loop through attributes and call their `validate_<attr>` methods, if any.
         4) Validate allowed children
         5) Validate signatures
+
+        The attributes and validation methods are collected once per class, see ``_build_validation_plan``.
         """
-        attributes = []
-        validates = []
-        # Collect attributes and validation methods
-        for attr in dir(self):
-            if not attr.startswith("_"):
-                attr_type = type(getattr(self, attr))
-                if attr_type != "method":
-                    if getattr(self, "validate_{attr}".format(attr=attr), None):
-                        validates.append(getattr(self, "validate_{attr}".format(attr=attr)))
-                    attributes.append(attr)
+        attributes, methods = self._get_validation_plan()
+        validates = [getattr(self, method) for method in methods]
         self._validate_empty_attributes(attributes)
         self._validate_required(attributes)
         self._validate_attributes(validates)
@@ -90,8 +175,7 @@ class BaseEntity:
 
     def _validate_required(self, attributes):
         """Ensure required attributes are present."""
-        required_fulfilled = set(self._required).issubset(set(attributes))
-        if not required_fulfilled:
+        if not attributes.issuperset(self._required):
             raise ValueError(
                 "Not all required attributes fulfilled. Required: {required}".format(required=set(self._required))
             )
@@ -103,18 +187,24 @@ class BaseEntity:
 
     def _validate_empty_attributes(self, attributes):
         """Check that required attributes are not empty."""
-        attrs_to_check = set(self._required) & set(attributes)
-        for attr in attrs_to_check:
-            value = getattr(self, attr)  # We should always have a value here
+        for attr in self._required:
+            if attr not in attributes:
+                continue
+            value = self._get_validation_value(attr)  # We should always have a value here
             if value is None or value == "":
                 raise ValueError(
                     "Attribute %s cannot be None or an empty string since it is required." % attr
                 )
 
     def _validate_children(self):
-        """Check that the children we have are allowed here."""
-        for child in self._children:
-            if not isinstance(child, self._allowed_children):
+        """
+        Check that the children we have are allowed here.
+
+        The source of deferred children is a list of the classes of the children.
+        """
+        for child in self._get_validation_value("_children") or ():
+            child_class = child if isinstance(child, type) else child.__class__
+            if not issubclass(child_class, self._allowed_children):
                 raise ValueError(
                     "Child %s is not allowed as a children for this %s type entity." % (
                         child, self.__class__
@@ -134,6 +224,9 @@ class BaseEntity:
         pass
 
 
+BaseEntity._build_validation_plan()
+
+
 class PublicMixin(BaseEntity):
     public = False
 
@@ -186,44 +279,94 @@ class CreatedAtMixin(BaseEntity):
             self.created_at = datetime.datetime.now()
 
 
+# Attributes the content derived values of `RawContentMixin` depend on
+CONTENT_ATTRIBUTES = frozenset(("raw_content", "_rendered_content", "_media_type"))
+
+EMBEDDED_IMAGE_REGEX = re.compile(
+    r"!\[([\w ]*)\]\((https?://[\w\d\-\./]+\.[\w]*((?<=jpg)|(?<=gif)|(?<=png)|(?<=jpeg)))\)",
+    re.MULTILINE | re.IGNORECASE,
+)
+MENTION_REGEX = re.compile(r'@{([\S ][^{}]+)}')
+
+
 class RawContentMixin(BaseEntity):
+    """
+    Provides content fields.
+
+    Values derived from the content, like ``tags`` and ``rendered_content``, are computed once and cached. Assigning
+    ``raw_content``, ``_rendered_content`` or ``_media_type`` drops the cached values.
+    """
+    _content_cache: Dict = None
     _media_type: str = "text/markdown"
-    _mentions: Set = None
     _rendered_content: str = ""
-    raw_content: str = ""
+    raw_content: str = DeferredAttribute("")
 
     def __init__(self, *args, **kwargs):
-        self._mentions = set()
         super().__init__(*args, **kwargs)
         self._required += ["raw_content"]
 
-    @property
-    def rendered_content(self) -> str:
-        """Returns the rendered version of raw_content, or just raw_content."""
+    def __setattr__(self, name, value):
+        if name in CONTENT_ATTRIBUTES:
+            # Replace rather than clear, copies of the entity may share the cache
+            object.__setattr__(self, "_content_cache", None)
+        super().__setattr__(name, value)
+
+    def _get_content_value(self, name: str, compute: Callable):
+        cache = self._content_cache
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, "_content_cache", cache)
+        if name not in cache:
+            cache[name] = compute()
+        return cache[name]
+
+    def _render_content(self) -> str:
         if self._rendered_content:
             return self._rendered_content
         elif self._media_type == "text/markdown" and self.raw_content:
-            return commonmark(self.raw_content).strip()
+            return markdown_to_html(self.raw_content).strip()
         return self.raw_content
 
     @property
-    def tags(self) -> List[str]:
-        """Returns a `list` of unique tags contained in `raw_content`."""
+    def rendered_content(self) -> str:
+        """Returns the rendered version of raw_content, or just raw_content."""
+        return self._get_content_value("rendered_content", self._render_content)
+
+    def _extract_tags(self) -> tuple:
         if not self.raw_content:
-            return []
+            return ()
         tags = {word.strip("#").lower() for word in self.raw_content.split() if word.startswith("#") and len(word) > 1}
-        return sorted(tags)
+        return tuple(sorted(tags))
 
-    def extract_mentions(self):
-        matches = re.findall(r'@{([\S ][^{}]+)}', self.raw_content)
-        if not matches:
-            return
-        for mention in matches:
+    @property
+    def tags(self) -> List[str]:
+        """Returns a `list` of unique tags contained in `raw_content`."""
+        return list(self._get_content_value("tags", self._extract_tags))
+
+    def _extract_embedded_images(self) -> tuple:
+        if self._media_type != "text/markdown" or not self.raw_content:
+            return ()
+        return tuple(
+            (match.group(2), match.group(1) or "") for match in EMBEDDED_IMAGE_REGEX.finditer(self.raw_content)
+        )
+
+    @property
+    def embedded_images(self) -> List[Tuple[str, str]]:
+        """Returns a `list` of `(url, name)` tuples of the images embedded in markdown `raw_content`."""
+        return list(self._get_content_value("embedded_images", self._extract_embedded_images))
+
+    def _extract_content_mentions(self) -> frozenset:
+        mentions = set()
+        for mention in MENTION_REGEX.findall(self.raw_content or ""):
             splits = mention.split(";")
             if len(splits) == 1:
-                self._mentions.add(splits[0].strip(' }'))
+                mentions.add(splits[0].strip(' }'))
             elif len(splits) == 2:
-                self._mentions.add(splits[1].strip(' }'))
+                mentions.add(splits[1].strip(' }'))
+        return frozenset(mentions)
+
+    def extract_mentions(self):
+        self._mentions.update(self._get_content_value("mentions", self._extract_content_mentions))
 
 
 class OptionalRawContentMixin(RawContentMixin):
@@ -1,4 +1,38 @@
 import inspect
+from typing import Dict, Tuple, Type
+
+# Base attribute names per entity class, see `get_base_fields`
+_base_fields: Dict[Type, Tuple[str, ...]] = {}
+# Base attribute names to copy per source and target entity class, see `get_copy_fields`
+_copy_fields: Dict[Tuple[Type, Type], Tuple[str, ...]] = {}
+
+
+def get_base_fields(cls: Type) -> Tuple[str, ...]:
+    """Get the names of the base attributes of an entity class.
+
+    These are the attributes that are not properties, functions or start with an underscore. The names are
+    collected once per class.
+    """
+    fields = _base_fields.get(cls)
+    if fields is None:
+        fields = _base_fields[cls] = tuple(
+            attr for attr, _ in inspect.getmembers(
+                cls, lambda o: not isinstance(o, property) and not inspect.isroutine(o),
+            ) if not attr.startswith("_")
+        )
+    return fields
+
+
+def get_copy_fields(source: Type, target: Type) -> Tuple[str, ...]:
+    """Get the names of the base attributes of a source entity class that a target entity class supports.
+
+    The names are collected once per pair of classes.
+    """
+    key = (source, target)
+    fields = _copy_fields.get(key)
+    if fields is None:
+        fields = _copy_fields[key] = tuple(attr for attr in get_base_fields(source) if hasattr(target, attr))
+    return fields
 
 
 def get_base_attributes(entity):
@@ -7,9 +41,13 @@ def get_base_attributes(entity):
     Returns attributes and their values, ignoring any properties, functions and anything that starts
     with an underscore.
     """
-    attributes = {}
-    cls = entity.__class__
-    for attr, _ in inspect.getmembers(cls, lambda o: not isinstance(o, property) and not inspect.isroutine(o)):
-        if not attr.startswith("_"):
-            attributes[attr] = getattr(entity, attr)
-    return attributes
+    return {attr: getattr(entity, attr) for attr in get_base_fields(entity.__class__)}
+
+
+def convert_entity(entity, cls: Type):
+    """Create an entity of another class, for example a protocol entity from a base entity.
+
+    Copies the base attributes the target class supports.
+    """
+    # noinspection PyArgumentList
+    return cls(**{attr: getattr(entity, attr) for attr in get_copy_fields(entity.__class__, cls)})
@@ -16,3 +16,8 @@ class NoSuitableProtocolFoundError(Exception):
 class SignatureVerificationError(Exception):
     """Authenticity of the signature could not be verified given the key."""
     pass
+
+
+class SenderNotAllowedError(Exception):
+    """Sender of the payload was rejected by the sender filter."""
+    pass
@@ -0,0 +1,147 @@
+"""
+Concurrent crawling of node metadata.
+
+``crawl_hosts`` fetches the metadata of many hosts from all sources, for example NodeInfo and the Mastodon API.
+The sources of a host are fetched concurrently, within a shared fetch scope of the host. The scope makes sure
+documents fetched by several sources, like the Mastodon API document also used for Misskey, are fetched only once,
+and that nothing is fetched after the deadline of the host.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from federation.hostmeta import fetchers
+from federation.utils.network import FetchScope, fetch_scope
+
+logger = logging.getLogger("federation")
+
+# Sources of node metadata. Each is fetched with ``federation.hostmeta.fetchers.fetch_<source>_document``.
+SOURCES = ("nodeinfo2", "nodeinfo", "statisticsjson", "mastodon", "misskey", "matrix")
+
+# Maximum number of sources fetched at the same time, over all hosts
+MAX_WORKERS = 32
+# Maximum number of sources of one host fetched at the same time
+MAX_PER_HOST = 3
+# Seconds a host may take, from starting to fetch its first source
+HOST_TIMEOUT = 30
+
+
+class HostCrawl:
+    """State of crawling one host."""
+    def __init__(self, host: str, sources: Tuple[str, ...], timeout: float):
+        self.host = host
+        self.pending = deque(sources)
+        self.running = 0
+        self.results = dict.fromkeys(sources)
+        self.timeout = timeout
+        # The deadline is set when the first source starts to be fetched
+        self.scope = FetchScope()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return not self.pending and not self.running
+
+    def fetch(self, source: str) -> Optional[Dict]:
+        """Fetch one source of the host, starting the deadline of the host if this is the first source."""
+        with self._lock:
+            if self.scope.deadline is None:
+                self.scope.deadline = time.monotonic() + self.timeout
+        return fetch_source(self.scope, source, self.host)
+
+
+def fetch_source(scope: FetchScope, source: str, host: str) -> Optional[Dict]:
+    """Fetch one source of node metadata of a host within a fetch scope."""
+    with fetch_scope(scope):
+        try:
+            return getattr(fetchers, "fetch_%s_document" % source)(host)
+        except Exception as ex:
+            logger.debug("fetch_source: fetching %s of %s failed: %s", source, host, ex)
+            return None
+
+
+def crawl_hosts(
+        hosts: Iterable[str], sources: Tuple[str, ...] = SOURCES, max_workers: int = MAX_WORKERS,
+        max_per_host: int = MAX_PER_HOST, timeout: float = HOST_TIMEOUT,
+) -> Iterator[Tuple[str, Dict[str, Optional[Dict]]]]:
+    """
+    Crawl the node metadata of hosts.
+
+    All sources of a host are fetched concurrently, at most ``max_per_host`` at a time. Hosts are crawled
+    concurrently too, using at most ``max_workers`` threads. Hosts are taken from ``hosts`` only as there is room
+    for them, so it can be a generator over a large number of hosts.
+
+    Each host has a deadline of ``timeout`` seconds from when its first source starts to be fetched. Requests are
+    timed out by the deadline and sources not fetched by then have no result. Sources still running at the deadline
+    are left behind, but keep counting against ``max_workers`` until they finish.
+
+    :arg hosts: Hosts to crawl, domain part only.
+    :arg sources: Sources to fetch, see ``SOURCES``.
+    :arg max_workers: Maximum number of sources fetched at the same time.
+    :arg max_per_host: Maximum number of sources of one host fetched at the same time.
+    :arg timeout: Seconds to crawl one host.
+    :returns: Generator of tuples of host and a dictionary of the parsed document (or ``None``) per source, in the
+        order the hosts complete.
+    """
+    hosts = iter(hosts)
+    max_per_host = max(1, min(max_per_host, max_workers))
+    max_hosts = max(1, max_workers // max_per_host)
+    active = []
+    running = {}
+    # Sources left behind at the deadline of their host, still using a worker
+    abandoned = set()
+    exhausted = False
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="federation-crawler")
+    try:
+        while True:
+            while not exhausted and len(active) < max_hosts:
+                host = next(hosts, None)
+                if host is None:
+                    exhausted = True
+                else:
+                    active.append(HostCrawl(host, tuple(sources), timeout))
+            if not active:
+                return
+            for crawl in active:
+                while crawl.pending and crawl.running < max_per_host and len(running) + len(abandoned) < max_workers:
+                    source = crawl.pending.popleft()
+                    future = executor.submit(crawl.fetch, source)
+                    running[future] = crawl, source
+                    crawl.running += 1
+            now = time.monotonic()
+            # Hosts not started yet have their deadline at least a full timeout away
+            next_deadline = min(
+                (crawl.scope.deadline for crawl in active if crawl.scope.deadline is not None), default=now + timeout,
+            )
+            done, _not_done = wait(
+                set(running) | abandoned, timeout=max(next_deadline - now, 0), return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                if future in abandoned:
+                    abandoned.discard(future)
+                    continue
+                crawl, source = running.pop(future)
+                crawl.running -= 1
+                crawl.results[source] = future.result()
+            now = time.monotonic()
+            for crawl in [
+                crawl for crawl in active
+                if crawl.done or (crawl.scope.deadline is not None and crawl.scope.deadline <= now)
+            ]:
+                if not crawl.done:
+                    logger.debug("crawl_hosts: deadline passed for %s", crawl.host)
+                    # Leave any running sources behind, their requests are timed out by the deadline too
+                    for future, (running_crawl, _source) in list(running.items()):
+                        if running_crawl is crawl:
+                            del running[future]
+                            if not future.cancel():
+                                abandoned.add(future)
+                active.remove(crawl)
+                yield crawl.host, crawl.results
+    finally:
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=False)
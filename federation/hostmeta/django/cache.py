@@ -0,0 +1,215 @@
+"""
+Response caching for the discovery views.
+
+Rendered responses are kept in process for a configurable time, see the ``nodeinfo2_cache_ttl`` and
+``webfinger_cache_ttl`` settings. Responses carry an ``ETag``, and requests with a matching ``If-None-Match`` get
+a ``304 Not Modified`` response. A NodeInfo2 response older than its TTL is still served for up to
+``nodeinfo2_stale_ttl`` seconds while it is refreshed in the background.
+
+The cache is per process. Invalidating a response only drops it from the cache of the calling process, other
+worker processes keep serving their copy until it expires.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Callable, Hashable, Optional
+
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+logger = logging.getLogger("federation")
+
+# How many responses to remember
+RESPONSE_CACHE_SIZE = 4096
+
+NODEINFO2_KEY = ("nodeinfo2",)
+
+
+class CachedResponse:
+    """A rendered response body with its content type and ETag."""
+    def __init__(self, body: bytes, content_type: str):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"%s"' % sha256(body).hexdigest()[:32]
+        self.created = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created
+
+
+class ResponseCache:
+    """
+    Bounded in-process cache of rendered responses.
+
+    :arg max_size: Maximum number of responses to remember.
+    """
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+            return cached
+
+    def set(self, key: Hashable, cached: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = cached
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def refresh(self, key: Hashable, render: Callable[[], Optional[HttpResponse]]) -> bool:
+        """
+        Render a response again in a background thread.
+
+        Only one refresh per key runs at a time.
+
+        :returns: ``True`` if a refresh was started.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+        thread = threading.Thread(target=self._refresh, args=(key, render), daemon=True)
+        thread.start()
+        return True
+
+    def _refresh(self, key: Hashable, render: Callable[[], Optional[HttpResponse]]) -> None:
+        try:
+            response = render()
+            if response is not None and response.status_code == 200:
+                self.set(key, CachedResponse(response.content, response["Content-Type"]))
+        except Exception as ex:
+            logger.warning("ResponseCache: refreshing %s failed: %s", key, ex)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            # Database connections are per thread, don't leave this one open
+            connections.close_all()
+
+
+_cache = ResponseCache()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the response cache in use. ``None`` if responses are not cached."""
+    return _cache
+
+
+def set_response_cache(cache: Optional[ResponseCache]) -> None:
+    """
+    Set the response cache to use.
+
+    Pass ``None`` to not cache responses at all.
+    """
+    global _cache
+    _cache = cache
+
+
+def get_webfinger_key(handle: str) -> Hashable:
+    """
+    Get the cache key of the webfinger response of a handle.
+
+    The key is only the handle. The response rendered for the first request of a handle is served to all requests
+    of it, so the profile function must not return a different profile depending on the request.
+    """
+    return "webfinger", handle.lower()
+
+
+def invalidate_nodeinfo2() -> None:
+    """
+    Drop the cached NodeInfo2 response, for example after a large change in the usage counts.
+
+    Only the cache of the calling process is cleared.
+    """
+    if _cache is not None:
+        _cache.delete(NODEINFO2_KEY)
+
+
+def invalidate_webfinger(handle: str) -> None:
+    """
+    Drop the cached webfinger response of a handle, for example when the profile has changed.
+
+    Only the cache of the calling process is cleared.
+    """
+    if _cache is not None:
+        _cache.delete(get_webfinger_key(handle))
+
+
+def _etag_matches(request, etag: str) -> bool:
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    if "*" in etags:
+        return True
+    # Weak comparison, see RFC 7232 section 3.2
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in etags)
+
+
+def _build_response(request, cached: CachedResponse, ttl: int, stale_ttl: int = 0) -> HttpResponse:
+    if _etag_matches(request, cached.etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(cached.body, content_type=cached.content_type)
+    response["ETag"] = cached.etag
+    # Clients can keep the response only for as long as it is still fresh here
+    cache_control = "max-age=%d" % max(ttl - cached.age, 0)
+    if stale_ttl:
+        cache_control += ", stale-while-revalidate=%s" % stale_ttl
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def cached_response(
+        request, key: Hashable, render: Callable[[], HttpResponse], ttl: int, stale_ttl: int = 0,
+) -> HttpResponse:
+    """
+    Get a response from the cache, rendering it if needed.
+
+    Only ``200 OK`` responses are cached, others are returned as rendered.
+
+    :arg request: Django request.
+    :arg key: Cache key of the response.
+    :arg render: Function rendering the response.
+    :arg ttl: Seconds a rendered response is fresh. If not positive, responses are not cached.
+    :arg stale_ttl: Seconds after ``ttl`` that a response is still served while it is rendered again in the
+        background.
+    """
+    cache = _cache
+    if cache is None or ttl <= 0:
+        return render()
+    cached = cache.get(key)
+    if cached is not None:
+        age = cached.age
+        if age < ttl:
+            return _build_response(request, cached, ttl, stale_ttl)
+        if age < ttl + stale_ttl:
+            cache.refresh(key, render)
+            return _build_response(request, cached, ttl, stale_ttl)
+    response = render()
+    if response.status_code != 200:
+        return response
+    cached = CachedResponse(response.content, response["Content-Type"])
+    cache.set(key, cached)
+    return _build_response(request, cached, ttl, stale_ttl)
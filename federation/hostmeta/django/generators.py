@@ -2,6 +2,7 @@ import logging
 
 from django.http import HttpResponseBadRequest, JsonResponse, HttpResponseNotFound
 
+from federation.hostmeta.django.cache import NODEINFO2_KEY, cached_response, get_webfinger_key
 from federation.hostmeta.generators import RFC7033Webfinger, generate_nodeinfo2_document
 from federation.utils.django import get_configuration, get_function_from_config
 from federation.utils.text import get_path_from_url
@@ -10,18 +11,33 @@ logger = logging.getLogger("federation")
 
 
 def nodeinfo2_view(request, *args, **kwargs):
+    """
+    Django view to generate a NodeInfo2 document.
+
+    The response is cached, see ``nodeinfo2_cache_ttl`` and ``nodeinfo2_stale_ttl`` in the configuration.
+    """
     try:
         nodeinfo2_func = get_function_from_config("nodeinfo2_function")
     except AttributeError:
         return HttpResponseBadRequest("Not configured")
-    nodeinfo2 = nodeinfo2_func()
 
-    return JsonResponse(generate_nodeinfo2_document(**nodeinfo2))
+    def render():
+        nodeinfo2 = nodeinfo2_func()
+        return JsonResponse(generate_nodeinfo2_document(**nodeinfo2))
+
+    config = get_configuration()
+    return cached_response(
+        request, NODEINFO2_KEY, render, config.get("nodeinfo2_cache_ttl"), config.get("nodeinfo2_stale_ttl"),
+    )
 
 
 def rfc7033_webfinger_view(request, *args, **kwargs):
     """
     Django view to generate an RFC7033 webfinger.
+
+    If ``webfinger_cache_ttl`` is set in the configuration, the response is cached per handle. The cached response
+    is served to all requests of the handle, whatever the request passed to ``get_profile_function``. Use
+    ``federation.hostmeta.django.cache.invalidate_webfinger`` to drop the response of a changed profile.
     """
     resource = request.GET.get("resource")
     if not resource:
@@ -30,6 +46,14 @@ def rfc7033_webfinger_view(request, *args, **kwargs):
         return HttpResponseBadRequest("Invalid resource")
     handle = resource.replace("acct:", "").lower()
     logger.debug(f"{handle} requested with {request}")
+    config = get_configuration()
+    return cached_response(
+        request, get_webfinger_key(handle), lambda: _render_webfinger(request, handle),
+        config.get("webfinger_cache_ttl"),
+    )
+
+
+def _render_webfinger(request, handle):
     profile_func = get_function_from_config("get_profile_function")
 
     try:
@@ -1,4 +1,6 @@
 import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import wraps
 from typing import Dict, Optional
 
 import requests
@@ -6,11 +8,32 @@ import requests
 from federation.hostmeta.parsers import (
     parse_nodeinfo_document, parse_nodeinfo2_document, parse_statisticsjson_document, parse_mastodon_document,
     parse_matrix_document, parse_misskey_document)
-from federation.utils.network import fetch_document
+from federation.utils.network import USER_AGENT, fetch_document, get_fetch_scope, get_request_timeout
 
 HIGHEST_SUPPORTED_NODEINFO_VERSION = 2.1
 
 
+def shared_in_scope(func):
+    """
+    Share the result of a fetcher per host within a fetch scope.
+
+    Parsers call other fetchers, for example the Mastodon parser fetches NodeInfo for Pleroma servers. Within a
+    fetch scope, see ``federation.utils.network.fetch_scope``, such nested fetches reuse the result of the fetcher
+    already run or running for the host.
+    """
+    @wraps(func)
+    def wrapper(host, *args, **kwargs):
+        scope = get_fetch_scope()
+        if scope is None:
+            return func(host, *args, **kwargs)
+        try:
+            return scope.share((func.__name__, host), func, host, *args, **kwargs)
+        except FutureTimeoutError:
+            return None
+    return wrapper
+
+
+@shared_in_scope
 def fetch_mastodon_document(host):
     doc, status_code, error = fetch_document(host=host, path='/api/v1/instance')
     if not doc:
@@ -22,6 +45,7 @@ def fetch_mastodon_document(host):
     return parse_mastodon_document(doc, host)
 
 
+@shared_in_scope
 def fetch_matrix_document(host: str) -> Optional[Dict]:
     doc, status_code, error = fetch_document(host=host, path='/_matrix/federation/v1/version')
     if not doc:
@@ -33,9 +57,15 @@ def fetch_matrix_document(host: str) -> Optional[Dict]:
     return parse_matrix_document(doc, host)
 
 
-def fetch_misskey_document(host: str, mastodon_document: Dict=None) -> Optional[Dict]:
+@shared_in_scope
+def fetch_misskey_document(host: str, mastodon_document: Dict=None, timeout: int = 10) -> Optional[Dict]:
+    timeout = get_request_timeout(timeout)
+    if timeout <= 0:
+        return
     try:
-        response = requests.post(f'https://{host}/api/meta')  # ¯\_(ツ)_/¯
+        response = requests.post(
+            f'https://{host}/api/meta', headers={'user-agent': USER_AGENT}, timeout=timeout,
+        )  # ¯\_(ツ)_/¯
     except Exception:
         return
     try:
@@ -46,6 +76,7 @@ def fetch_misskey_document(host: str, mastodon_document: Dict=None) -> Optional[
         return parse_misskey_document(doc, host, mastodon_document=mastodon_document)
 
 
+@shared_in_scope
 def fetch_nodeinfo_document(host):
     doc, status_code, error = fetch_document(host=host, path='/.well-known/nodeinfo')
     if not doc:
@@ -82,6 +113,7 @@ def fetch_nodeinfo_document(host):
     return parse_nodeinfo_document(doc, host)
 
 
+@shared_in_scope
 def fetch_nodeinfo2_document(host):
     doc, status_code, error = fetch_document(host=host, path='/.well-known/x-nodeinfo2')
     if not doc:
@@ -93,6 +125,7 @@ def fetch_nodeinfo2_document(host):
     return parse_nodeinfo2_document(doc, host)
 
 
+@shared_in_scope
 def fetch_statisticsjson_document(host):
     doc, status_code, error = fetch_document(host=host, path='/statistics.json')
     if not doc:
@@ -1,13 +1,14 @@
-import json
 import os
 import warnings
 from base64 import b64encode
+from functools import lru_cache
 from string import Template
 
-from jsonschema import validate
 from jsonschema.exceptions import ValidationError
 from xrd import XRD, Link, Element
 
+from federation.hostmeta.serializers import XRDTemplate, serialize_xrd
+from federation.hostmeta.validation import render_document, validate_document
 from federation.utils.django import get_configuration
 
 
@@ -112,10 +113,24 @@ def generate_hcard(template=None, **kwargs):
 
 class BaseHostMeta:
     def __init__(self, *args, **kwargs):
-        self.xrd = XRD()
+        self._xrd = None
+
+    @property
+    def xrd(self):
+        """The XRD document, built on first access."""
+        if self._xrd is None:
+            self._xrd = self.build_xrd()
+        return self._xrd
+
+    @xrd.setter
+    def xrd(self, value):
+        self._xrd = value
+
+    def build_xrd(self):
+        return XRD()
 
     def render(self):
-        return self.xrd.to_xml().toprettyxml(indent="  ", encoding="UTF-8")
+        return serialize_xrd(self.xrd).encode("UTF-8")
 
 
 class DiasporaHostMeta(BaseHostMeta):
@@ -127,12 +142,27 @@ class DiasporaHostMeta(BaseHostMeta):
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.webfinger_host = kwargs["webfinger_host"]
+
+    def build_xrd(self):
+        xrd = super().build_xrd()
         link = Link(
             rel='lrdd',
             type_='application/xrd+xml',
-            template='%s/webfinger?q={uri}' % kwargs["webfinger_host"]
+            template='%s/webfinger?q={uri}' % self.webfinger_host
         )
-        self.xrd.links.append(link)
+        xrd.links.append(link)
+        return xrd
+
+    def render(self):
+        if self._xrd is not None:
+            return super().render()
+        return _render_diaspora_host_meta(self.webfinger_host)
+
+
+@lru_cache(maxsize=32)
+def _render_diaspora_host_meta(webfinger_host):
+    return serialize_xrd(DiasporaHostMeta(webfinger_host=webfinger_host).build_xrd()).encode("UTF-8")
 
 
 class BaseLegacyWebFinger(BaseHostMeta):
@@ -142,8 +172,13 @@ class BaseLegacyWebFinger(BaseHostMeta):
     """
     def __init__(self, address, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        subject = Element("Subject", "acct:%s" % address)
-        self.xrd.elements.append(subject)
+        self.address = address
+
+    def build_xrd(self):
+        xrd = super().build_xrd()
+        subject = Element("Subject", "acct:%s" % self.address)
+        xrd.elements.append(subject)
+        return xrd
 
 
 class DiasporaWebFinger(BaseLegacyWebFinger):
@@ -155,56 +190,89 @@ class DiasporaWebFinger(BaseLegacyWebFinger):
     * host (str)          - eg https://domain.tld
     * guid (str)          - guid of user
     * public_key (str)    - public key
+
+    The document is rendered by filling a template built once per host.
     """
     def __init__(self, handle, host, guid, public_key, *args, **kwargs):
         super().__init__(handle, *args, **kwargs)
-        self.xrd.elements.append(Element("Alias", "%s/people/%s" % (
+        self.host = host
+        self.guid = guid
+        self.public_key = public_key
+
+    def get_values(self):
+        # Base64 the key
+        # See https://wiki.diasporafoundation.org/Federation_Protocol_Overview#Diaspora_Public_Key
+        try:
+            base64_key = b64encode(bytes(self.public_key, encoding="UTF-8")).decode("ascii")
+        except TypeError:
+            # Python 2
+            base64_key = b64encode(self.public_key).decode("ascii")
+        return {
+            "address": self.address,
+            "guid": self.guid,
+            "username": self.address.split("@")[0],
+            "public_key": base64_key,
+        }
+
+    def build_xrd(self):
+        return self.build_template_xrd(self.host, **self.get_values())
+
+    @staticmethod
+    def build_template_xrd(host, address, guid, username, public_key):
+        xrd = XRD()
+        xrd.elements.append(Element("Subject", "acct:%s" % address))
+        xrd.elements.append(Element("Alias", "%s/people/%s" % (
             host, guid
         )))
-        username = handle.split("@")[0]
-        self.xrd.links.append(Link(
+        xrd.links.append(Link(
             rel="http://microformats.org/profile/hcard",
             type_="text/html",
             href="%s/hcard/users/%s" %(
                 host, guid
             )
         ))
-        self.xrd.links.append(Link(
+        xrd.links.append(Link(
             rel="http://joindiaspora.com/seed_location",
             type_="text/html",
             href=host
         ))
-        self.xrd.links.append(Link(
+        xrd.links.append(Link(
             rel="http://joindiaspora.com/guid",
             type_="text/html",
             href=guid
         ))
-        self.xrd.links.append(Link(
+        xrd.links.append(Link(
             rel="http://webfinger.net/rel/profile-page",
             type_="text/html",
             href="%s/u/%s" % (
                 host, username
             )
         ))
-        self.xrd.links.append(Link(
+        xrd.links.append(Link(
             rel="http://schemas.google.com/g/2010#updates-from",
             type_="application/atom+xml",
             href="%s/public/%s.atom" % (
                 host, username
             )
         ))
-        # Base64 the key
-        # See https://wiki.diasporafoundation.org/Federation_Protocol_Overview#Diaspora_Public_Key
-        try:
-            base64_key = b64encode(bytes(public_key, encoding="UTF-8")).decode("ascii")
-        except TypeError:
-            # Python 2
-            base64_key = b64encode(public_key).decode("ascii")
-        self.xrd.links.append(Link(
+        xrd.links.append(Link(
             rel="diaspora-public-key",
             type_="RSA",
-            href=base64_key
+            href=public_key
         ))
+        return xrd
+
+    def render(self):
+        if self._xrd is not None:
+            return super().render()
+        return _get_diaspora_webfinger_template(self.host).fill(**self.get_values()).encode("UTF-8")
+
+
+@lru_cache(maxsize=32)
+def _get_diaspora_webfinger_template(host):
+    return XRDTemplate(DiasporaWebFinger.build_template_xrd(host, **{
+        name: XRDTemplate.placeholder(name) for name in ("address", "guid", "username", "public_key")
+    }))
 
 
 class DiasporaHCard:
@@ -254,14 +322,10 @@ class SocialRelayWellKnown:
         }
 
     def render(self):
-        self.validate_doc()
-        return json.dumps(self.doc)
+        return render_document(self.doc, "social-relay-well-known")
 
-    def validate_doc(self):
-        schema_path = os.path.join(os.path.dirname(__file__), "schemas", "social-relay-well-known.json")
-        with open(schema_path) as f:
-            schema = json.load(f)
-        validate(self.doc, schema)
+    def validate_doc(self, rendered=None):
+        validate_document(self.doc, "social-relay-well-known", rendered=rendered)
 
 
 class NodeInfo:
@@ -292,16 +356,29 @@ class NodeInfo:
         self.raise_on_validate = raise_on_validate
 
     def render(self):
-        if not self.skip_validate:
-            self.validate_doc()
-        return json.dumps(self.doc)
-
-    def validate_doc(self):
-        schema_path = os.path.join(os.path.dirname(__file__), "schemas", "nodeinfo-1.0.json")
-        with open(schema_path) as f:
-            schema = json.load(f)
+        """
+        Render the document as JSON.
+
+        Unchanged documents are not rendered or validated again, see ``federation.hostmeta.validation``.
+        """
+        if self.skip_validate:
+            return render_document(self.doc)
+        try:
+            return render_document(self.doc, "nodeinfo-1.0")
+        except ValidationError:
+            if self.raise_on_validate:
+                raise
+            warnings.warn("NodeInfo document generated does not validate against NodeInfo 1.0 specification.")
+        return render_document(self.doc)
+
+    def validate_doc(self, rendered=None):
+        """
+        Validate the document against the NodeInfo 1.0 schema.
+
+        If the rendered document is given, a valid document is not validated again when rendered next time.
+        """
         try:
-            validate(self.doc, schema)
+            validate_document(self.doc, "nodeinfo-1.0", rendered=rendered)
         except ValidationError:
             if self.raise_on_validate:
                 raise
@@ -0,0 +1,94 @@
+"""
+Direct serialization of XRD documents.
+
+Produces the same document as pretty printing the ``minidom`` tree of ``python-xrd`` with two space indentation,
+with attributes in alphabetical order, without building the tree.
+"""
+from typing import List
+
+from xrd import XRD, XRD_NAMESPACE
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+INDENT = "  "
+
+
+def escape(value: str) -> str:
+    """Escape text or an attribute value, the same way as ``minidom``."""
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;").replace(">", "&gt;")
+
+
+def _attributes(attributes: List) -> str:
+    return "".join(' %s="%s"' % (name, escape(value)) for name, value in sorted(attributes))
+
+
+def _text_element(lines: List[str], indent: str, name: str, text: str, attributes: List = ()) -> None:
+    lines.append('%s<%s%s>%s</%s>\n' % (indent, name, _attributes(attributes), escape(text), name))
+
+
+def _property(lines: List[str], indent: str, prop) -> None:
+    if prop.value:
+        _text_element(lines, indent, "Property", str(prop.value), [("type", prop.type)])
+    else:
+        lines.append('%s<Property%s/>\n' % (indent, _attributes([("type", prop.type), ("xsi:nil", "true")])))
+
+
+def serialize_xrd(xrd: XRD) -> str:
+    """Serialize an XRD document to XML text."""
+    attributes = [("xmlns", XRD_NAMESPACE)]
+    if xrd.xml_id:
+        attributes.append(("xml:id", xrd.xml_id))
+    attributes.extend((attr.name, attr.value) for attr in xrd.attributes)
+    lines = [XML_DECLARATION, "<XRD%s>\n" % _attributes(attributes)]
+    if xrd.expires:
+        _text_element(lines, INDENT, "Expires", xrd.expires.isoformat())
+    if xrd.subject:
+        _text_element(lines, INDENT, "Subject", xrd.subject)
+    for alias in xrd.aliases:
+        _text_element(lines, INDENT, "Alias", alias)
+    for prop in xrd.properties:
+        _property(lines, INDENT, prop)
+    for element in xrd.elements:
+        _text_element(lines, INDENT, element.name, element.value)
+    for link in xrd.links:
+        if link.href and link.template:
+            raise ValueError('only one of href or template attributes may be specified')
+        link_attributes = [
+            (name, value) for name, value in (
+                ("rel", link.rel), ("type", link.type), ("href", link.href), ("template", link.template),
+            ) if value
+        ]
+        if not link.titles and not link.properties:
+            lines.append("%s<Link%s/>\n" % (INDENT, _attributes(link_attributes)))
+            continue
+        lines.append("%s<Link%s>\n" % (INDENT, _attributes(link_attributes)))
+        for title in link.titles:
+            title_attributes = [("xml:lang", title.xml_lang)] if title.xml_lang else []
+            _text_element(lines, INDENT * 2, "Title", str(title), title_attributes)
+        for prop in link.properties:
+            _property(lines, INDENT * 2, prop)
+        lines.append("%s</Link>\n" % INDENT)
+    lines.append("</XRD>\n")
+    return "".join(lines)
+
+
+class XRDTemplate:
+    """
+    An XRD document with placeholders, serialized once and filled per document.
+
+    Build the XRD with ``placeholder(name)`` in place of values. Filling escapes the values.
+    """
+    MARKER = "\x00"
+
+    def __init__(self, xrd: XRD):
+        # Static parts and placeholder names alternate
+        self.parts = serialize_xrd(xrd).split(self.MARKER)
+
+    @classmethod
+    def placeholder(cls, name: str) -> str:
+        return "%s%s%s" % (cls.MARKER, name, cls.MARKER)
+
+    def fill(self, **values: str) -> str:
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = escape(values[parts[i]])
+        return "".join(parts)
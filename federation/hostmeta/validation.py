@@ -0,0 +1,119 @@
+"""
+Validation of generated documents against the schemas in ``schemas/``.
+
+Each schema is loaded and compiled into a validator once. ``render_document`` remembers valid rendered documents by
+their content, so rendering an unchanged document again, like NodeInfo under crawler load, does no JSON or schema
+work at all.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Dict, Hashable
+
+from jsonschema.validators import validator_for
+
+SCHEMA_DIRECTORY = os.path.join(os.path.dirname(__file__), "schemas")
+
+# How many validated documents to remember
+VALIDATED_DOCUMENTS_SIZE = 256
+# How many rendered documents to remember
+RENDERED_DOCUMENTS_SIZE = 256
+
+_validators = {}
+_validated = OrderedDict()
+_rendered = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_schema_validator(name: str):
+    """
+    Get the validator of a schema, loading and compiling the schema on first use.
+
+    :arg name: Schema file name without the ``.json`` extension, for example ``nodeinfo-1.0``.
+    """
+    validator = _validators.get(name)
+    if validator is None:
+        with open(os.path.join(SCHEMA_DIRECTORY, "%s.json" % name)) as f:
+            schema = json.load(f)
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        with _lock:
+            validator = _validators.setdefault(name, cls(schema))
+    return validator
+
+
+def validate_document(doc: Dict, schema: str, rendered: str = None) -> None:
+    """
+    Validate a document against a schema.
+
+    :arg doc: Document to validate.
+    :arg schema: Schema name, see ``get_schema_validator``.
+    :arg rendered: (Optional) The document rendered as JSON. If given, valid documents are remembered by a hash of
+        the rendered document and not validated again.
+    :raises jsonschema.exceptions.ValidationError: If the document is not valid.
+    """
+    if rendered is None:
+        get_schema_validator(schema).validate(doc)
+        return
+    key = (schema, sha256(rendered.encode("utf-8")).digest())
+    with _lock:
+        if key in _validated:
+            _validated.move_to_end(key)
+            return
+    get_schema_validator(schema).validate(doc)
+    with _lock:
+        _validated[key] = True
+        while len(_validated) > VALIDATED_DOCUMENTS_SIZE:
+            _validated.popitem(last=False)
+
+
+def _freeze(value) -> Hashable:
+    # Types are kept, so for example `True` and `1` that render differently get different keys
+    if isinstance(value, dict):
+        return dict, tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return list, tuple(_freeze(item) for item in value)
+    return type(value), value
+
+
+def render_document(doc: Dict, schema: str = None) -> str:
+    """
+    Render a document as JSON, validating it against a schema.
+
+    Valid rendered documents are remembered by their content. Rendering an equal document again returns the
+    remembered rendering without rendering or validating it. Invalid documents are not remembered.
+
+    :arg doc: Document to render.
+    :arg schema: (Optional) Schema name, see ``get_schema_validator``. If not given, the document is not validated.
+    :raises jsonschema.exceptions.ValidationError: If the document is not valid.
+    """
+    try:
+        key = (schema, _freeze(doc))
+        hash(key)
+    except TypeError:
+        # Values that can't be hashed, don't remember the document
+        key = None
+    if key is not None:
+        with _lock:
+            rendered = _rendered.get(key)
+            if rendered is not None:
+                _rendered.move_to_end(key)
+                return rendered
+    rendered = json.dumps(doc)
+    if schema:
+        get_schema_validator(schema).validate(doc)
+    if key is not None:
+        with _lock:
+            _rendered[key] = rendered
+            while len(_rendered) > RENDERED_DOCUMENTS_SIZE:
+                _rendered.popitem(last=False)
+    return rendered
+
+
+def clear_validated_documents() -> None:
+    """Forget the documents that have been validated and rendered."""
+    with _lock:
+        _validated.clear()
+        _rendered.clear()
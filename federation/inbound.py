@@ -1,8 +1,9 @@
 import importlib
 import logging
-from typing import Tuple, List, Callable
+from typing import Tuple, List, Callable, Optional
 
 from federation import identify_protocol_by_request
+from federation.effects import SideEffectExecutor, dispatch_side_effects, run_side_effect_in_background
 from federation.types import UserType, RequestType
 
 logger = logging.getLogger("federation")
@@ -12,7 +13,10 @@ def handle_receive(
         request: RequestType,
         user: UserType = None,
         sender_key_fetcher: Callable[[str], str] = None,
-        skip_author_verification: bool = False
+        skip_author_verification: bool = False,
+        sender_filter: Callable[[str], bool] = None,
+        lazy: bool = False,
+        side_effect_executor: Optional[SideEffectExecutor] = run_side_effect_in_background,
 ) -> Tuple[str, str, List]:
     """Takes a request and passes it to the correct protocol.
 
@@ -30,7 +34,21 @@ def handle_receive(
         MUST have a `private_key` and `id` if given.
     :arg sender_key_fetcher: Function that accepts sender handle and returns public key (optional)
     :arg skip_author_verification: Don't verify sender (test purposes, false default)
+    :arg sender_filter: Function that accepts sender id and returns ``False`` if the payload should be rejected.
+        Called right after the sender is extracted, before any key fetching or signature verification.
+        See ``federation.utils.admission.SenderFilter`` for a ready domain based filter. (optional)
+    :arg lazy: Compute values of the entities that take work, like the receivers, mentions and for ActivityPub the
+        content converted from HTML and the attachments, only when they are first accessed. The entities are still
+        verified and validated before returning, so signatures are still checked and the sender keys fetched. See
+        ``federation.entities.lazy``. (false default)
+    :arg side_effect_executor: Where to dispatch side effects of the received entities to, for example sending an
+        automatic Accept for a Follow. Either a function that takes a ``federation.effects.SideEffect`` or a
+        ``concurrent.futures.Executor``. By default side effects are run on a shared background thread pool, see
+        ``federation.effects.run_side_effect_in_background``, and ``handle_receive`` doesn't wait for them. Pass
+        ``federation.effects.run_side_effect`` to run them before returning, or ``None`` to leave
+        them on the entities and dispatch them later with ``federation.effects.dispatch_side_effects``. (optional)
     :returns: Tuple of sender id, protocol name and list of entity objects
+    :raises SenderNotAllowedError: If ``sender_filter`` rejects the sender
     """
     logger.debug("handle_receive: processing request: %s", request)
     found_protocol = identify_protocol_by_request(request)
@@ -38,11 +56,15 @@ def handle_receive(
     logger.debug("handle_receive: using protocol %s", found_protocol.PROTOCOL_NAME)
     protocol = found_protocol.Protocol()
     sender, message = protocol.receive(
-        request, user, sender_key_fetcher, skip_author_verification=skip_author_verification)
+        request, user, sender_key_fetcher, skip_author_verification=skip_author_verification,
+        sender_filter=sender_filter,
+    )
     logger.debug("handle_receive: sender %s, message %s", sender, message)
 
     mappers = importlib.import_module("federation.entities.%s.mappers" % found_protocol.PROTOCOL_NAME)
-    entities = mappers.message_to_objects(message, sender, sender_key_fetcher, user)
+    entities = mappers.message_to_objects(message, sender, sender_key_fetcher, user, lazy=lazy)
     logger.debug("handle_receive: entities %s", entities)
+    if side_effect_executor is not None:
+        dispatch_side_effects(entities, side_effect_executor)
 
     return sender, found_protocol.PROTOCOL_NAME, entities
@@ -10,6 +10,7 @@ from iteration_utilities import unique_everseen
 
 from federation.entities.activitypub.constants import NAMESPACE_PUBLIC
 from federation.entities.mixins import BaseEntity
+from federation.protocols.activitypub.ld_signatures import sign_document
 from federation.protocols.activitypub.signing import get_http_authentication
 from federation.types import UserType
 from federation.utils.network import send_document
@@ -117,6 +118,7 @@ def handle_send(
     public_payloads = {
         "activitypub": {
             "auth": None,
+            "fids": [],
             "payload": None,
             "urls": set(),
         },
@@ -142,18 +144,17 @@ def handle_send(
         public = recipient["public"]
 
         if protocol == "activitypub":
+            if public:
+                # Public recipients share one payload, so that it is signed only once
+                if fid not in public_payloads[protocol]["fids"]:
+                    public_payloads[protocol]["fids"].append(fid)
+                public_payloads[protocol]["urls"].add(endpoint)
+                continue
             try:
                 payload = handle_create_payload(entity, author_user, protocol, parent_user=parent_user)
-                if public:
-                    payload["to"] = [NAMESPACE_PUBLIC]
-                    payload["cc"] = [fid]
-                    if isinstance(payload.get("object"), dict):
-                        payload["object"]["to"] = [NAMESPACE_PUBLIC]
-                        payload["object"]["cc"] = [fid]
-                else:
-                    payload["to"] = [fid]
-                    if isinstance(payload.get("object"), dict):
-                        payload["object"]["to"] = [fid]
+                payload["to"] = [fid]
+                if isinstance(payload.get("object"), dict):
+                    payload["object"]["to"] = [fid]
                 payload = json.dumps(payload).encode("utf-8")
             except Exception as ex:
                 logger.error("handle_send - failed to generate payload for %s, %s: %s", fid, endpoint, ex)
@@ -194,6 +195,31 @@ def handle_send(
                     "urls": {endpoint}, "payload": payload, "content_type": "application/json", "auth": None,
                 })
 
+    # Add public activitypub payload
+    if public_payloads["activitypub"]["urls"]:
+        fids = public_payloads["activitypub"]["fids"]
+        try:
+            payload = handle_create_payload(entity, author_user, "activitypub", parent_user=parent_user)
+            payload["to"] = [NAMESPACE_PUBLIC]
+            payload["cc"] = fids
+            if isinstance(payload.get("object"), dict):
+                payload["object"]["to"] = [NAMESPACE_PUBLIC]
+                payload["object"]["cc"] = fids
+            try:
+                sign_document(payload, author_user.rsa_private_key, f"{author_user.id}#main-key")
+            except Exception as ex:
+                logger.warning("handle_send - failed to add LD signature to public payload: %s", ex)
+            public_payloads["activitypub"]["payload"] = json.dumps(payload).encode("utf-8")
+        except Exception as ex:
+            logger.error("handle_send - failed to generate public payload for %s: %s", fids, ex)
+        else:
+            payloads.append({
+                "auth": get_http_authentication(author_user.rsa_private_key, f"{author_user.id}#main-key"),
+                "payload": public_payloads["activitypub"]["payload"],
+                "content_type": 'application/ld+json; profile="https://www.w3.org/ns/activitystreams"',
+                "urls": public_payloads["activitypub"]["urls"],
+            })
+
     # Add public diaspora payload
     if public_payloads["diaspora"]["payload"]:
         payloads.append({
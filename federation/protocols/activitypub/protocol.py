@@ -7,9 +7,11 @@ from Crypto.PublicKey.RSA import RsaKey
 
 from federation.entities.activitypub.enums import ActorType
 from federation.entities.mixins import BaseEntity
+from federation.exceptions import SenderNotAllowedError
+from federation.protocols.activitypub.ld_signatures import get_ld_signature_creator, verify_ld_signature
 from federation.protocols.activitypub.signing import verify_request_signature
 from federation.types import UserType, RequestType
-from federation.utils.text import decode_if_bytes
+from federation.utils.text import as_bytes
 
 logger = logging.getLogger('federation')
 
@@ -26,10 +28,15 @@ def identify_id(id: str) -> bool:
 def identify_request(request: RequestType) -> bool:
     """
     Try to identify whether this is an ActivityPub request.
+
+    The body is only parsed if it mentions a context.
     """
+    body = as_bytes(request.body)
+    if b"@context" not in body:
+        return False
     # noinspection PyBroadException
     try:
-        data = json.loads(decode_if_bytes(request.body))
+        data = json.loads(body)
         if "@context" in data:
             return True
     except Exception:
@@ -71,22 +78,31 @@ class Protocol:
             request: RequestType,
             user: UserType = None,
             sender_key_fetcher: Callable[[str], str] = None,
-            skip_author_verification: bool = False) -> Tuple[str, dict]:
+            skip_author_verification: bool = False,
+            sender_filter: Callable[[str], bool] = None) -> Tuple[str, dict]:
         """
         Receive a request.
 
         For testing purposes, `skip_author_verification` can be passed. Authorship will not be verified.
+
+        If `sender_filter` is given, it is called with the actor before the signature is verified.
         """
         self.user = user
         self.get_contact_key = sender_key_fetcher
-        self.payload = json.loads(decode_if_bytes(request.body))
+        self.payload = json.loads(as_bytes(request.body))
         self.request = request
         self.extract_actor()
+        if sender_filter and not sender_filter(self.actor):
+            raise SenderNotAllowedError(f"Sender {self.actor} was rejected by the sender filter")
         # Verify the message is from who it claims to be
         if not skip_author_verification:
             self.verify_signature()
         return self.actor, self.payload
 
     def verify_signature(self):
+        public_key = self.get_contact_key(self.actor)
+        # A valid LD signature by the actor proves authorship, also when the payload was relayed by someone else
+        if get_ld_signature_creator(self.payload) and verify_ld_signature(self.payload, public_key):
+            return
         # Verify the HTTP signature
-        verify_request_signature(self.request, self.get_contact_key(self.actor))
+        verify_request_signature(self.request, public_key)
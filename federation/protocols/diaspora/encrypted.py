@@ -1,9 +1,12 @@
 import json
 from base64 import b64decode, b64encode
 
-from Crypto.Cipher import PKCS1_v1_5, AES
 from Crypto.Random import get_random_bytes
-from lxml import etree
+
+from federation.protocols.diaspora.parsing import parse_magic_envelope
+from federation.utils.crypto import get_crypto_backend
+
+AES_BLOCK_SIZE = 16
 
 
 def pkcs7_pad(inp, block_size):
@@ -41,15 +44,14 @@ class EncryptedPayload:
     @staticmethod
     def decrypt(payload, private_key):
         """Decrypt an encrypted JSON payload and return the Magic Envelope document inside."""
-        cipher = PKCS1_v1_5.new(private_key)
-        aes_key_str = cipher.decrypt(b64decode(payload.get("aes_key")), sentinel=None)
+        backend = get_crypto_backend()
+        aes_key_str = backend.decrypt(private_key, b64decode(payload.get("aes_key")))
         aes_key = json.loads(aes_key_str.decode("utf-8"))
         key = b64decode(aes_key.get("key"))
         iv = b64decode(aes_key.get("iv"))
         encrypted_magic_envelope = b64decode(payload.get("encrypted_magic_envelope"))
-        encrypter = AES.new(key, AES.MODE_CBC, iv)
-        content = encrypter.decrypt(encrypted_magic_envelope)
-        return etree.fromstring(pkcs7_unpad(content))
+        content = backend.aes_decrypt(key, iv, encrypted_magic_envelope)
+        return parse_magic_envelope(pkcs7_unpad(content))
 
     @staticmethod
     def get_aes_key_json(iv, key):
@@ -59,11 +61,10 @@ class EncryptedPayload:
         }).encode("utf-8")
 
     @staticmethod
-    def get_iv_key_encrypter():
-        iv = get_random_bytes(AES.block_size)
+    def get_iv_key():
+        iv = get_random_bytes(AES_BLOCK_SIZE)
         key = get_random_bytes(32)
-        encrypter = AES.new(key, AES.MODE_CBC, iv)
-        return iv, key, encrypter
+        return iv, key
 
     @staticmethod
     def encrypt(payload, public_key):
@@ -76,12 +77,12 @@ class EncryptedPayload:
         :param public_key: Public key of recipient as an RSA object.
         :return: Encrypted JSON wrapper as dict.
         """
-        iv, key, encrypter = EncryptedPayload.get_iv_key_encrypter()
+        backend = get_crypto_backend()
+        iv, key = EncryptedPayload.get_iv_key()
         aes_key_json = EncryptedPayload.get_aes_key_json(iv, key)
-        cipher = PKCS1_v1_5.new(public_key)
-        aes_key = b64encode(cipher.encrypt(aes_key_json))
-        padded_payload = pkcs7_pad(payload.encode("utf-8"), AES.block_size)
-        encrypted_me = b64encode(encrypter.encrypt(padded_payload))
+        aes_key = b64encode(backend.encrypt(public_key, aes_key_json))
+        padded_payload = pkcs7_pad(payload.encode("utf-8"), AES_BLOCK_SIZE)
+        encrypted_me = b64encode(backend.aes_encrypt(key, iv, padded_payload))
         return {
             "aes_key": aes_key.decode("utf-8"),
             "encrypted_magic_envelope": encrypted_me.decode("utf8"),
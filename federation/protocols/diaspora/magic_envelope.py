@@ -1,16 +1,35 @@
 from base64 import urlsafe_b64encode, b64encode, urlsafe_b64decode
+from binascii import a2b_base64
 
-from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
 from lxml import etree
 
 from federation.exceptions import SignatureVerificationError
+from federation.protocols.diaspora.parsing import fromstring, parse_magic_envelope
+from federation.utils.crypto import get_crypto_backend
 from federation.utils.diaspora import fetch_public_key
-from federation.utils.text import decode_if_bytes
+from federation.utils.text import as_bytes, lstrip_bytes
 
 NAMESPACE = "http://salmon-protocol.org/ns/magic-env"
 
+# Signed data after the payload: data type, encoding and algorithm, base64 encoded
+SIGNATURE_SUFFIX = ".".join([
+    "",
+    b64encode(b"application/xml").decode("ascii"),
+    b64encode(b"base64url").decode("ascii"),
+    b64encode(b"RSA-SHA256").decode("ascii"),
+])
+
+_base64url_to_base64 = str.maketrans("-_", "+/")
+
+
+def decode_data(data: str) -> bytes:
+    """
+    Decode the base64url encoded text of a ``me:data`` element.
+
+    The text is translated to the standard base64 alphabet and decoded as is, without encoding it to bytes first.
+    """
+    return a2b_base64(data.translate(_base64url_to_base64))
+
 
 class MagicEnvelope:
     """Diaspora protocol magic envelope.
@@ -38,7 +57,8 @@ class MagicEnvelope:
         """
         All parameters are optional. Some are required for signing, some for opening.
 
-        :param message: Message string. Required to create a MagicEnvelope document.
+        :param message: Message string. Required to create a MagicEnvelope document. Can also be given as an XML
+            element, which is then serialized only once.
         :param private_key: Private key RSA object.
         :param author_handle: Author signing the Magic Envelope, owns the private key.
         :param payload: Magic Envelope payload as str or bytes.
@@ -65,9 +85,7 @@ class MagicEnvelope:
             self.verify()
 
     def extract_payload(self):
-        payload = decode_if_bytes(self.payload)
-        payload = payload.lstrip().encode("utf-8")
-        self.doc = etree.fromstring(payload)
+        self.doc = parse_magic_envelope(lstrip_bytes(as_bytes(self.payload)))
         self.author_handle = self.get_sender(self.doc)
         self.message = self.message_from_doc()
 
@@ -98,29 +116,28 @@ class MagicEnvelope:
     def message_from_doc(self):
         message = self.doc.find(
             ".//{http://salmon-protocol.org/ns/magic-env}data").text
-        return urlsafe_b64decode(message.encode("ascii"))
+        return decode_data(message)
 
     def create_payload(self):
         """Create the payload doc.
 
+        A message given as an XML element is serialized directly. A message string is parsed first, to ensure it
+        is valid XML.
+
         Returns:
             str
         """
-        doc = etree.fromstring(self.message)
-        self.payload = etree.tostring(doc, encoding="utf-8")
-        self.payload = urlsafe_b64encode(self.payload).decode("ascii")
+        if isinstance(self.message, etree._Element):
+            payload = etree.tostring(self.message, encoding="utf-8")
+        else:
+            payload = etree.tostring(fromstring(self.message), encoding="utf-8")
+        self.payload = urlsafe_b64encode(payload).decode("ascii")
         return self.payload
 
     def _build_signature(self):
         """Create the signature using the private key."""
-        sig_contents = \
-            self.payload + "." + \
-            b64encode(b"application/xml").decode("ascii") + "." + \
-            b64encode(b"base64url").decode("ascii") + "." + \
-            b64encode(b"RSA-SHA256").decode("ascii")
-        sig_hash = SHA256.new(sig_contents.encode("ascii"))
-        cipher = PKCS1_v1_5.new(self.private_key)
-        sig = urlsafe_b64encode(cipher.sign(sig_hash))
+        sig_contents = (self.payload + SIGNATURE_SUFFIX).encode("ascii")
+        sig = urlsafe_b64encode(get_crypto_backend().sign(self.private_key, sig_contents))
         key_id = urlsafe_b64encode(bytes(self.author_handle, encoding="utf-8"))
         return sig, key_id
 
@@ -145,13 +162,6 @@ class MagicEnvelope:
             self.fetch_public_key()
         data = self.doc.find(".//{http://salmon-protocol.org/ns/magic-env}data").text
         sig = self.doc.find(".//{http://salmon-protocol.org/ns/magic-env}sig").text
-        sig_contents = '.'.join([
-            data,
-            b64encode(b"application/xml").decode("ascii"),
-            b64encode(b"base64url").decode("ascii"),
-            b64encode(b"RSA-SHA256").decode("ascii")
-        ])
-        sig_hash = SHA256.new(sig_contents.encode("ascii"))
-        cipher = PKCS1_v1_5.new(RSA.importKey(self.public_key))
-        if not cipher.verify(sig_hash, urlsafe_b64decode(sig)):
+        sig_contents = (data + SIGNATURE_SUFFIX).encode("ascii")
+        if not get_crypto_backend().verify(self.public_key, sig_contents, urlsafe_b64decode(sig)):
             raise SignatureVerificationError("Signature cannot be verified using the given public key")
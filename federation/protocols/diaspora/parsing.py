@@ -0,0 +1,140 @@
+"""
+Hardened XML parsing for Diaspora payloads.
+
+All Diaspora documents are parsed with the same parser configuration. Entities are never resolved, DTD's are
+not loaded and no network access is done. Documents are checked against a size and depth limit.
+"""
+import threading
+from io import BytesIO
+from typing import Union
+
+from lxml import etree
+
+from federation.utils.text import encode_if_text
+
+MAGIC_ENV_NAMESPACE = "http://salmon-protocol.org/ns/magic-env"
+
+# Maximum size of a document in bytes
+MAX_DOCUMENT_SIZE = 10 * 1024 * 1024
+# Maximum element nesting depth of a document
+MAX_DOCUMENT_DEPTH = 32
+# Magic envelopes larger than this (in bytes) are parsed incrementally
+STREAMING_THRESHOLD = 512 * 1024
+
+# Envelope elements kept when parsing a magic envelope incrementally
+ENVELOPE_TAGS = frozenset((
+    "{%s}data" % MAGIC_ENV_NAMESPACE,
+    "{%s}encoding" % MAGIC_ENV_NAMESPACE,
+    "{%s}alg" % MAGIC_ENV_NAMESPACE,
+    "{%s}sig" % MAGIC_ENV_NAMESPACE,
+))
+
+PARSER_OPTIONS = {
+    "collect_ids": False,
+    "huge_tree": False,
+    "load_dtd": False,
+    "no_network": True,
+    "resolve_entities": False,
+}
+
+_local = threading.local()
+_depth_checks = {}
+
+
+def get_parser() -> etree.XMLParser:
+    """
+    Get the hardened parser.
+
+    Parsers are not safe to share between threads, so one parser is created per thread and reused.
+    """
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(**PARSER_OPTIONS)
+    return parser
+
+
+def _exceeds_depth(doc: etree._Element, max_depth: int) -> bool:
+    check = _depth_checks.get(max_depth)
+    if check is None:
+        # An element exists at depth `max_depth + 1` only if the document is too deep
+        check = _depth_checks[max_depth] = etree.XPath("boolean(%s)" % ("/*" * (max_depth + 1)))
+    return check(doc)
+
+
+def _check_size(document: bytes, max_size: int) -> None:
+    if len(document) > max_size:
+        raise ValueError("XML document size %s exceeds the maximum of %s bytes" % (len(document), max_size))
+
+
+def fromstring(
+        document: Union[str, bytes], max_size: int = MAX_DOCUMENT_SIZE, max_depth: int = MAX_DOCUMENT_DEPTH,
+) -> etree._Element:
+    """
+    Parse an XML document using the hardened parser.
+
+    :arg document: XML document as str or bytes.
+    :arg max_size: Maximum size of the document in bytes.
+    :arg max_depth: Maximum element nesting depth.
+    :returns: Root element of the document.
+    :raises ValueError: If the document is too large or too deep.
+    :raises lxml.etree.XMLSyntaxError: If the document cannot be parsed.
+    """
+    document = encode_if_text(document)
+    _check_size(document, max_size)
+    doc = etree.fromstring(document, parser=get_parser())
+    if _exceeds_depth(doc, max_depth):
+        raise ValueError("XML document exceeds the maximum depth of %s" % max_depth)
+    return doc
+
+
+def iterparse_magic_envelope(
+        document: Union[str, bytes], max_size: int = MAX_DOCUMENT_SIZE, max_depth: int = MAX_DOCUMENT_DEPTH,
+) -> etree._Element:
+    """
+    Parse a magic envelope incrementally.
+
+    Only the envelope elements (``me:data``, ``me:sig``, ``me:encoding`` and ``me:alg``) are kept. Everything
+    else is discarded as soon as it has been parsed, so the full tree is never held in memory.
+
+    :arg document: Magic envelope document as str or bytes.
+    :arg max_size: Maximum size of the document in bytes.
+    :arg max_depth: Maximum element nesting depth.
+    :returns: An envelope element containing only the envelope elements.
+    :raises ValueError: If the document is too large or too deep.
+    :raises lxml.etree.XMLSyntaxError: If the document cannot be parsed.
+    """
+    document = encode_if_text(document)
+    _check_size(document, max_size)
+    envelope = None
+    depth = 0
+    for event, element in etree.iterparse(BytesIO(document), events=("start", "end"), **PARSER_OPTIONS):
+        if event == "start":
+            depth += 1
+            if depth > max_depth:
+                raise ValueError("XML document exceeds the maximum depth of %s" % max_depth)
+            if envelope is None:
+                envelope = etree.Element(element.tag, nsmap=element.nsmap)
+            continue
+        depth -= 1
+        if depth == 1 and element.tag in ENVELOPE_TAGS:
+            kept = etree.SubElement(envelope, element.tag, attrib=dict(element.attrib))
+            kept.text = element.text
+        # Free what we have seen so far
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    return envelope
+
+
+def parse_magic_envelope(
+        document: Union[str, bytes], max_size: int = MAX_DOCUMENT_SIZE, max_depth: int = MAX_DOCUMENT_DEPTH,
+) -> etree._Element:
+    """
+    Parse a magic envelope document.
+
+    Documents larger than ``STREAMING_THRESHOLD`` are parsed incrementally, see ``iterparse_magic_envelope``.
+    """
+    document = encode_if_text(document)
+    if len(document) > STREAMING_THRESHOLD:
+        return iterparse_magic_envelope(document, max_size=max_size, max_depth=max_depth)
+    return fromstring(document, max_size=max_size, max_depth=max_depth)
@@ -1,19 +1,19 @@
 import json
 import logging
-from base64 import urlsafe_b64decode
 from typing import Callable, Tuple, Union, Dict
-from urllib.parse import unquote
 
 from Crypto.PublicKey.RSA import RsaKey
-from lxml import etree
 
 from federation.entities.mixins import BaseEntity
-from federation.exceptions import EncryptedMessageError, NoSenderKeyFoundError
+from federation.exceptions import EncryptedMessageError, NoSenderKeyFoundError, SenderNotAllowedError
 from federation.protocols.diaspora.encrypted import EncryptedPayload
-from federation.protocols.diaspora.magic_envelope import MagicEnvelope
+from federation.protocols.diaspora.magic_envelope import MagicEnvelope, decode_data
+from federation.protocols.diaspora.parsing import fromstring, parse_magic_envelope
 from federation.types import UserType, RequestType
 from federation.utils.diaspora import fetch_public_key
-from federation.utils.text import decode_if_bytes, encode_if_text, validate_handle
+from federation.utils.text import (
+    as_bytes, first_non_whitespace, lstrip_bytes, unquote_bytes, validate_handle,
+)
 
 logger = logging.getLogger("federation")
 
@@ -33,22 +33,26 @@ def identify_id(id: str) -> bool:
 def identify_request(request: RequestType):
     """Try to identify whether this is a Diaspora request.
 
-    Try first public message. Then private message. The check if this is a legacy payload.
+    Try first private message. Then public message. The body is only parsed if it looks like one of them.
     """
+    body = as_bytes(request.body)
+    first = first_non_whitespace(body)
     # Private encrypted JSON payload
-    try:
-        data = json.loads(decode_if_bytes(request.body))
-        if "encrypted_magic_envelope" in data:
-            return True
-    except Exception:
-        pass
+    if first == b"{" and b'"encrypted_magic_envelope"' in body:
+        try:
+            data = json.loads(body)
+            if "encrypted_magic_envelope" in data:
+                return True
+        except Exception:
+            pass
     # Public XML payload
-    try:
-        xml = etree.fromstring(encode_if_text(request.body))
-        if xml.tag == MAGIC_ENV_TAG:
-            return True
-    except Exception:
-        pass
+    elif first == b"<":
+        try:
+            xml = fromstring(lstrip_bytes(body))
+            if xml.tag == MAGIC_ENV_TAG:
+                return True
+        except Exception:
+            pass
     return False
 
 
@@ -69,15 +73,22 @@ class Protocol:
         return EncryptedPayload.decrypt(payload=payload, private_key=private_key)
 
     def store_magic_envelope_doc(self, payload):
-        """Get the Magic Envelope, trying JSON first."""
-        try:
-            json_payload = json.loads(decode_if_bytes(payload))
-        except ValueError:
+        """Get the Magic Envelope, trying JSON first.
+
+        The payload is handled as bytes. It is only copied if it has to be URL unquoted or stripped.
+        """
+        payload = as_bytes(payload)
+        json_payload = None
+        if first_non_whitespace(payload) == b"{":
+            try:
+                json_payload = json.loads(payload)
+            except ValueError:
+                pass
+        if json_payload is None:
             # XML payload
-            xml = unquote(decode_if_bytes(payload))
-            xml = xml.lstrip().encode("utf-8")
+            xml = lstrip_bytes(unquote_bytes(payload))
             logger.debug("diaspora.protocol.store_magic_envelope_doc: xml payload: %s", xml)
-            self.doc = etree.fromstring(xml)
+            self.doc = parse_magic_envelope(xml)
         else:
             logger.debug("diaspora.protocol.store_magic_envelope_doc: json payload: %s", json_payload)
             self.doc = self.get_json_payload_magic_envelope(json_payload)
@@ -87,17 +98,23 @@ class Protocol:
             request: RequestType,
             user: UserType = None,
             sender_key_fetcher: Callable[[str], str] = None,
-            skip_author_verification: bool = False) -> Tuple[str, str]:
+            skip_author_verification: bool = False,
+            sender_filter: Callable[[str], bool] = None) -> Tuple[str, str]:
         """Receive a payload.
 
-        For testing purposes, `skip_author_verification` can be passed. Authorship will not be verified."""
+        For testing purposes, `skip_author_verification` can be passed. Authorship will not be verified.
+
+        If `sender_filter` is given, it is called with the sender handle before the message is opened or verified.
+        """
         self.user = user
         self.get_contact_key = sender_key_fetcher
         self.store_magic_envelope_doc(request.body)
-        # Open payload and get actual message
-        self.content = self.get_message_content()
         # Get sender handle
         self.sender_handle = self.get_sender()
+        if sender_filter and not sender_filter(self.sender_handle):
+            raise SenderNotAllowedError("Sender %s was rejected by the sender filter" % self.sender_handle)
+        # Open payload and get actual message
+        self.content = self.get_message_content()
         # Verify the message is from who it claims to be
         if not skip_author_verification:
             self.verify_signature()
@@ -118,7 +135,7 @@ class Protocol:
         body = self.doc.find(
             ".//{http://salmon-protocol.org/ns/magic-env}data").text
 
-        body = urlsafe_b64decode(body.encode("ascii"))
+        body = decode_data(body)
 
         logger.debug("diaspora.protocol.get_message_content: %s", body)
         return body
@@ -150,7 +167,8 @@ class Protocol:
             xml = entity.outbound_doc
         else:
             xml = entity.to_xml()
-        me = MagicEnvelope(etree.tostring(xml), private_key=from_user.rsa_private_key, author_handle=from_user.handle)
+        # The envelope serializes the element once, directly into the signed payload
+        me = MagicEnvelope(xml, private_key=from_user.rsa_private_key, author_handle=from_user.handle)
         rendered = me.render()
         if to_user_key:
             return EncryptedPayload.encrypt(rendered, to_user_key)
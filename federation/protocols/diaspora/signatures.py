@@ -1,9 +1,8 @@
 from base64 import b64decode, b64encode
 
-from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA
 from Crypto.PublicKey.RSA import RsaKey
-from Crypto.Signature import PKCS1_v1_5
+
+from federation.utils.crypto import get_crypto_backend
 
 
 def get_element_child_info(doc, attr):
@@ -21,10 +20,10 @@ def get_element_child_info(doc, attr):
     return props
 
 
-def _create_signature_hash(doc):
+def _create_signature_content(doc):
     props = get_element_child_info(doc, "text")
     content = ";".join(props)
-    return SHA256.new(content.encode("utf-8"))
+    return content.encode("utf-8")
 
 
 def verify_relayable_signature(public_key, doc, signature):
@@ -32,12 +31,10 @@ def verify_relayable_signature(public_key, doc, signature):
     Verify the signed XML elements to have confidence that the claimed
     author did actually generate this message.
     """
-    sig_hash = _create_signature_hash(doc)
-    cipher = PKCS1_v1_5.new(RSA.importKey(public_key))
-    return cipher.verify(sig_hash, b64decode(signature))
+    content = _create_signature_content(doc)
+    return get_crypto_backend().verify(public_key, content, b64decode(signature))
 
 
 def create_relayable_signature(private_key: RsaKey, doc):
-    sig_hash = _create_signature_hash(doc)
-    cipher = PKCS1_v1_5.new(private_key)
-    return b64encode(cipher.sign(sig_hash)).decode("ascii")
+    content = _create_signature_content(doc)
+    return b64encode(get_crypto_backend().sign(private_key, content)).decode("ascii")
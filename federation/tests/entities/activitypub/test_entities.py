@@ -1,10 +1,13 @@
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 
 from Crypto.PublicKey.RSA import RsaKey
+from django.test import override_settings
 
+from federation.effects import dispatch_side_effects
 from federation.entities.activitypub.constants import (
     CONTEXTS_DEFAULT, CONTEXT_MANUALLY_APPROVES_FOLLOWERS, CONTEXT_LD_SIGNATURES)
-from federation.entities.activitypub.entities import ActivitypubAccept
+from federation.entities.activitypub.entities import ActivitypubAccept, ActivitypubImage
+from federation.tests.django.settings import FEDERATION
 from federation.tests.fixtures.keys import PUBKEY
 from federation.types import UserType
 
@@ -268,7 +271,8 @@ class TestEntitiesConvertToAS2:
             'published': '2019-04-27T00:00:00',
         }
 
-    @patch("federation.entities.base.fetch_content_type", return_value="image/jpeg")
+    @patch("federation.utils.media._probing", True)
+    @patch("federation.utils.media.fetch_content_type", return_value="image/jpeg")
     def test_profile_to_as2(self, mock_fetch, activitypubprofile):
         result = activitypubprofile.to_as2()
         assert result == {
@@ -338,6 +342,63 @@ class TestEntitiesConvertToAS2:
         }
 
 
+class TestEntitiesAS2Cache:
+    def test_to_as2_is_cached(self, activitypubpost):
+        with patch.object(activitypubpost, "build_as2", wraps=activitypubpost.build_as2) as mock_build:
+            first = activitypubpost.to_as2()
+            second = activitypubpost.to_as2()
+        assert first == second
+        assert mock_build.call_count == 1
+
+    def test_to_as2_returns_copies(self, activitypubpost):
+        first = activitypubpost.to_as2()
+        first["object"]["tag"].append("foobar")
+        first["@context"].append("foobar")
+        second = activitypubpost.to_as2()
+        assert second["object"]["tag"] == []
+        assert "foobar" not in second["@context"]
+        assert isinstance(second["@context"], list)
+
+    def test_setting_attribute_invalidates_cache(self, activitypubpost):
+        activitypubpost.to_as2()
+        activitypubpost.raw_content = "#foobar"
+        as2 = activitypubpost.to_as2()
+        assert as2["object"]["source"]["content"] == "#foobar"
+        assert [tag["name"] for tag in as2["object"]["tag"]] == ["#foobar"]
+
+    def test_mentions_and_children_invalidate_cache(self, activitypubpost):
+        activitypubimage = ActivitypubImage(url="https://example.com/image.jpg", name="spam")
+        activitypubpost.to_as2()
+        activitypubpost._mentions.add("https://example.com/profile")
+        assert activitypubpost.to_as2()["object"]["tag"] == [{
+            "type": "Mention", "href": "https://example.com/profile", "name": "https://example.com/profile",
+        }]
+        activitypubpost._children.append(activitypubimage)
+        assert activitypubpost.to_as2()["object"]["attachment"][0]["name"] == activitypubimage.name
+        activitypubimage.name = "foobar"
+        assert activitypubpost.to_as2()["object"]["attachment"][0]["name"] == "foobar"
+
+    def test_children_without_version_are_not_cached(self, activitypubpost):
+        child = Mock(spec=["to_as2"], to_as2=Mock(return_value={"type": "Image"}))
+        activitypubpost._children.append(child)
+        with patch.object(activitypubpost, "build_as2", wraps=activitypubpost.build_as2) as mock_build:
+            activitypubpost.to_as2()
+            activitypubpost.to_as2()
+        assert mock_build.call_count == 2
+
+    def test_configuration_change_invalidates_cache(self, activitypubpost):
+        activitypubpost.raw_content = "#foobar"
+        assert activitypubpost.to_as2()["object"]["tag"][0]["href"] == "https://example.com/tag/foobar/"
+        with override_settings(FEDERATION=dict(FEDERATION, tags_path="/tags/:tag:")):
+            assert activitypubpost.to_as2()["object"]["tag"][0]["href"] == "https://example.com/tags/foobar"
+
+    def test_invalidate_as2(self, activitypubaccept):
+        activitypubaccept.to_as2()
+        activitypubaccept.object["id"] = "foobar"
+        activitypubaccept.invalidate_as2()
+        assert activitypubaccept.to_as2()["object"]["id"] == "foobar"
+
+
 class TestEntitiesPostReceive:
     @patch("federation.utils.activitypub.retrieve_and_parse_profile", autospec=True)
     @patch("federation.entities.activitypub.entities.handle_send", autospec=True)
@@ -346,6 +407,9 @@ class TestEntitiesPostReceive:
     ):
         mock_retrieve.return_value = profile
         activitypubfollow.post_receive()
+        assert not mock_send.called
+        effects = dispatch_side_effects([activitypubfollow])
+        assert [effect.name for effect in effects] == ["send_accept"]
         args, kwargs = mock_send.call_args_list[0]
         assert isinstance(args[0], ActivitypubAccept)
         assert args[0].activity_id.startswith("https://example.com/profile#accept-")
@@ -361,6 +425,10 @@ class TestEntitiesPostReceive:
             "public": False,
         }]
 
+    def test_follow_post_receive__undo_registers_no_side_effects(self, activitypubundofollow):
+        activitypubundofollow.post_receive()
+        assert activitypubundofollow._side_effects == []
+
     def test_post__post_receive__cleans_linkified_tags(self, activitypubpost_linkified_tags):
         activitypubpost_linkified_tags.post_receive()
         assert activitypubpost_linkified_tags.raw_content == '<p>👁️foobar</p><p>barfoo!<br>#fanart #mastoart</p>'
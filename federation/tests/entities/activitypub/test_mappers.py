@@ -1,17 +1,20 @@
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 
 import pytest
 
 from federation.entities.activitypub.entities import (
     ActivitypubFollow, ActivitypubAccept, ActivitypubProfile, ActivitypubPost, ActivitypubComment,
     ActivitypubRetraction, ActivitypubShare)
-from federation.entities.activitypub.mappers import message_to_objects, get_outbound_entity
+from federation.entities.activitypub.mappers import (
+    message_to_objects, get_outbound_entity, transform_attributes, get_attribute_table, ATTRIBUTE_TABLES,
+    extract_receivers, extract_attachments)
 from federation.entities.base import Accept, Follow, Profile, Post, Comment, Image
 from federation.tests.fixtures.payloads import (
     ACTIVITYPUB_FOLLOW, ACTIVITYPUB_PROFILE, ACTIVITYPUB_PROFILE_INVALID, ACTIVITYPUB_UNDO_FOLLOW, ACTIVITYPUB_POST,
     ACTIVITYPUB_COMMENT, ACTIVITYPUB_RETRACTION, ACTIVITYPUB_SHARE, ACTIVITYPUB_RETRACTION_SHARE,
     ACTIVITYPUB_POST_IMAGES, ACTIVITYPUB_POST_WITH_SOURCE_MARKDOWN, ACTIVITYPUB_POST_WITH_TAGS,
-    ACTIVITYPUB_POST_WITH_SOURCE_BBCODE, ACTIVITYPUB_POST_WITH_MENTIONS)
+    ACTIVITYPUB_POST_WITH_SOURCE_BBCODE, ACTIVITYPUB_POST_WITH_MENTIONS, ACTIVITYPUB_POST_OBJECT)
+from federation.entities.activitypub.receivers import ReceiverResolver, ReceiverType
 from federation.types import UserType, ReceiverVariant
 
 
@@ -213,6 +216,26 @@ class TestActivitypubEntityMappersReceive:
             )
         }
 
+    def test_message_to_objects_receivers_are_resolved(self):
+        resolver = ReceiverResolver(fetcher=Mock(return_value=None))
+        resolver.set(
+            "https://diaspodon.fr/users/jaywink/followers", ReceiverType.FOLLOWERS, "https://diaspodon.fr/users/jaywink",
+        )
+        resolver.set("https://dev.jasonrobinson.me/p/d4574854-a5d7-42be-bfac-f70c16fcaa97/", ReceiverType.COLLECTION)
+        with patch("federation.entities.activitypub.mappers.get_receiver_resolver", return_value=resolver):
+            entities = message_to_objects(ACTIVITYPUB_POST, "https://diaspodon.fr/users/jaywink")
+        assert entities[0]._receivers == [
+            UserType(id='https://diaspodon.fr/users/jaywink', receiver_variant=ReceiverVariant.FOLLOWERS),
+        ]
+        assert not resolver.fetcher.called
+
+    def test_message_to_objects_receivers_are_fetched_only_from_actor_host(self):
+        resolver = ReceiverResolver(fetcher=Mock(return_value=None))
+        with patch("federation.entities.activitypub.mappers.get_receiver_resolver", return_value=resolver):
+            message_to_objects(ACTIVITYPUB_POST, "https://diaspodon.fr/users/jaywink")
+        fetched = [call[0][0] for call in resolver.fetcher.call_args_list]
+        assert fetched == ["https://diaspodon.fr/users/jaywink", "https://diaspodon.fr/users/jaywink/followers"]
+
     def test_message_to_objects_retraction(self):
         entities = message_to_objects(ACTIVITYPUB_RETRACTION, "https://friendica.feneas.org/profile/jaywink")
         assert len(entities) == 1
@@ -271,6 +294,43 @@ class TestActivitypubEntityMappersReceive:
         assert not entities
 
 
+class TestTransformAttributes:
+    def test_tables_are_built_at_import(self):
+        for cls in (
+            ActivitypubAccept, ActivitypubComment, ActivitypubFollow, ActivitypubPost, ActivitypubProfile,
+            ActivitypubShare,
+        ):
+            assert (cls, False) in ATTRIBUTE_TABLES
+            assert (cls, True) in ATTRIBUTE_TABLES
+        assert get_attribute_table(ActivitypubPost, False) is ATTRIBUTE_TABLES[(ActivitypubPost, False)]
+
+    def test_id_mapping_depends_on_class_and_object(self):
+        assert transform_attributes({"id": "foo"}, ActivitypubPost) == {"activity_id": "foo"}
+        assert transform_attributes({"id": "foo"}, ActivitypubPost, is_object=True) == {"id": "foo"}
+        assert transform_attributes({"id": "foo"}, ActivitypubProfile) == {"id": "foo"}
+        assert transform_attributes({"id": "foo"}, ActivitypubRetraction, is_object=True) == {
+            "target_id": "foo", "entity_type": "Object",
+        }
+
+    def test_unknown_keys_are_copied(self):
+        assert transform_attributes({"foo": "bar", "baz": None}, ActivitypubPost) == {"foo": "bar", "baz": ""}
+
+    def test_conditional_keys_fall_back_to_copy(self):
+        assert transform_attributes({"attributedTo": "foo", "summary": "bar"}, ActivitypubPost) == {
+            "attributedTo": "foo", "summary": "bar",
+        }
+        assert transform_attributes({"summary": "bar"}, ActivitypubProfile) == {"raw_content": "bar"}
+
+    @patch("federation.entities.activitypub.mappers.html_to_markdown", return_value="foo")
+    def test_content_and_source_are_mapped_once(self, mock_convert):
+        transformed = transform_attributes(
+            {"content": "<p>foo</p>", "source": {"content": "foo", "mediaType": "text/bbcode"}}, ActivitypubPost,
+            is_object=True,
+        )
+        assert transformed == {"raw_content": "foo", "_rendered_content": "<p>foo</p>", "_media_type": "text/bbcode"}
+        assert mock_convert.call_count == 1
+
+
 class TestGetOutboundEntity:
     def test_already_fine_entities_are_returned_as_is(self, private_key):
         entity = ActivitypubAccept()
@@ -291,3 +351,54 @@ class TestGetOutboundEntity:
     def test_profile_is_converted_to_activitypubprofile(self, private_key):
         entity = Profile()
         assert isinstance(get_outbound_entity(entity, private_key), ActivitypubProfile)
+
+
+class TestActivitypubEntityMappersReceiveLazy:
+    @patch("federation.entities.activitypub.mappers.extract_receivers", wraps=extract_receivers)
+    def test_message_to_objects__lazy_defers_receivers_and_mentions(self, mock_extract_receivers):
+        eager = message_to_objects(ACTIVITYPUB_POST, "https://diaspodon.fr/users/jaywink")[0]
+        mock_extract_receivers.reset_mock()
+        post = message_to_objects(ACTIVITYPUB_POST, "https://diaspodon.fr/users/jaywink", lazy=True)[0]
+        assert type(post) is ActivitypubPost
+        assert post.id == eager.id
+        assert post.raw_content == eager.raw_content
+        assert "_mentions" not in post.__dict__
+        assert not mock_extract_receivers.called
+        assert post._receivers == eager._receivers
+        assert post._mentions == eager._mentions
+        assert mock_extract_receivers.call_count == 1
+
+    def test_message_to_objects__lazy_defers_content_conversion(self):
+        with patch(
+            "federation.entities.activitypub.mappers.html_to_markdown",
+            return_value="boom [#test](https://example.com/tags/test)",
+        ) as mock_convert:
+            post = message_to_objects(ACTIVITYPUB_POST_WITH_TAGS, "https://diaspodon.fr/users/jaywink", lazy=True)[0]
+            assert not mock_convert.called
+            # Linkified tags are cleaned by post_receive when the content is converted
+            assert post.raw_content == "boom #test"
+            assert mock_convert.call_count == 1
+
+    def test_message_to_objects__lazy_defers_attachments(self):
+        eager = message_to_objects(ACTIVITYPUB_POST_IMAGES, "https://mastodon.social/users/jaywink")[0]
+        with patch(
+            "federation.entities.activitypub.mappers.extract_attachments", wraps=extract_attachments,
+        ) as mock_extract:
+            post = message_to_objects(ACTIVITYPUB_POST_IMAGES, "https://mastodon.social/users/jaywink", lazy=True)[0]
+            assert not mock_extract.called
+            assert [child.url for child in post._children] == [child.url for child in eager._children]
+            assert mock_extract.call_count == 1
+
+    def test_message_to_objects__lazy_validates_source_content(self):
+        payload = dict(ACTIVITYPUB_POST_OBJECT, content=" ")
+        assert message_to_objects(payload, "https://diaspodon.fr/users/jaywink", lazy=True) == []
+
+    @patch.object(ActivitypubFollow, "post_receive", autospec=True)
+    def test_message_to_objects__lazy_runs_post_receive(self, mock_post_receive):
+        entities = message_to_objects(ACTIVITYPUB_FOLLOW, "https://example.com/actor", lazy=True)
+        assert entities[0].following is True
+        assert mock_post_receive.called
+
+    def test_message_to_objects__lazy_drops_invalid_entity(self):
+        entities = message_to_objects(ACTIVITYPUB_PROFILE_INVALID, "http://example.com/1234", lazy=True)
+        assert entities == []
@@ -0,0 +1,123 @@
+from unittest.mock import Mock, patch
+
+from federation.entities.activitypub.receivers import ReceiverResolver, ReceiverType, get_receiver_resolver
+
+DOCUMENTS = {
+    "https://example.com/actor": {
+        "id": "https://example.com/actor", "type": "Person", "followers": "https://example.com/actor/fans",
+    },
+    "https://example.com/service": {"id": "https://example.com/service", "type": "Service"},
+    "https://example.com/list": {"id": "https://example.com/list", "type": "OrderedCollection"},
+    "https://example.com/note": {"id": "https://example.com/note", "type": "Note"},
+}
+
+
+def get_resolver(**kwargs):
+    return ReceiverResolver(fetcher=Mock(side_effect=DOCUMENTS.get), **kwargs)
+
+
+class TestReceiverResolver:
+    def test_resolves_followers_collection_from_actor(self):
+        resolver = get_resolver()
+        assert resolver.resolve("https://example.com/actor/fans", "https://example.com/actor") == (
+            ReceiverType.FOLLOWERS, "https://example.com/actor",
+        )
+        resolver.fetcher.assert_called_once_with("https://example.com/actor")
+
+    def test_resolves_actors_and_collections(self):
+        resolver = get_resolver()
+        assert resolver.resolve("https://example.com/service", "https://example.com/actor") == (
+            ReceiverType.ACTOR, "https://example.com/service",
+        )
+        assert resolver.resolve("https://example.com/list") == (ReceiverType.COLLECTION, "https://example.com/list")
+        assert resolver.resolve("https://example.com/note") is None
+        assert resolver.resolve("https://example.com/missing") is None
+
+    def test_fetches_each_receiver_once(self):
+        resolver = get_resolver()
+        for _i in range(3):
+            resolver.resolve("https://example.com/actor/fans", "https://example.com/actor")
+            resolver.resolve("https://example.com/service", "https://example.com/actor")
+            resolver.resolve("https://example.com/missing", "https://example.com/actor")
+        assert resolver.fetcher.call_count == 3
+
+    def test_entries_expire(self):
+        resolver = get_resolver(ttl=10, failure_ttl=0)
+        with patch("federation.entities.activitypub.receivers.time.monotonic", return_value=100):
+            resolver.resolve("https://example.com/service")
+            resolver.resolve("https://example.com/missing")
+        assert resolver.fetcher.call_count == 2
+        with patch("federation.entities.activitypub.receivers.time.monotonic", return_value=105):
+            assert resolver.resolve("https://example.com/service") == (
+                ReceiverType.ACTOR, "https://example.com/service",
+            )
+            resolver.resolve("https://example.com/missing")
+        assert resolver.fetcher.call_count == 3
+        with patch("federation.entities.activitypub.receivers.time.monotonic", return_value=111):
+            assert resolver.get("https://example.com/service") is None
+
+    def test_max_size(self):
+        resolver = get_resolver(max_size=2)
+        resolver.set("https://example.com/1", ReceiverType.ACTOR)
+        resolver.set("https://example.com/2", ReceiverType.ACTOR)
+        resolver.set("https://example.com/3", ReceiverType.ACTOR)
+        assert len(resolver) == 2
+        assert resolver.get("https://example.com/1") is None
+
+    def test_followers_are_kept_with_actor(self):
+        resolver = get_resolver(max_size=2)
+        resolver.resolve("https://example.com/actor/fans", "https://example.com/actor")
+        # Fill the cache so only the entry of the actor would be left of the old entries
+        resolver.resolve("https://example.com/service", "https://example.com/actor")
+        assert resolver.resolve("https://example.com/actor/fans", "https://example.com/actor") == (
+            ReceiverType.FOLLOWERS, "https://example.com/actor",
+        )
+        assert resolver.fetcher.call_count == 2
+
+    def test_refetches_actor_for_cached_collection(self):
+        resolver = get_resolver()
+        resolver.set("https://example.com/actor/fans", ReceiverType.COLLECTION)
+        assert resolver.resolve("https://example.com/actor/fans", "https://example.com/actor") == (
+            ReceiverType.FOLLOWERS, "https://example.com/actor",
+        )
+        resolver.fetcher.assert_called_once_with("https://example.com/actor")
+
+    def test_fetches_only_from_actor_host(self):
+        resolver = get_resolver()
+        classifications = resolver.resolve_all(
+            ["https://example.org/actor", "https://example.com/service"], "https://example.com/actor",
+        )
+        assert classifications == {
+            "https://example.org/actor": None,
+            "https://example.com/service": (ReceiverType.ACTOR, "https://example.com/service"),
+        }
+        assert [call[0][0] for call in resolver.fetcher.call_args_list] == [
+            "https://example.com/actor", "https://example.com/service",
+        ]
+        # Receivers not fetched are not remembered as failed
+        assert resolver._lookup("https://example.org/actor") == (False, None, None)
+
+    def test_fetches_nothing_without_actor(self):
+        resolver = get_resolver()
+        assert resolver.resolve_all(["https://example.com/service"], "") == {"https://example.com/service": None}
+        assert resolver.fetcher.call_count == 0
+
+    def test_max_fetches_per_payload(self):
+        resolver = get_resolver(max_fetches=2)
+        classifications = resolver.resolve_all(
+            ["https://example.com/service", "https://example.com/list", "https://example.com/note"],
+            "https://example.com/actor",
+        )
+        assert resolver.fetcher.call_count == 2
+        assert classifications["https://example.com/service"] == (ReceiverType.ACTOR, "https://example.com/service")
+        assert classifications["https://example.com/list"] is None
+        # The next payload can fetch again
+        assert resolver.resolve_all(["https://example.com/list"], "https://example.com/actor") == {
+            "https://example.com/list": (ReceiverType.COLLECTION, "https://example.com/list"),
+        }
+
+
+def test_receivers_are_not_resolved_by_default():
+    assert get_receiver_resolver() is None
+
+
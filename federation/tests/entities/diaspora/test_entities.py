@@ -194,6 +194,17 @@ class TestDiasporaRelayableMixin:
                                                       b'hdOWOV8563dYo/5xS3zlQUt8I3AwXOzHr+57r1egMBHYyXTXsS8gFisj7mH4' \
                                                       b'TsLM+Yw==</parent_author_signature></comment>'
 
+    @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
+    def test_sign_with_parent__does_not_change_source(self, mock_validate):
+        entities = message_to_objects(DIASPORA_POST_COMMENT, "alice@alice.diaspora.example.org",
+                                      sender_key_fetcher=Mock())
+        entity = entities[0]
+        source = entity._source_object
+        entity.sign_with_parent(get_dummy_private_key())
+        assert entity.outbound_doc is not entity._source_element
+        assert entity._source_element.find("parent_author_signature") is None
+        assert entity._source_object == source
+
     @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
     def test_sign_with_parent__calls_to_xml(self, mock_validate):
         entity = DiasporaComment()
@@ -220,3 +231,14 @@ class TestDiasporaRelayableEntityValidate():
         mock_verify.reset_mock()
         mock_verify.return_value = True
         entity._validate_signatures()
+
+    @patch("federation.entities.diaspora.mixins.verify_relayable_signature", return_value=True)
+    def test_uses_source_element(self, mock_verify):
+        entity = DiasporaComment()
+        entity._sender_key = "key"
+        entity._source_element = etree.fromstring("<obj></obj>")
+        entity.signature = "sig"
+        with patch("federation.entities.diaspora.mixins.etree.fromstring") as mock_fromstring:
+            entity._validate_signatures()
+        assert not mock_fromstring.called
+        mock_verify.assert_called_once_with("key", entity._source_element, "sig")
@@ -1,3 +1,4 @@
+import threading
 from datetime import datetime
 from lxml import etree
 from unittest.mock import patch, Mock
@@ -11,7 +12,9 @@ from federation.entities.diaspora.entities import (
     DiasporaPost, DiasporaComment, DiasporaLike,
     DiasporaProfile, DiasporaRetraction, DiasporaContact, DiasporaReshare, DiasporaImage)
 from federation.entities.diaspora.mappers import (
-    message_to_objects, get_outbound_entity, check_sender_and_entity_handle_match)
+    message_to_objects, get_outbound_entity, check_sender_and_entity_handle_match, resolve_sender_keys,
+    transform_attributes, ATTRIBUTE_TABLES)
+from federation.protocols.diaspora.parsing import fromstring
 from federation.tests.fixtures.payloads import (
     DIASPORA_POST_SIMPLE, DIASPORA_POST_COMMENT, DIASPORA_POST_LIKE,
     DIASPORA_PROFILE, DIASPORA_POST_INVALID, DIASPORA_RETRACTION,
@@ -235,6 +238,26 @@ class TestDiasporaEntityMappersReceive:
         entity = entities[0]
         assert entity._source_object == etree.tostring(etree.fromstring(DIASPORA_POST_COMMENT))
 
+    @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
+    def test_source_object__is_serialized_only_when_accessed(self, mock_validate):
+        entities = message_to_objects(DIASPORA_POST_COMMENT, "alice@alice.diaspora.example.org",
+                                      sender_key_fetcher=Mock())
+        entity = entities[0]
+        assert entity._source_element.tag == "comment"
+        assert entity._source_bytes is None
+        assert entity._source_object == etree.tostring(entity._source_element)
+        assert entity._source_bytes == entity._source_object
+
+    @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
+    def test_source_element__is_parsed_with_hardened_parser(self, mock_validate):
+        entities = message_to_objects(DIASPORA_POST_COMMENT, "alice@alice.diaspora.example.org",
+                                      sender_key_fetcher=Mock())
+        entity = entities[0]
+        entity._source_object = etree.tostring(entity._source_element)
+        with patch("federation.entities.diaspora.mixins.fromstring", wraps=fromstring) as mock_fromstring:
+            assert entity._get_source_element().tag == "comment"
+        mock_fromstring.assert_called_once_with(entity._source_bytes)
+
     @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
     def test_element_to_objects_calls_sender_key_fetcher(self, mock_validate):
         mock_fetcher = Mock()
@@ -243,6 +266,18 @@ class TestDiasporaEntityMappersReceive:
             "alice@alice.diaspora.example.org",
         )
 
+    @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
+    @patch("federation.entities.diaspora.mappers.DiasporaLike._validate_signatures")
+    def test_element_to_objects_resolves_child_keys_with_sender_key_fetcher(self, mock_like_validate, mock_validate):
+        payload = DIASPORA_POST_SIMPLE.replace(
+            "</status_message>", "%s%s</status_message>" % (DIASPORA_POST_COMMENT, DIASPORA_POST_LIKE),
+        )
+        mock_fetcher = Mock(return_value="key")
+        entities = message_to_objects(payload, "alice@alice.diaspora.example.org", mock_fetcher)
+        mock_fetcher.assert_called_once_with("alice@alice.diaspora.example.org")
+        assert len(entities[0]._children) == 2
+        assert {child._sender_key for child in entities[0]._children} == {"key"}
+
     @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
     @patch("federation.entities.diaspora.mappers.retrieve_and_parse_profile")
     def test_element_to_objects_calls_retrieve_remote_profile(self, mock_retrieve, mock_validate):
@@ -324,6 +359,79 @@ class TestGetOutboundEntity:
         assert get_outbound_entity(entity, private_key) == entity
 
 
+class TestTransformAttributes:
+    def test_tables_are_built_at_import(self):
+        for cls in (DiasporaPost, DiasporaComment, DiasporaLike, DiasporaProfile, DiasporaRetraction, DiasporaImage):
+            assert cls in ATTRIBUTE_TABLES
+
+    def test_transform_attributes(self):
+        assert transform_attributes({
+            "guid": "1234", "author": "alice@example.com", "public": "true", "height": "10", "foo": None,
+        }, DiasporaPost) == {
+            "id": "1234", "guid": "1234", "actor_id": "alice@example.com", "handle": "alice@example.com",
+            "public": True, "height": 10, "foo": "",
+        }
+
+    def test_class_specific_keys(self):
+        assert transform_attributes({"guid": "1234"}, DiasporaProfile) == {}
+        assert transform_attributes({"target_type": "Post"}, DiasporaPost) == {"target_type": "Post"}
+        assert transform_attributes({"target_type": "Post"}, DiasporaRetraction) == {"entity_type": "Post"}
+
+
 def test_check_sender_and_entity_handle_match():
     assert not check_sender_and_entity_handle_match("foo", "bar")
     assert check_sender_and_entity_handle_match("foo", "foo")
+
+
+class TestDiasporaEntityMappersReceiveLazy:
+    @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
+    def test_message_to_objects__lazy_verifies_and_defers_mentions(self, mock_validate):
+        sender_key_fetcher = Mock(return_value="key")
+        entities = message_to_objects(
+            DIASPORA_POST_COMMENT, "alice@alice.diaspora.example.org", sender_key_fetcher=sender_key_fetcher,
+            lazy=True,
+        )
+        assert len(entities) == 1
+        comment = entities[0]
+        assert type(comment) is DiasporaComment
+        assert comment.actor_id == "alice@alice.diaspora.example.org"
+        assert comment._sender_key == "key"
+        assert mock_validate.called
+        assert "_mentions" not in comment.__dict__
+        assert comment._mentions == set()
+
+    def test_message_to_objects__lazy_defers_mentions_of_children(self):
+        entities = message_to_objects(DIASPORA_POST_WITH_PHOTOS, "alice@alice.diaspora.example.org", lazy=True)
+        post = entities[0]
+        assert isinstance(post._children[0], DiasporaImage)
+
+    def test_message_to_objects__lazy_drops_invalid_entity(self):
+        entities = message_to_objects(DIASPORA_POST_INVALID, "alice@alice.diaspora.example.org", lazy=True)
+        assert entities == []
+
+
+class TestResolveSenderKeys:
+    def test_deduplicates_handles(self):
+        mock_fetcher = Mock(side_effect=lambda handle: "key-%s" % handle)
+        keys = resolve_sender_keys(["alice@example.com", "bob@example.com", "alice@example.com", ""], mock_fetcher)
+        assert keys == {"alice@example.com": "key-alice@example.com", "bob@example.com": "key-bob@example.com"}
+        assert mock_fetcher.call_count == 2
+
+    def test_skips_keys_not_found(self):
+        assert resolve_sender_keys(["alice@example.com", "bob@example.com"], Mock(return_value=None)) == {}
+
+    @patch("federation.entities.diaspora.mappers.retrieve_and_parse_profile")
+    def test_fetches_profile_without_sender_key_fetcher(self, mock_retrieve):
+        mock_retrieve.return_value = Mock(public_key="key")
+        assert resolve_sender_keys(["alice@example.com"]) == {"alice@example.com": "key"}
+        mock_retrieve.assert_called_once_with("alice@example.com")
+
+    def test_sender_key_fetcher_is_called_in_calling_thread(self):
+        threads = []
+
+        def fetcher(handle):
+            threads.append(threading.current_thread())
+            return "key"
+
+        resolve_sender_keys(["alice@example.com", "bob@example.com"], fetcher)
+        assert threads == [threading.current_thread()] * 2
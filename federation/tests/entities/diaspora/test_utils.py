@@ -7,7 +7,9 @@ from lxml import etree
 from federation.entities.base import Post, Profile
 from federation.entities.diaspora.utils import (
     get_full_xml_representation, format_dt, add_element_to_doc)
-from federation.entities.utils import get_base_attributes
+from federation.entities.activitypub.entities import ActivitypubPost
+from federation.entities.diaspora.entities import DiasporaPost
+from federation.entities.utils import get_base_attributes, get_base_fields, get_copy_fields, convert_entity
 
 
 class TestGetBaseAttributes:
@@ -28,6 +30,28 @@ class TestGetBaseAttributes:
             "inboxes",
         }
 
+    def test_get_base_fields_is_cached_per_class(self):
+        assert get_base_fields(Post) is get_base_fields(Post)
+        assert set(get_base_fields(Post)) == set(get_base_attributes(Post()).keys())
+
+    def test_get_copy_fields_only_includes_supported_fields(self):
+        assert get_copy_fields(Post, DiasporaPost) == get_base_fields(Post)
+        assert "nsfw" in get_base_fields(Profile)
+        assert "nsfw" not in get_copy_fields(Profile, Post)
+
+
+class TestConvertEntity:
+    def test_copies_base_attributes(self):
+        entity = Post(raw_content="foobar", id="https://example.com/post", actor_id="https://example.com/profile",
+                      public=True)
+        for cls in (ActivitypubPost, DiasporaPost):
+            converted = convert_entity(entity, cls)
+            assert isinstance(converted, cls)
+            assert converted.raw_content == "foobar"
+            assert converted.id == "https://example.com/post"
+            assert converted.public is True
+            assert converted.created_at == entity.created_at
+
 
 class TestGetFullXMLRepresentation:
     def test_returns_xml_document(self):
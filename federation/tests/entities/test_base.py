@@ -1,4 +1,5 @@
-from unittest.mock import Mock
+from concurrent.futures import Future
+from unittest.mock import Mock, PropertyMock, patch
 
 import pytest
 
@@ -18,6 +19,51 @@ class TestPostEntityTags:
         assert post.tags == []
 
 
+class TestRawContentMixinDerivedValues:
+    @patch("federation.entities.mixins.markdown_to_html", return_value="<p>foo</p>\n")
+    def test_rendered_content_is_cached(self, mock_render):
+        post = PostFactory(raw_content="foo")
+        assert post.rendered_content == "<p>foo</p>"
+        assert post.rendered_content == "<p>foo</p>"
+        mock_render.assert_called_once_with("foo")
+
+    def test_assigning_raw_content_invalidates(self):
+        post = PostFactory(raw_content="#foo **bar**")
+        assert post.tags == ["foo"]
+        assert post.rendered_content == "<p>#foo <strong>bar</strong></p>"
+        post.raw_content = "#bar"
+        assert post.tags == ["bar"]
+        assert post.rendered_content == "<p>#bar</p>"
+
+    def test_assigning_rendered_content_or_media_type_invalidates(self):
+        post = PostFactory(raw_content="**bar**")
+        assert post.rendered_content == "<p><strong>bar</strong></p>"
+        post._rendered_content = "<b>bar</b>"
+        assert post.rendered_content == "<b>bar</b>"
+        post._rendered_content = ""
+        post._media_type = "text/plain"
+        assert post.rendered_content == "**bar**"
+
+    def test_tags_returns_new_list(self):
+        post = PostFactory(raw_content="#foo")
+        post.tags.append("bar")
+        assert post.tags == ["foo"]
+
+    def test_embedded_images(self):
+        post = PostFactory(raw_content="![foo](https://example.com/foo.jpg) ![](https://example.com/bar.png)")
+        assert post.embedded_images == [("https://example.com/foo.jpg", "foo"), ("https://example.com/bar.png", "")]
+        post._media_type = "text/html"
+        assert post.embedded_images == []
+
+    def test_extract_mentions(self):
+        post = PostFactory(raw_content="@{Foo; foo@example.com} @{bar@example.com}")
+        post.extract_mentions()
+        assert post._mentions == {"foo@example.com", "bar@example.com"}
+        post.raw_content = "@{baz@example.com}"
+        post.extract_mentions()
+        assert post._mentions == {"foo@example.com", "bar@example.com", "baz@example.com"}
+
+
 class TestBaseEntityCallsValidateMethods:
     def test_entity_calls_attribute_validate_method(self):
         post = PostFactory()
@@ -37,6 +83,21 @@ class TestBaseEntityCallsValidateMethods:
         assert post._validate_empty_attributes.call_count == 1
         assert post._validate_children.call_count == 1
 
+    def test_validation_plan_is_built_per_class(self):
+        post = PostFactory()
+        assert "raw_content" in type(post)._validation_attributes
+        assert "validate_public" in type(post)._validation_methods
+        assert "rendered_content" in type(post)._validation_attributes
+        assert "validate_participation" not in type(post)._validation_methods
+
+    def test_validate_does_not_evaluate_properties(self):
+        post = PostFactory()
+        with patch.object(type(post), "rendered_content", new_callable=PropertyMock) as mock_rendered, \
+                patch.object(type(post), "tags", new_callable=PropertyMock) as mock_tags:
+            post.validate()
+        assert not mock_rendered.called
+        assert not mock_tags.called
+
     def test_validate_children(self):
         post = PostFactory()
         image = Image()
@@ -103,6 +164,44 @@ class TestImageEntity:
         entity = ImageFactory()
         entity.validate()
 
+    @patch("federation.entities.base.probe_media_type")
+    def test_media_type_is_inferred_from_url(self, mock_probe):
+        entity = Image(url="https://example.com/image.JPG")
+        assert entity.media_type == "image/jpeg"
+        assert not mock_probe.called
+
+    @patch("federation.entities.base.probe_media_type")
+    def test_media_type_is_probed_in_background(self, mock_probe):
+        future = Future()
+        mock_probe.return_value = future
+        entity = Image(url="https://example.com/image")
+        mock_probe.assert_called_once_with("https://example.com/image")
+        assert entity.media_type == ""
+        future.set_result("image/png")
+        assert entity.resolve_media_type() == "image/png"
+        assert entity.media_type == "image/png"
+
+    @patch("federation.entities.base.probe_media_type")
+    def test_probed_media_type_must_be_valid(self, mock_probe):
+        future = Future()
+        future.set_result("text/html")
+        mock_probe.return_value = future
+        entity = Image(url="https://example.com/image")
+        assert entity.resolve_media_type() == ""
+
+    @patch("federation.entities.base.PROBE_TIMEOUT", 0.01)
+    @patch("federation.entities.base.probe_media_type")
+    def test_resolve_media_type_does_not_wait_for_slow_probe(self, mock_probe):
+        mock_probe.return_value = Future()
+        entity = Image(url="https://example.com/image")
+        assert entity.resolve_media_type() == ""
+        assert entity._media_type_probe is None
+
+    @patch("federation.entities.base.probe_media_type", return_value=None)
+    def test_resolve_media_type_without_probe(self, mock_probe):
+        entity = Image(url="https://example.com/image")
+        assert entity.resolve_media_type() == ""
+
 
 class TestRetractionEntity:
     def test_instance_creation(self):
@@ -0,0 +1,101 @@
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+
+from federation.entities.activitypub.mappers import message_to_objects as activitypub_message_to_objects
+from federation.entities.base import Image
+from federation.entities.compact import compact, compact_entities, expand, is_compact
+from federation.entities.diaspora.entities import DiasporaComment
+from federation.entities.diaspora.mappers import message_to_objects as diaspora_message_to_objects
+from federation.tests.factories.entities import PostFactory
+from federation.tests.fixtures.payloads import ACTIVITYPUB_POST, DIASPORA_POST_COMMENT
+
+
+class TestCompact:
+    def test_compact(self):
+        post = PostFactory(raw_content="#foo")
+        post._children = [Image(url="https://example.com/foo.jpg")]
+        post._mentions = {"https://example.com/bob"}
+        assert post.tags == ["foo"]
+        assert compact(post) is post
+        assert is_compact(post)
+        assert isinstance(post._required, tuple)
+        assert post._children == (post._children[0],)
+        assert is_compact(post._children[0])
+        assert post._mentions == frozenset(("https://example.com/bob",))
+        assert post._receivers == ()
+        assert post._content_cache is None
+        assert post.tags == ["foo"]
+        post.validate()
+
+    def test_computes_deferred_values(self):
+        post = activitypub_message_to_objects(ACTIVITYPUB_POST, "https://diaspodon.fr/users/jaywink", lazy=True)[0]
+        eager = activitypub_message_to_objects(ACTIVITYPUB_POST, "https://diaspodon.fr/users/jaywink")[0]
+        compact(post)
+        assert post._source_object is None
+        assert post._receivers == tuple(eager._receivers)
+        assert post._mentions == frozenset(eager._mentions)
+
+    def test_shares_required_and_empty_containers(self):
+        post1 = compact(PostFactory())
+        post2 = compact(PostFactory())
+        assert post1._required is post2._required
+        assert post1._receivers is post2._receivers
+        assert post1._mentions is post2._mentions
+
+    def test_interns_repeated_values(self):
+        actor_id = "".join(["https://example.com/", "profile"])
+        post1 = compact(PostFactory(actor_id=actor_id))
+        post2 = compact(PostFactory(actor_id="".join(["https://example.com/", "profile"])))
+        assert post1.actor_id is post2.actor_id
+
+    def test_containers_are_immutable(self):
+        post = compact(PostFactory())
+        with pytest.raises(AttributeError):
+            post._children.append(Image())
+
+    @patch("federation.entities.activitypub.mappers.get_receiver_resolver", return_value=None)
+    def test_drops_source(self, mock_resolver):
+        entity = activitypub_message_to_objects(json.loads(json.dumps(ACTIVITYPUB_POST)), "https://example.com")[0]
+        assert entity._source_object
+        compact(entity)
+        assert entity._source_object is None
+        assert entity.to_as2()
+
+    @patch("federation.entities.activitypub.mappers.get_receiver_resolver", return_value=None)
+    def test_keeps_source(self, mock_resolver):
+        entity = activitypub_message_to_objects(json.loads(json.dumps(ACTIVITYPUB_POST)), "https://example.com")[0]
+        compact(entity, keep_source=True)
+        assert entity._source_object
+
+    @patch("federation.entities.diaspora.mappers.DiasporaComment._validate_signatures")
+    def test_drops_diaspora_source_element(self, mock_validate):
+        entity = diaspora_message_to_objects(
+            DIASPORA_POST_COMMENT, "alice@alice.diaspora.example.org", sender_key_fetcher=Mock(),
+        )[0]
+        assert isinstance(entity, DiasporaComment)
+        assert entity._source_element is not None
+        compact(entity)
+        assert entity._source_element is None
+        assert entity._source_object is None
+
+    def test_compact_entities(self):
+        posts = [PostFactory(), PostFactory()]
+        assert compact_entities(posts) is posts
+        assert all(is_compact(post) for post in posts)
+
+
+class TestExpand:
+    def test_expand(self):
+        post = PostFactory()
+        post._children = [Image(url="https://example.com/foo.jpg")]
+        compact(post)
+        assert expand(post) is post
+        assert not is_compact(post)
+        assert isinstance(post._required, list)
+        assert isinstance(post._children, list)
+        assert isinstance(post._mentions, set)
+        assert not is_compact(post._children[0])
+        post._children.append(Image())
+        post._mentions.add("https://example.com/bob")
@@ -0,0 +1,98 @@
+import copy
+from unittest.mock import Mock
+
+import pytest
+
+from federation.entities.base import Follow, Image, Post
+from federation.entities.lazy import extract_mentions
+
+
+class TestDeferredAttribute:
+    def test_computed_on_first_access(self):
+        post = Post()
+        compute = Mock(return_value=["foo"])
+        post.defer("_receivers", compute)
+        assert not compute.called
+        assert post._receivers == ["foo"]
+        assert post._receivers == ["foo"]
+        compute.assert_called_once_with(post)
+        assert post._deferred == {}
+
+    def test_setting_drops_deferred(self):
+        post = Post()
+        compute = Mock()
+        post.defer("_receivers", compute)
+        post._receivers = ["bar"]
+        assert post._receivers == ["bar"]
+        assert not compute.called
+
+    def test_copies_compute_their_own_value(self):
+        post = Post()
+        post.defer("_receivers", lambda entity: [entity.id])
+        post_copy = copy.copy(post)
+        post.id = "foo"
+        post_copy.id = "bar"
+        assert post._receivers == ["foo"]
+        assert post_copy._receivers == ["bar"]
+
+    def test_default_without_deferred(self):
+        assert Post._receivers is None
+        assert Post()._receivers == []
+
+    def test_resolve_deferred(self):
+        post = Post()
+        compute = Mock(return_value=["foo"])
+        post.defer("_receivers", compute)
+        post.resolve_deferred()
+        compute.assert_called_once_with(post)
+        assert post.__dict__["_receivers"] == ["foo"]
+
+
+class TestMapAttribute:
+    def test_maps_value(self):
+        post = Post(raw_content="foo")
+        post.map_attribute("raw_content", str.upper)
+        assert post.raw_content == "FOO"
+
+    def test_maps_deferred_value_when_computed(self):
+        post = Post()
+        compute = Mock(return_value="foo")
+        post.defer("raw_content", compute, "<p>foo</p>")
+        post.map_attribute("raw_content", str.upper)
+        assert not compute.called
+        assert post.raw_content == "FOO"
+
+
+class TestValidateDeferred:
+    def get_post(self, source):
+        post = Post(id="1", actor_id="2")
+        compute = Mock(return_value="foo")
+        post.defer("raw_content", compute, source)
+        return post, compute
+
+    def test_validates_source(self):
+        post, compute = self.get_post("<p>foo</p>")
+        post.validate()
+        assert not compute.called
+
+    def test_empty_source_is_invalid(self):
+        post, compute = self.get_post("")
+        with pytest.raises(ValueError):
+            post.validate()
+        assert not compute.called
+
+    def test_validates_classes_of_deferred_children(self):
+        post = Post(id="1", actor_id="2", raw_content="foo")
+        compute = Mock(return_value=[])
+        post.defer("_children", compute, [Image])
+        post.validate()
+        post.defer("_children", compute, [Follow])
+        with pytest.raises(ValueError):
+            post.validate()
+        assert not compute.called
+
+
+def test_extract_mentions():
+    post = Post(raw_content="foo @{bar; bar@example.com}")
+    post.defer("_mentions", extract_mentions)
+    assert post._mentions == {"bar@example.com"}
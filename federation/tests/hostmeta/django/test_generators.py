@@ -1,14 +1,28 @@
 import json
+import time
 from unittest.mock import patch, Mock
 
-from django.test import RequestFactory
+import pytest
+from django.test import RequestFactory, override_settings
 
 from federation.hostmeta.django import rfc7033_webfinger_view
+from federation.hostmeta.django.cache import (
+    NODEINFO2_KEY, get_response_cache, invalidate_nodeinfo2, invalidate_webfinger, set_response_cache, ResponseCache,
+)
 from federation.hostmeta.django.generators import nodeinfo2_view
+from federation.tests.django.settings import FEDERATION
+from federation.tests.django.utils import get_profile
 from federation.utils.django import get_function_from_config
 from federation.tests.fixtures.hostmeta import NODEINFO2_10_DOC
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    get_response_cache().clear()
+    yield
+    get_response_cache().clear()
+
+
 def test_get_function_from_config():
     func = get_function_from_config("get_profile_function")
     assert callable(func)
@@ -27,6 +41,111 @@ class TestNodeInfo2View:
         response = nodeinfo2_view(request)
         assert response.status_code == 200
 
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_response_is_cached(self, mock_get_func):
+        mock_nodeinfo2 = Mock(return_value=json.loads(NODEINFO2_10_DOC))
+        mock_get_func.return_value = mock_nodeinfo2
+        first = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        second = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        assert mock_nodeinfo2.call_count == 1
+        assert second.content == first.content
+        assert second["ETag"] == first["ETag"]
+        assert second["Cache-Control"] == "max-age=299, stale-while-revalidate=3600"
+        invalidate_nodeinfo2()
+        nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        assert mock_nodeinfo2.call_count == 2
+
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_if_none_match_returns_304(self, mock_get_func):
+        mock_get_func.return_value = Mock(return_value=json.loads(NODEINFO2_10_DOC))
+        etag = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))["ETag"]
+        response = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2', HTTP_IF_NONE_MATCH=etag))
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        response = nodeinfo2_view(
+            RequestFactory().get('/.well-known/x-nodeinfo2', HTTP_IF_NONE_MATCH='"foo", W/%s' % etag),
+        )
+        assert response.status_code == 304
+        response = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2', HTTP_IF_NONE_MATCH='"foo"'))
+        assert response.status_code == 200
+
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_stale_response_is_served_while_refreshed(self, mock_get_func):
+        mock_nodeinfo2 = Mock(return_value=json.loads(NODEINFO2_10_DOC))
+        mock_get_func.return_value = mock_nodeinfo2
+        nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        cached = get_response_cache().get(NODEINFO2_KEY)
+        cached.created -= 301
+        with patch.object(ResponseCache, "refresh") as mock_refresh:
+            response = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        assert response.status_code == 200
+        assert response["ETag"] == cached.etag
+        assert response["Cache-Control"] == "max-age=0, stale-while-revalidate=3600"
+        assert mock_refresh.call_count == 1
+        assert mock_nodeinfo2.call_count == 1
+
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_max_age_is_remaining_ttl(self, mock_get_func):
+        mock_get_func.return_value = Mock(return_value=json.loads(NODEINFO2_10_DOC))
+        nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        get_response_cache().get(NODEINFO2_KEY).created -= 100
+        response = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        assert response["Cache-Control"] == "max-age=199, stale-while-revalidate=3600"
+
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_expired_response_is_rendered(self, mock_get_func):
+        mock_nodeinfo2 = Mock(return_value=json.loads(NODEINFO2_10_DOC))
+        mock_get_func.return_value = mock_nodeinfo2
+        nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        get_response_cache().get(NODEINFO2_KEY).created -= 300 + 3600
+        nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        assert mock_nodeinfo2.call_count == 2
+
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_not_cached_if_disabled(self, mock_get_func):
+        mock_nodeinfo2 = Mock(return_value=json.loads(NODEINFO2_10_DOC))
+        mock_get_func.return_value = mock_nodeinfo2
+        with override_settings(FEDERATION=dict(FEDERATION, nodeinfo2_cache_ttl=0)):
+            nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+            response = nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        assert mock_nodeinfo2.call_count == 2
+        assert "ETag" not in response
+
+
+class TestResponseCache:
+    def test_refresh(self):
+        cache = ResponseCache()
+        cache.refresh("key", Mock(return_value=Mock(status_code=200, content=b"foo", __getitem__=Mock(
+            return_value="application/json",
+        ))))
+        for _i in range(100):
+            if cache.get("key"):
+                break
+            time.sleep(0.01)
+        cached = cache.get("key")
+        assert cached.body == b"foo"
+        assert cached.content_type == "application/json"
+
+    def test_max_size(self):
+        cache = ResponseCache(max_size=2)
+        for key in ("a", "b", "c"):
+            cache.set(key, Mock())
+        assert len(cache) == 2
+        assert cache.get("a") is None
+
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_responses_not_cached_without_cache(self, mock_get_func):
+        mock_nodeinfo2 = Mock(return_value=json.loads(NODEINFO2_10_DOC))
+        mock_get_func.return_value = mock_nodeinfo2
+        cache = get_response_cache()
+        set_response_cache(None)
+        try:
+            nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+            nodeinfo2_view(RequestFactory().get('/.well-known/x-nodeinfo2'))
+        finally:
+            set_response_cache(cache)
+        assert mock_nodeinfo2.call_count == 2
+
 
 class TestRFC7033WebfingerView:
     @patch("federation.hostmeta.django.generators.get_function_from_config")
@@ -57,6 +176,41 @@ class TestRFC7033WebfingerView:
         response = rfc7033_webfinger_view(request)
         assert response.status_code == 404
 
+    @patch("federation.hostmeta.django.generators.get_function_from_config")
+    def test_unknown_handle_is_not_cached(self, mock_get_func):
+        mock_get_profile = Mock(side_effect=Exception)
+        mock_get_func.return_value = mock_get_profile
+        rfc7033_webfinger_view(RequestFactory().get("/.well-known/webfinger?resource=acct:foobar@domain.tld"))
+        rfc7033_webfinger_view(RequestFactory().get("/.well-known/webfinger?resource=acct:foobar@domain.tld"))
+        assert mock_get_profile.call_count == 2
+
+    def test_response_is_not_cached_by_default(self):
+        with patch("federation.tests.django.utils.get_profile", wraps=get_profile) as mock_get_profile:
+            rfc7033_webfinger_view(RequestFactory().get("/.well-known/webfinger?resource=acct:foobar@example.com"))
+            rfc7033_webfinger_view(RequestFactory().get("/.well-known/webfinger?resource=acct:foobar@example.com"))
+            assert mock_get_profile.call_count == 2
+
+    @override_settings(FEDERATION=dict(FEDERATION, webfinger_cache_ttl=60))
+    def test_response_is_cached_per_handle(self):
+        with patch("federation.tests.django.utils.get_profile", wraps=get_profile) as mock_get_profile:
+            first = rfc7033_webfinger_view(
+                RequestFactory().get("/.well-known/webfinger?resource=acct:foobar@example.com"),
+            )
+            second = rfc7033_webfinger_view(
+                RequestFactory().get("/.well-known/webfinger?resource=acct:FooBar@example.com"),
+            )
+            assert mock_get_profile.call_count == 1
+            assert second.content == first.content
+            assert second["Content-Type"] == "application/jrd+json"
+            assert second["Cache-Control"] == "max-age=59"
+            not_modified = rfc7033_webfinger_view(RequestFactory().get(
+                "/.well-known/webfinger?resource=acct:foobar@example.com", HTTP_IF_NONE_MATCH=first["ETag"],
+            ))
+            assert not_modified.status_code == 304
+            invalidate_webfinger("Foobar@example.com")
+            rfc7033_webfinger_view(RequestFactory().get("/.well-known/webfinger?resource=acct:foobar@example.com"))
+            assert mock_get_profile.call_count == 2
+
     def test_rendered_webfinger_returned(self):
         request = RequestFactory().get("/.well-known/webfinger?resource=acct:foobar@example.com")
         response = rfc7033_webfinger_view(request)
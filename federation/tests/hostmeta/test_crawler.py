@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, Mock
+
+from federation.hostmeta.crawler import crawl_hosts, SOURCES
+from federation.hostmeta.fetchers import fetch_nodeinfo_document
+from federation.utils.network import get_fetch_scope
+
+
+def mock_fetcher(source):
+    return Mock(side_effect=lambda host: {"host": host, "source": source})
+
+
+class TestCrawlHosts:
+    def test_fetches_all_sources_per_host(self):
+        fetchers = {source: mock_fetcher(source) for source in SOURCES}
+        with patch.multiple(
+                "federation.hostmeta.fetchers", **{"fetch_%s_document" % source: fetcher
+                                                   for source, fetcher in fetchers.items()}):
+            results = dict(crawl_hosts(["a.example.com", "b.example.com"]))
+        assert set(results) == {"a.example.com", "b.example.com"}
+        for host, host_results in results.items():
+            assert host_results == {source: {"host": host, "source": source} for source in SOURCES}
+        for fetcher in fetchers.values():
+            assert fetcher.call_count == 2
+
+    @patch("federation.hostmeta.fetchers.fetch_nodeinfo_document", side_effect=ValueError)
+    @patch("federation.hostmeta.fetchers.fetch_nodeinfo2_document", return_value=None)
+    def test_failing_source_has_no_result(self, mock_nodeinfo2, mock_nodeinfo):
+        results = list(crawl_hosts(["example.com"], sources=("nodeinfo", "nodeinfo2")))
+        assert results == [("example.com", {"nodeinfo": None, "nodeinfo2": None})]
+
+    def test_sources_run_in_fetch_scope_of_host(self):
+        scopes = {}
+
+        def fetch(host):
+            scopes.setdefault(host, set()).add(get_fetch_scope())
+
+        with patch("federation.hostmeta.fetchers.fetch_nodeinfo_document", side_effect=fetch), \
+                patch("federation.hostmeta.fetchers.fetch_nodeinfo2_document", side_effect=fetch):
+            list(crawl_hosts(["a.example.com", "b.example.com"], sources=("nodeinfo", "nodeinfo2")))
+        assert len(scopes["a.example.com"]) == 1
+        assert len(scopes["b.example.com"]) == 1
+        assert scopes["a.example.com"] != scopes["b.example.com"]
+        assert None not in scopes["a.example.com"]
+
+    def test_parallelism_is_bounded(self):
+        lock = threading.Lock()
+        counts = {"running": 0, "max": 0, "per_host": {}, "max_per_host": 0}
+
+        def fetch(host):
+            with lock:
+                counts["running"] += 1
+                counts["per_host"][host] = counts["per_host"].get(host, 0) + 1
+                counts["max"] = max(counts["max"], counts["running"])
+                counts["max_per_host"] = max(counts["max_per_host"], counts["per_host"][host])
+            time.sleep(0.01)
+            with lock:
+                counts["running"] -= 1
+                counts["per_host"][host] -= 1
+
+        with patch.multiple(
+                "federation.hostmeta.fetchers", **{"fetch_%s_document" % source: Mock(side_effect=fetch)
+                                                   for source in SOURCES}):
+            results = list(crawl_hosts(
+                ["host%s.example.com" % i for i in range(6)], max_workers=4, max_per_host=2,
+            ))
+        assert len(results) == 6
+        assert counts["max"] <= 4
+        assert counts["max_per_host"] <= 2
+
+    def test_deadline(self):
+        release = threading.Event()
+
+        def fetch_slow(host):
+            release.wait(5)
+            return {"slow": True}
+
+        with patch("federation.hostmeta.fetchers.fetch_nodeinfo_document", side_effect=fetch_slow), \
+                patch("federation.hostmeta.fetchers.fetch_nodeinfo2_document", return_value={"fast": True}):
+            started = time.monotonic()
+            results = list(crawl_hosts(["example.com"], sources=("nodeinfo", "nodeinfo2"), timeout=0.2))
+            release.set()
+        assert time.monotonic() - started < 2
+        assert results == [("example.com", {"nodeinfo": None, "nodeinfo2": {"fast": True}})]
+
+    def test_deadline_starts_when_host_starts(self):
+        def fetch(host):
+            time.sleep(0.4 if host == "slow.example.com" else 0.15)
+            return {"host": host}
+
+        with patch("federation.hostmeta.fetchers.fetch_nodeinfo_document", side_effect=fetch):
+            # The second host has to wait for the worker of the first, which is left behind at its deadline
+            results = dict(crawl_hosts(
+                ["slow.example.com", "example.com"], sources=("nodeinfo",), max_workers=1, timeout=0.2,
+            ))
+        assert results == {"slow.example.com": {"nodeinfo": None}, "example.com": {"nodeinfo": {"host": "example.com"}}}
+
+    def test_abandoned_sources_count_against_max_workers(self):
+        submitted = []
+        counts = {"max": 0}
+
+        class CountingExecutor(ThreadPoolExecutor):
+            def submit(self, fn, *args, **kwargs):
+                future = super().submit(fn, *args, **kwargs)
+                submitted.append(future)
+                counts["max"] = max(counts["max"], len([f for f in submitted if not f.done()]))
+                return future
+
+        def fetch(host):
+            time.sleep(0.5 if host == "slow.example.com" else 0.05)
+
+        with patch("federation.hostmeta.crawler.ThreadPoolExecutor", CountingExecutor), \
+                patch("federation.hostmeta.fetchers.fetch_nodeinfo_document", side_effect=fetch):
+            results = list(crawl_hosts(
+                ["slow.example.com"] + ["host%s.example.com" % i for i in range(6)], sources=("nodeinfo",),
+                max_workers=2, max_per_host=1, timeout=0.1,
+            ))
+        assert len(results) == 7
+        assert counts["max"] <= 2
+
+    def test_hosts_are_consumed_lazily(self):
+        consumed = []
+
+        def hosts():
+            for i in range(10):
+                consumed.append(i)
+                yield "host%s.example.com" % i
+
+        with patch("federation.hostmeta.fetchers.fetch_nodeinfo_document", return_value=None):
+            crawl = crawl_hosts(hosts(), sources=("nodeinfo",), max_workers=2, max_per_host=1)
+            next(crawl)
+            assert len(consumed) <= 3
+            crawl.close()
+
+
+class TestNestedFetches:
+    @patch("federation.hostmeta.fetchers.parse_nodeinfo_document", return_value={"platform": "pleroma"})
+    @patch("federation.hostmeta.fetchers.fetch_document")
+    def test_mastodon_source_reuses_nodeinfo_of_pleroma(self, mock_fetch, mock_parse):
+        def fetch_document(url=None, host=None, path="/"):
+            if path == "/api/v1/instance":
+                return '{"version": "2.7.2 (compatible; Pleroma 1.0.0)"}', 200, None
+            if path == "/.well-known/nodeinfo":
+                return '{"links": [{"href": "https://example.com/nodeinfo/2.0", ' \
+                       '"rel": "http://nodeinfo.diaspora.software/ns/schema/2.0"}]}', 200, None
+            return '{"version": "2.0"}', 200, None
+
+        mock_fetch.side_effect = fetch_document
+        results = dict(crawl_hosts(["example.com"], sources=("nodeinfo", "mastodon")))
+        assert results["example.com"] == {"nodeinfo": {"platform": "pleroma"}, "mastodon": {"platform": "pleroma"}}
+        assert mock_parse.call_count == 1
+
+    @patch("federation.hostmeta.fetchers.parse_nodeinfo_document", return_value={"platform": "pleroma"})
+    @patch("federation.hostmeta.fetchers.fetch_document", return_value=(
+        '{"links": [{"href": "https://example.com/nodeinfo/2.0", '
+        '"rel": "http://nodeinfo.diaspora.software/ns/schema/2.0"}]}', 200, None,
+    ))
+    def test_fetchers_without_scope_are_not_shared(self, mock_fetch, mock_parse):
+        fetch_nodeinfo_document("example.com")
+        fetch_nodeinfo_document("example.com")
+        assert mock_parse.call_count == 2
@@ -0,0 +1,106 @@
+import datetime
+
+import pytest
+from xrd import XRD, Link, Element, Property, Title
+
+from federation.hostmeta.generators import DiasporaHostMeta, DiasporaWebFinger
+from federation.hostmeta.serializers import XRDTemplate, escape, serialize_xrd
+from federation.tests.fixtures.payloads import DIASPORA_HOSTMETA, DIASPORA_WEBFINGER
+
+
+def test_escape():
+    assert escape('a&b<c>"d"') == "a&amp;b&lt;c&gt;&quot;d&quot;"
+
+
+class TestSerializeXRD:
+    def test_empty(self):
+        assert serialize_xrd(XRD()) == '<?xml version="1.0" encoding="UTF-8"?>\n' \
+                                       '<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">\n' \
+                                       '</XRD>\n'
+
+    def test_full(self):
+        xrd = XRD(xml_id="foo", subject="acct:foo@example.com")
+        xrd.expires = datetime.datetime(2020, 1, 1)
+        xrd.aliases.append("https://example.com/?a=1&b=2")
+        xrd.properties.append(Property("https://example.com/property", "value"))
+        xrd.properties.append(Property("https://example.com/nil"))
+        xrd.elements.append(Element("Custom", "value"))
+        link = Link(rel="self", type_="text/html", href="https://example.com")
+        link.titles.append(Title("Hello"))
+        link.properties.append(Property("https://example.com/nil"))
+        xrd.links.append(link)
+        xrd.links.append(Link(rel="lrdd", template="https://example.com/?q={uri}"))
+        assert serialize_xrd(xrd) == """<?xml version="1.0" encoding="UTF-8"?>
+<XRD xml:id="foo" xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+  <Expires>2020-01-01T00:00:00</Expires>
+  <Subject>acct:foo@example.com</Subject>
+  <Alias>https://example.com/?a=1&amp;b=2</Alias>
+  <Property type="https://example.com/property">value</Property>
+  <Property type="https://example.com/nil" xsi:nil="true"/>
+  <Custom>value</Custom>
+  <Link href="https://example.com" rel="self" type="text/html">
+    <Title>Hello</Title>
+    <Property type="https://example.com/nil" xsi:nil="true"/>
+  </Link>
+  <Link rel="lrdd" template="https://example.com/?q={uri}"/>
+</XRD>
+"""
+
+    def test_link_with_href_and_template_raises(self):
+        xrd = XRD()
+        xrd.links.append(Link(href="https://example.com", template="https://example.com/{uri}"))
+        with pytest.raises(ValueError):
+            serialize_xrd(xrd)
+
+
+class TestXRDTemplate:
+    def test_fill(self):
+        xrd = XRD()
+        xrd.elements.append(Element("Subject", "acct:%s" % XRDTemplate.placeholder("address")))
+        xrd.links.append(Link(rel="self", href=XRDTemplate.placeholder("address")))
+        template = XRDTemplate(xrd)
+        assert template.fill(address='foo"@example.com') == """<?xml version="1.0" encoding="UTF-8"?>
+<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+  <Subject>acct:foo&quot;@example.com</Subject>
+  <Link href="foo&quot;@example.com" rel="self"/>
+</XRD>
+"""
+
+
+class TestGenerators:
+    def test_diaspora_host_meta(self):
+        hostmeta = DiasporaHostMeta(webfinger_host="https://example.com")
+        assert hostmeta.render() == DIASPORA_HOSTMETA.encode("UTF-8")
+        assert hostmeta.render() is DiasporaHostMeta(webfinger_host="https://example.com").render()
+
+    def test_diaspora_host_meta__modified_xrd(self):
+        hostmeta = DiasporaHostMeta(webfinger_host="https://example.com")
+        hostmeta.xrd.links.append(Link(rel="foo", href="https://example.com/foo"))
+        assert b'<Link href="https://example.com/foo" rel="foo"/>' in hostmeta.render()
+        assert b"foo" not in DiasporaHostMeta(webfinger_host="https://example.com").render()
+
+    def test_diaspora_webfinger__template_matches_xrd(self):
+        kwargs = dict(
+            handle='user"<&>@server.example', host="https://server.example", guid="0123&456", public_key="ABCDEF==",
+        )
+        webfinger = DiasporaWebFinger(**kwargs)
+        assert webfinger.render() == serialize_xrd(DiasporaWebFinger(**kwargs).xrd).encode("UTF-8")
+
+    def test_diaspora_webfinger__modified_xrd(self):
+        webfinger = DiasporaWebFinger(
+            handle="user@server.example", host="https://server.example", guid="0123456789abcdef",
+            public_key="ABCDEF==",
+        )
+        webfinger.xrd.links.append(Link(rel="foo", href="https://example.com/foo"))
+        rendered = webfinger.render().decode("UTF-8")
+        assert rendered == DIASPORA_WEBFINGER.replace(
+            "</XRD>", '  <Link href="https://example.com/foo" rel="foo"/>\n</XRD>',
+        )
+
+    def test_diaspora_host_meta__assigned_xrd(self):
+        hostmeta = DiasporaHostMeta(webfinger_host="https://example.com")
+        xrd = XRD()
+        xrd.links.append(Link(rel="foo", href="https://example.com/foo"))
+        hostmeta.xrd = xrd
+        assert hostmeta.xrd is xrd
+        assert hostmeta.render() == serialize_xrd(xrd).encode("UTF-8")
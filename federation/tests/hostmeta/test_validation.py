@@ -0,0 +1,116 @@
+from unittest.mock import patch
+
+import json
+
+import pytest
+from jsonschema import ValidationError
+
+from federation.hostmeta.generators import NodeInfo
+from federation.hostmeta.validation import (
+    clear_validated_documents, get_schema_validator, render_document, validate_document,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_validated():
+    clear_validated_documents()
+    yield
+    clear_validated_documents()
+
+
+def get_nodeinfo(**kwargs):
+    return NodeInfo(
+        software={"name": "diaspora", "version": "0.5.4.3"},
+        protocols={"inbound": ["diaspora"], "outbound": ["diaspora"]},
+        services={"inbound": ["pumpio"], "outbound": ["twitter"]},
+        open_registrations=True,
+        usage={"users": {}},
+        metadata={},
+        **kwargs
+    )
+
+
+class TestGetSchemaValidator:
+    def test_validator_is_compiled_once(self):
+        assert get_schema_validator("nodeinfo-1.0") is get_schema_validator("nodeinfo-1.0")
+        assert get_schema_validator("nodeinfo-1.0") is not get_schema_validator("social-relay-well-known")
+
+
+class TestValidateDocument:
+    def test_raises_on_invalid_document(self):
+        with pytest.raises(ValidationError):
+            validate_document({"subscribe": True, "scope": "cities", "tags": []}, "social-relay-well-known")
+
+    def test_valid_rendered_document_is_validated_once(self):
+        doc = {"subscribe": True, "scope": "all", "tags": []}
+        with patch(
+                "federation.hostmeta.validation.get_schema_validator", wraps=get_schema_validator,
+        ) as mock_validate:
+            validate_document(doc, "social-relay-well-known", rendered='{"a": 1}')
+            validate_document(doc, "social-relay-well-known", rendered='{"a": 1}')
+            assert mock_validate.call_count == 1
+            validate_document(doc, "social-relay-well-known", rendered='{"a": 2}')
+            validate_document(doc, "social-relay-well-known")
+            assert mock_validate.call_count == 3
+
+    def test_invalid_rendered_document_is_validated_again(self):
+        doc = {"subscribe": True, "scope": "cities", "tags": []}
+        for _i in range(2):
+            with pytest.raises(ValidationError):
+                validate_document(doc, "social-relay-well-known", rendered="{}")
+
+
+class TestRenderDocument:
+    def test_unchanged_document_is_rendered_once(self):
+        with patch("federation.hostmeta.validation.json.dumps", wraps=json.dumps) as mock_dumps:
+            rendered = render_document({"subscribe": True, "scope": "all", "tags": []}, "social-relay-well-known")
+            assert render_document({"subscribe": True, "scope": "all", "tags": []}, "social-relay-well-known") == \
+                rendered
+            assert mock_dumps.call_count == 1
+
+    def test_values_of_different_types_are_rendered_separately(self):
+        assert render_document({"a": 1}) == '{"a": 1}'
+        assert render_document({"a": True}) == '{"a": true}'
+        assert render_document({"a": [1]}) == '{"a": [1]}'
+        assert render_document({"a": {"0": 1}}) == '{"a": {"0": 1}}'
+
+    def test_invalid_document_is_not_remembered(self):
+        doc = {"subscribe": True, "scope": "cities", "tags": []}
+        for _i in range(2):
+            with pytest.raises(ValidationError):
+                render_document(doc, "social-relay-well-known")
+
+
+class TestNodeInfoRender:
+    def test_unchanged_document_is_rendered_once(self):
+        with patch("federation.hostmeta.validation.json.dumps", wraps=json.dumps) as mock_dumps:
+            rendered = get_nodeinfo().render()
+            assert get_nodeinfo().render() == rendered
+            assert mock_dumps.call_count == 1
+
+    def test_unchanged_document_is_validated_once(self):
+        with patch(
+                "federation.hostmeta.validation.get_schema_validator", wraps=get_schema_validator,
+        ) as mock_validate:
+            rendered = get_nodeinfo().render()
+            assert get_nodeinfo().render() == rendered
+            assert mock_validate.call_count == 1
+            get_nodeinfo(skip_validate=True).render()
+            assert mock_validate.call_count == 1
+
+    def test_changed_document_is_validated(self):
+        with patch(
+                "federation.hostmeta.validation.get_schema_validator", wraps=get_schema_validator,
+        ) as mock_validate:
+            get_nodeinfo().render()
+            nodeinfo = get_nodeinfo()
+            nodeinfo.doc["usage"] = {"users": {"total": 10}}
+            nodeinfo.render()
+            assert mock_validate.call_count == 2
+
+    def test_invalid_document_warns_each_time(self):
+        nodeinfo = get_nodeinfo()
+        nodeinfo.doc["software"]["what_is_this_evil_key_here"] = True
+        for _i in range(2):
+            with pytest.warns(UserWarning):
+                nodeinfo.render()
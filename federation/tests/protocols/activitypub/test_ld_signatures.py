@@ -0,0 +1,83 @@
+import datetime
+from unittest.mock import patch
+
+import pytest
+from pyld import jsonld
+
+from federation.protocols.activitypub import ld_signatures
+from federation.protocols.activitypub.ld_signatures import (
+    create_ld_signature, document_loader, get_ld_signature_creator, normalize, register_context, sign_document,
+    verify_ld_signature,
+)
+from federation.tests.fixtures.keys import PUBKEY
+from federation.tests.fixtures.payloads import ACTIVITYPUB_FOLLOW
+
+
+@pytest.fixture
+def document():
+    return dict(ACTIVITYPUB_FOLLOW, to=["https://www.w3.org/ns/activitystreams#Public"])
+
+
+class TestDocumentLoader:
+    def test_serves_bundled_contexts(self):
+        loaded = document_loader("https://www.w3.org/ns/activitystreams")
+        assert loaded["documentUrl"] == "https://www.w3.org/ns/activitystreams"
+        assert "@context" in loaded["document"]
+        assert "@context" in document_loader("https://w3id.org/security/v1")["document"]
+        assert document_loader("http://w3id.org/security/v1")["document"] == \
+            document_loader("https://w3id.org/security/v1")["document"]
+
+    def test_raises_for_unknown_context(self):
+        with pytest.raises(jsonld.JsonLdError):
+            document_loader("https://example.com/context")
+
+    def test_serves_registered_contexts(self):
+        register_context("https://example.com/context", {"@context": {"foo": "https://example.com/foo"}})
+        try:
+            assert document_loader("https://example.com/context")["document"] == {
+                "@context": {"foo": "https://example.com/foo"},
+            }
+        finally:
+            ld_signatures._contexts.pop("https://example.com/context")
+
+
+@patch("requests.get")
+def test_normalize_does_no_network_access(mock_get, document):
+    assert "<https://www.w3.org/ns/activitystreams#actor> <https://example.com/actor>" in normalize(document)
+    assert not mock_get.called
+
+
+class TestCreateLDSignature:
+    def test_creates_signature(self, document, private_key, public_key):
+        signature = create_ld_signature(
+            document, private_key, "https://example.com/actor#main-key", datetime.datetime(2019, 4, 27, 1, 2, 3),
+        )
+        assert signature["type"] == "RsaSignature2017"
+        assert signature["creator"] == "https://example.com/actor#main-key"
+        assert signature["created"] == "2019-04-27T01:02:03Z"
+        assert verify_ld_signature(dict(document, signature=signature), public_key)
+
+    def test_sign_document(self, document, private_key):
+        sign_document(document, private_key, "https://example.com/actor#main-key")
+        assert get_ld_signature_creator(document) == "https://example.com/actor#main-key"
+
+
+class TestVerifyLDSignature:
+    def test_fails_for_changed_document(self, document, private_key, public_key):
+        sign_document(document, private_key, "https://example.com/actor#main-key")
+        document["object"] = "https://example.com/someone-else"
+        assert not verify_ld_signature(document, public_key)
+
+    def test_fails_for_wrong_key(self, document, private_key):
+        sign_document(document, private_key, "https://example.com/actor#main-key")
+        assert not verify_ld_signature(document, PUBKEY)
+
+    def test_fails_for_missing_or_unsupported_signature(self, document, public_key):
+        assert not verify_ld_signature(document, public_key)
+        document["signature"] = {"type": "Foobar", "creator": "https://example.com/actor#main-key"}
+        assert not verify_ld_signature(document, public_key)
+
+    def test_fails_for_unknown_context(self, document, private_key, public_key):
+        sign_document(document, private_key, "https://example.com/actor#main-key")
+        document["@context"] = "https://example.com/context"
+        assert not verify_ld_signature(document, public_key)
@@ -1,6 +1,12 @@
 import json
+from unittest.mock import Mock, patch
 
-from federation.protocols.activitypub.protocol import identify_request, identify_id
+import pytest
+
+from federation.exceptions import SenderNotAllowedError
+from federation.protocols.activitypub.ld_signatures import sign_document
+from federation.protocols.activitypub.protocol import identify_request, identify_id, Protocol
+from federation.tests.fixtures.payloads import ACTIVITYPUB_FOLLOW
 from federation.types import RequestType
 
 
@@ -21,3 +27,36 @@ class TestIdentifyRequest:
         assert not identify_request(RequestType(body='foo'))
         assert not identify_request(RequestType(body='<xml></<xml>'))
         assert not identify_request(RequestType(body=b'<xml></<xml>'))
+
+
+class TestReceive:
+    def test_receive_raises_if_sender_filter_rejects_sender(self):
+        protocol = Protocol()
+        sender_key_fetcher = Mock()
+        sender_filter = Mock(return_value=False)
+        with pytest.raises(SenderNotAllowedError):
+            protocol.receive(
+                RequestType(body=json.dumps(ACTIVITYPUB_FOLLOW)), sender_key_fetcher=sender_key_fetcher,
+                sender_filter=sender_filter,
+            )
+        sender_filter.assert_called_once_with("https://example.com/actor")
+        assert not sender_key_fetcher.called
+
+    @patch("federation.protocols.activitypub.protocol.verify_request_signature")
+    def test_receive_accepts_valid_ld_signature(self, mock_verify, private_key, public_key):
+        payload = dict(ACTIVITYPUB_FOLLOW)
+        sign_document(payload, private_key, "https://example.com/actor#main-key")
+        sender, _payload = Protocol().receive(
+            RequestType(body=json.dumps(payload)), sender_key_fetcher=Mock(return_value=public_key),
+        )
+        assert sender == "https://example.com/actor"
+        assert not mock_verify.called
+
+    @patch("federation.protocols.activitypub.protocol.verify_request_signature")
+    def test_receive_falls_back_to_http_signature(self, mock_verify, private_key, public_key):
+        payload = dict(ACTIVITYPUB_FOLLOW)
+        sign_document(payload, private_key, "https://example.com/actor#main-key")
+        payload["object"] = "https://example.com/someone-else"
+        request = RequestType(body=json.dumps(payload))
+        Protocol().receive(request, sender_key_fetcher=Mock(return_value=public_key))
+        mock_verify.assert_called_once_with(request, public_key)
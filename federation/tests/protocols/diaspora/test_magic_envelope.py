@@ -5,7 +5,7 @@ from lxml import etree
 from lxml.etree import _Element
 
 from federation.exceptions import SignatureVerificationError
-from federation.protocols.diaspora.magic_envelope import MagicEnvelope
+from federation.protocols.diaspora.magic_envelope import MagicEnvelope, decode_data
 from federation.tests.fixtures.keys import get_dummy_private_key, PUBKEY
 from federation.tests.fixtures.payloads import DIASPORA_PUBLIC_PAYLOAD
 
@@ -29,6 +29,28 @@ class TestMagicEnvelope:
         payload = env.create_payload()
         assert payload == "PHN0YXR1c19tZXNzYWdlPjxmb28-YmFyPC9mb28-PC9zdGF0dXNfbWVzc2FnZT4="
 
+    @patch("federation.protocols.diaspora.magic_envelope.fromstring")
+    def test_create_payload__element(self, mock_fromstring):
+        env = MagicEnvelope(
+            message=etree.fromstring("<status_message><foo>bar</foo></status_message>"),
+            private_key="key",
+            author_handle="foobar@example.com",
+        )
+        payload = env.create_payload()
+        assert payload == "PHN0YXR1c19tZXNzYWdlPjxmb28-YmFyPC9mb28-PC9zdGF0dXNfbWVzc2FnZT4="
+        assert not mock_fromstring.called
+
+    def test_build__element_can_be_verified(self):
+        private_key = get_dummy_private_key()
+        env = MagicEnvelope(
+            message=etree.fromstring("<status_message><foo>b\u00e4r</foo></status_message>"),
+            private_key=private_key,
+            author_handle="foobar@example.com",
+        )
+        rendered = env.render()
+        env = MagicEnvelope(payload=rendered, public_key=private_key.publickey(), verify=True)
+        assert env.message == "<status_message><foo>b\u00e4r</foo></status_message>".encode("utf-8")
+
     def test_extract_payload(self, diaspora_public_payload):
         env = MagicEnvelope()
         env.payload = diaspora_public_payload
@@ -40,6 +62,11 @@ class TestMagicEnvelope:
         assert env.author_handle == "foobar@example.com"
         assert env.message == b"<status_message><foo>bar</foo></status_message>"
 
+    def test_payload_extracted_on_init__bytes(self):
+        env = MagicEnvelope(payload=b"\n  " + DIASPORA_PUBLIC_PAYLOAD.encode("utf-8"))
+        assert env.author_handle == "foobar@example.com"
+        assert env.message == b"<status_message><foo>bar</foo></status_message>"
+
     @patch("federation.protocols.diaspora.magic_envelope.fetch_public_key", autospec=True)
     def test_fetch_public_key__calls_sender_key_fetcher(self, mock_fetch):
         mock_fetcher = Mock(return_value="public key")
@@ -134,3 +161,9 @@ class TestMagicEnvelope:
     def test_get_sender(self):
         doc = etree.fromstring(bytes(DIASPORA_PUBLIC_PAYLOAD, encoding="utf-8"))
         assert MagicEnvelope.get_sender(doc) == "foobar@example.com"
+
+
+def test_decode_data():
+    assert decode_data("PD94bWw-Pz8_") == b"<?xml>???"
+    assert decode_data("PHN0YXR1c19tZXNzYWdlPjxmb28-YmFyPC9mb28-PC9zdGF0dXNfbWVzc2FnZT4=") == \
+        b"<status_message><foo>bar</foo></status_message>"
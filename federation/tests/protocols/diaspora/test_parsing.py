@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+import pytest
+from lxml import etree
+
+from federation.protocols.diaspora.magic_envelope import MagicEnvelope
+from federation.protocols.diaspora.parsing import (
+    fromstring, iterparse_magic_envelope, parse_magic_envelope, get_parser)
+from federation.tests.fixtures.payloads import DIASPORA_PUBLIC_PAYLOAD, DIASPORA_POST_SIMPLE
+
+
+class TestFromstring:
+    def test_parses_document(self):
+        doc = fromstring(DIASPORA_POST_SIMPLE)
+        assert doc.tag == "status_message"
+
+    def test_does_not_resolve_entities(self, tmpdir):
+        secret = tmpdir.join("secret.txt")
+        secret.write("secret")
+        doc = fromstring(
+            '<!DOCTYPE foo [<!ENTITY xxe SYSTEM "file://%s">]><foo>&xxe;</foo>' % secret
+        )
+        assert "secret" not in etree.tostring(doc).decode("utf-8")
+
+    def test_raises_on_too_large_document(self):
+        with pytest.raises(ValueError):
+            fromstring("<foo>%s</foo>" % ("a" * 100), max_size=50)
+
+    def test_raises_on_too_deep_document(self):
+        assert fromstring("<a><b><c/></b></a>", max_depth=3) is not None
+        with pytest.raises(ValueError):
+            fromstring("<a><b><c><d/></c></b></a>", max_depth=3)
+
+    def test_raises_on_invalid_document(self):
+        with pytest.raises(etree.XMLSyntaxError):
+            fromstring("<foo>")
+
+    def test_parser_is_reused(self):
+        assert get_parser() is get_parser()
+
+
+class TestIterparseMagicEnvelope:
+    def test_keeps_envelope_elements(self):
+        streamed = iterparse_magic_envelope(DIASPORA_PUBLIC_PAYLOAD)
+        doc = fromstring(DIASPORA_PUBLIC_PAYLOAD)
+        assert streamed.tag == doc.tag
+        for tag in ("data", "sig", "encoding", "alg"):
+            element = doc.find(".//{http://salmon-protocol.org/ns/magic-env}%s" % tag)
+            streamed_element = streamed.find(".//{http://salmon-protocol.org/ns/magic-env}%s" % tag)
+            assert streamed_element.text == element.text
+            assert dict(streamed_element.attrib) == dict(element.attrib)
+
+    def test_drops_other_elements(self):
+        streamed = iterparse_magic_envelope(DIASPORA_PUBLIC_PAYLOAD.replace(
+            "<me:alg>", "<foo><bar>baz</bar></foo><me:alg>",
+        ))
+        assert streamed.find(".//foo") is None
+        assert len(streamed) == 4
+
+    def test_verifies(self, private_key, public_key):
+        payload = MagicEnvelope(
+            message="<status_message><foo>bar</foo></status_message>",
+            private_key=private_key,
+            author_handle="foobar@example.com",
+        ).render()
+        doc = iterparse_magic_envelope(payload)
+        assert MagicEnvelope.get_sender(doc) == "foobar@example.com"
+        MagicEnvelope(doc=doc, public_key=public_key, verify=True)
+
+    def test_raises_on_too_deep_document(self):
+        with pytest.raises(ValueError):
+            iterparse_magic_envelope(DIASPORA_PUBLIC_PAYLOAD, max_depth=1)
+
+
+class TestParseMagicEnvelope:
+    @patch("federation.protocols.diaspora.parsing.iterparse_magic_envelope")
+    def test_small_document_is_parsed_in_full(self, mock_iterparse):
+        doc = parse_magic_envelope(DIASPORA_PUBLIC_PAYLOAD)
+        assert doc.tag == "{http://salmon-protocol.org/ns/magic-env}env"
+        assert not mock_iterparse.called
+
+    @patch("federation.protocols.diaspora.parsing.STREAMING_THRESHOLD", new=100)
+    @patch("federation.protocols.diaspora.parsing.iterparse_magic_envelope")
+    def test_large_document_is_parsed_incrementally(self, mock_iterparse):
+        parse_magic_envelope(DIASPORA_PUBLIC_PAYLOAD)
+        assert mock_iterparse.called
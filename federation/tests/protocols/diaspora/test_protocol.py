@@ -1,11 +1,11 @@
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 
 from lxml import etree
 import pytest
 
 from federation.entities.diaspora.entities import DiasporaPost
 from federation.entities.diaspora.mappers import get_outbound_entity
-from federation.exceptions import NoSenderKeyFoundError, SignatureVerificationError
+from federation.exceptions import NoSenderKeyFoundError, SignatureVerificationError, SenderNotAllowedError
 from federation.protocols.diaspora.protocol import Protocol, identify_request
 from federation.tests.fixtures.keys import PUBKEY, get_dummy_private_key
 from federation.tests.fixtures.payloads import DIASPORA_PUBLIC_PAYLOAD, DIASPORA_ENCRYPTED_PAYLOAD, \
@@ -85,6 +85,16 @@ class TestDiasporaProtocol(DiasporaTestBase):
         with pytest.raises(SignatureVerificationError):
             protocol.receive(RequestType(body=DIASPORA_PUBLIC_PAYLOAD), user)
 
+    @patch("federation.protocols.diaspora.protocol.fetch_public_key", autospec=True)
+    def test_receive_raises_if_sender_filter_rejects_sender(self, mock_fetch):
+        protocol = self.init_protocol()
+        user = self.get_mock_user()
+        sender_filter = Mock(return_value=False)
+        with pytest.raises(SenderNotAllowedError):
+            protocol.receive(RequestType(body=DIASPORA_PUBLIC_PAYLOAD), user, sender_filter=sender_filter)
+        sender_filter.assert_called_once_with("foobar@example.com")
+        assert not mock_fetch.called
+
     def test_get_message_content(self):
         protocol = self.init_protocol()
         protocol.doc = self.get_unencrypted_doc()
@@ -94,12 +104,17 @@ class TestDiasporaProtocol(DiasporaTestBase):
     def test_identify_payload_with_diaspora_public_payload(self):
         assert identify_request(RequestType(body=DIASPORA_PUBLIC_PAYLOAD)) is True
         assert identify_request(RequestType(body=bytes(DIASPORA_PUBLIC_PAYLOAD, encoding="utf-8"))) is True
+        assert identify_request(RequestType(body=memoryview(DIASPORA_PUBLIC_PAYLOAD.encode("utf-8")))) is True
+        assert identify_request(RequestType(body="\n  " + DIASPORA_PUBLIC_PAYLOAD)) is True
 
     def test_identify_payload_with_diaspora_encrypted_payload(self):
         assert identify_request(RequestType(body=DIASPORA_ENCRYPTED_PAYLOAD)) is True
+        assert identify_request(RequestType(body=DIASPORA_ENCRYPTED_PAYLOAD.encode("utf-8"))) is True
 
     def test_identify_payload_with_other_payload(self):
         assert identify_request(RequestType(body="foobar not a diaspora protocol")) is False
+        assert identify_request(RequestType(body=b'{"@context": "https://www.w3.org/ns/activitystreams"}')) is False
+        assert identify_request(RequestType(body=b"<foo>bar</foo>")) is False
 
     def test_identify_payload_with_reshare(self):
         assert identify_request(RequestType(body=DIASPORA_RESHARE_PAYLOAD)) is True
@@ -118,8 +133,9 @@ class TestDiasporaProtocol(DiasporaTestBase):
             handle="johnny@localhost",
         ))
         mock_me.assert_called_once_with(
-            etree.tostring(entity.to_xml()), private_key=private_key, author_handle="johnny@localhost",
+            ANY, private_key=private_key, author_handle="johnny@localhost",
         )
+        assert etree.tostring(mock_me.call_args[0][0]) == etree.tostring(entity.to_xml())
         mock_render.assert_called_once_with()
         assert data == "rendered"
 
@@ -138,8 +154,9 @@ class TestDiasporaProtocol(DiasporaTestBase):
             handle="johnny@localhost",
         ))
         mock_me.assert_called_once_with(
-            etree.tostring(entity.to_xml()), private_key=private_key, author_handle="johnny@localhost",
+            ANY, private_key=private_key, author_handle="johnny@localhost",
         )
+        assert etree.tostring(mock_me.call_args[0][0]) == etree.tostring(entity.to_xml())
         mock_render.assert_called_once_with()
         mock_encrypt.assert_called_once_with(
             "rendered", "public key",
@@ -156,7 +173,7 @@ class TestDiasporaProtocol(DiasporaTestBase):
         )
         protocol.build_send(entity, from_user)
         mock_me.assert_called_once_with(
-            b"<xml>foo</xml>", private_key=from_user.private_key, author_handle="foobar@domain.tld",
+            outbound_doc, private_key=from_user.private_key, author_handle="foobar@domain.tld",
         )
 
     @patch("federation.protocols.diaspora.protocol.EncryptedPayload.decrypt")
@@ -179,3 +196,15 @@ class TestDiasporaProtocol(DiasporaTestBase):
         protocol.store_magic_envelope_doc("<foo>bar</foo>")
         assert protocol.doc.tag == "foo"
         assert protocol.doc.text == "bar"
+
+    def test_store_magic_envelope_doc_xml_payload__bytes(self):
+        protocol = Protocol()
+        protocol.store_magic_envelope_doc(b"\n  <foo>bar</foo>")
+        assert protocol.doc.tag == "foo"
+        assert protocol.doc.text == "bar"
+
+    def test_store_magic_envelope_doc_xml_payload__quoted(self):
+        protocol = Protocol()
+        protocol.store_magic_envelope_doc(b"%3Cfoo%3Eb%C3%A4r%3C%2Ffoo%3E")
+        assert protocol.doc.tag == "foo"
+        assert protocol.doc.text == "bär"
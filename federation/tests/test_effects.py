@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+from federation.effects import (
+    SideEffect, collect_side_effects, dispatch_side_effects, run_side_effect, run_side_effect_in_background,
+)
+from federation.entities.base import Post
+
+
+def test_side_effect_is_callable():
+    function = Mock(return_value="foo")
+    assert SideEffect("foo", function, ("bar",), {"baz": 1})() == "foo"
+    function.assert_called_once_with("bar", baz=1)
+
+
+def test_run_side_effect_logs_exceptions():
+    run_side_effect(SideEffect("foo", Mock(side_effect=Exception)))
+
+
+@patch("federation.effects._close_database_connections")
+def test_run_side_effect_in_background(mock_close):
+    function = Mock(return_value="foo")
+    future = run_side_effect_in_background(SideEffect("foo", function))
+    assert future.result(timeout=5) is None
+    function.assert_called_once_with()
+    assert mock_close.called
+    run_side_effect_in_background(SideEffect("foo", Mock(side_effect=Exception))).result(timeout=5)
+
+
+class TestCollectSideEffects:
+    def test_collects_from_entities_and_children(self):
+        entity = Post()
+        child = Post()
+        entity._children = [child]
+        entity.add_side_effect("foo", Mock())
+        child.add_side_effect("bar", Mock())
+        assert [effect.name for effect in collect_side_effects([entity])] == ["foo", "bar"]
+        assert collect_side_effects([entity]) == []
+
+    def test_does_not_compute_deferred_children(self):
+        entity = Post()
+        compute = Mock(return_value=[])
+        entity.defer("_children", compute)
+        entity.add_side_effect("foo", Mock())
+        assert [effect.name for effect in collect_side_effects([entity])] == ["foo"]
+        assert not compute.called
+
+
+class TestDispatchSideEffects:
+    def test_runs_side_effects_by_default(self):
+        entity = Post()
+        function = Mock()
+        entity.add_side_effect("foo", function)
+        dispatch_side_effects([entity])
+        function.assert_called_once_with()
+
+    def test_passes_side_effects_to_executor_function(self):
+        entity = Post()
+        function = Mock()
+        entity.add_side_effect("foo", function)
+        executor = Mock()
+        effects = dispatch_side_effects([entity], executor)
+        executor.assert_called_once_with(effects[0])
+        assert not function.called
+
+    def test_submits_side_effects_to_executor(self):
+        entity = Post()
+        function = Mock()
+        entity.add_side_effect("foo", function, "bar")
+        with ThreadPoolExecutor() as executor:
+            dispatch_side_effects([entity], executor)
+        function.assert_called_once_with("bar")
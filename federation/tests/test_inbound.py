@@ -1,7 +1,9 @@
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 
 import pytest
 
+from federation.effects import run_side_effect
+from federation.entities.base import Post
 from federation.exceptions import NoSuitableProtocolFoundError
 from federation.inbound import handle_receive
 from federation.protocols.diaspora.protocol import Protocol
@@ -26,3 +28,43 @@ class TestHandleReceiveProtocolIdentification:
         payload = RequestType(body="foobar")
         with pytest.raises(NoSuitableProtocolFoundError):
             handle_receive(payload)
+
+
+class TestHandleReceiveSideEffects:
+    @staticmethod
+    def receive(entity, **kwargs):
+        payload = RequestType(body=DIASPORA_PUBLIC_PAYLOAD)
+        with patch.object(Protocol, 'receive', return_value=("foobar@domain.tld", "<foobar></foobar>")), \
+                patch("federation.entities.diaspora.mappers.message_to_objects", return_value=[entity]):
+            return handle_receive(payload, **kwargs)
+
+    def test_runs_side_effects_in_background(self):
+        entity = Post()
+        function = Mock()
+        entity.add_side_effect("foo", function)
+        with patch("federation.effects._executor") as mock_executor:
+            self.receive(entity)
+        assert mock_executor.submit.call_args[0][1].name == "foo"
+        assert not function.called
+
+    def test_runs_side_effects(self):
+        entity = Post()
+        function = Mock()
+        entity.add_side_effect("foo", function)
+        self.receive(entity, side_effect_executor=run_side_effect)
+        function.assert_called_once_with()
+
+    def test_dispatches_side_effects_to_executor(self):
+        entity = Post()
+        entity.add_side_effect("foo", Mock())
+        executor = Mock()
+        self.receive(entity, side_effect_executor=executor)
+        assert executor.call_args[0][0].name == "foo"
+
+    def test_leaves_side_effects_on_entities(self):
+        entity = Post()
+        function = Mock()
+        entity.add_side_effect("foo", function)
+        _sender, _protocol, entities = self.receive(entity, side_effect_executor=None)
+        assert not function.called
+        assert [effect.name for effect in entities[0]._side_effects] == ["foo"]
@@ -1,3 +1,4 @@
+import json
 from unittest.mock import Mock, patch
 
 import pytest
@@ -78,6 +79,7 @@ class TestHandleSend:
             'Content-Type': 'application/ld+json; profile="https://www.w3.org/ns/activitystreams"',
         }
         assert encode_if_text("https://www.w3.org/ns/activitystreams#Public") in args[1]
+        assert json.loads(args[1])["signature"]["creator"] == "foo@example.com#main-key"
 
         # Ensure diaspora public payloads and recipients, one per unique host
         args3, kwargs3 = mock_send.call_args_list[3]
@@ -95,3 +97,27 @@ class TestHandleSend:
         with pytest.raises(IndexError):
             # noinspection PyStatementEffect
             mock_send.call_args_list[5]
+
+    @patch("federation.outbound.sign_document")
+    def test_signs_public_activitypub_payload_once(self, mock_sign, mock_send, profile):
+        recipients = [
+            {
+                "endpoint": "https://example.net/inbox", "fid": "https://example.net/foobar", "public": True,
+                "protocol": "activitypub",
+            },
+            {
+                "endpoint": "https://example.org/inbox", "fid": "https://example.org/barfoo", "public": True,
+                "protocol": "activitypub",
+            },
+        ]
+        author = UserType(private_key=get_dummy_private_key(), id="foo@example.com", handle="foo@example.com")
+        handle_send(profile, author, recipients)
+        assert mock_sign.call_count == 1
+        assert {args[0] for args, _kwargs in mock_send.call_args_list} == {
+            "https://example.net/inbox", "https://example.org/inbox",
+        }
+        payloads = {args[1] for args, _kwargs in mock_send.call_args_list}
+        assert len(payloads) == 1
+        payload = json.loads(payloads.pop())
+        assert payload["to"] == ["https://www.w3.org/ns/activitystreams#Public"]
+        assert payload["cc"] == ["https://example.net/foobar", "https://example.org/barfoo"]
@@ -4,7 +4,22 @@ from unittest.mock import patch, Mock
 from federation.entities.activitypub.entities import ActivitypubFollow, ActivitypubPost
 from federation.tests.fixtures.payloads import (
     ACTIVITYPUB_FOLLOW, ACTIVITYPUB_POST, ACTIVITYPUB_POST_OBJECT, ACTIVITYPUB_POST_OBJECT_IMAGES)
-from federation.utils.activitypub import retrieve_and_parse_document, retrieve_and_parse_profile
+from federation.utils.activitypub import (
+    fetch_activitypub_document, retrieve_and_parse_document, retrieve_and_parse_profile, retrieve_and_parse_collection, retrieve_collection_items,
+)
+
+
+@patch("federation.utils.activitypub.fetch_document")
+def test_fetch_activitypub_document(mock_fetch):
+    mock_fetch.return_value = '{"type": "Person"}', 200, None
+    assert fetch_activitypub_document("https://example.com/actor") == {"type": "Person"}
+    mock_fetch.assert_called_once_with(
+        "https://example.com/actor", extra_headers={'accept': 'application/activity+json'},
+    )
+    mock_fetch.return_value = "foobar", 200, None
+    assert fetch_activitypub_document("https://example.com/actor") is None
+    mock_fetch.return_value = None, None, Exception()
+    assert fetch_activitypub_document("https://example.com/actor") is None
 
 
 class TestRetrieveAndParseDocument:
@@ -53,6 +68,134 @@ class TestRetrieveAndParseDocument:
         assert entity is None
 
 
+def collection_documents(pages=3, items_per_page=2):
+    documents = {
+        "https://example.com/followers": {
+            "id": "https://example.com/followers",
+            "type": "OrderedCollection",
+            "totalItems": pages * items_per_page,
+            "first": "https://example.com/followers?page=1",
+        },
+    }
+    for page in range(1, pages + 1):
+        documents["https://example.com/followers?page=%s" % page] = {
+            "id": "https://example.com/followers?page=%s" % page,
+            "type": "OrderedCollectionPage",
+            "next": "https://example.com/followers?page=%s" % (page + 1) if page < pages else None,
+            "orderedItems": [
+                "https://example.com/actor%s" % ((page - 1) * items_per_page + i) for i in range(items_per_page)
+            ],
+        }
+    return documents
+
+
+class TestRetrieveCollectionItems:
+    def test_follows_pages(self):
+        documents = collection_documents()
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get) as mock_fetch:
+            items = list(retrieve_collection_items("https://example.com/followers"))
+        assert items == ["https://example.com/actor%s" % i for i in range(6)]
+        assert mock_fetch.call_count == 4
+
+    def test_fetches_pages_lazily(self):
+        documents = collection_documents()
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get) as mock_fetch:
+            items = retrieve_collection_items("https://example.com/followers")
+            assert mock_fetch.call_count == 0
+            assert next(items) == "https://example.com/actor0"
+            assert mock_fetch.call_count == 2
+            assert next(items) == "https://example.com/actor1"
+            assert mock_fetch.call_count == 2
+            items.close()
+        assert mock_fetch.call_count == 2
+
+    def test_max_items(self):
+        documents = collection_documents()
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get) as mock_fetch:
+            items = list(retrieve_collection_items("https://example.com/followers", max_items=3))
+        assert items == ["https://example.com/actor%s" % i for i in range(3)]
+        assert mock_fetch.call_count == 3
+
+    def test_max_pages(self):
+        documents = collection_documents()
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get):
+            items = list(retrieve_collection_items("https://example.com/followers", max_pages=2))
+        assert items == ["https://example.com/actor%s" % i for i in range(4)]
+
+    def test_embedded_first_page_and_inline_items(self):
+        documents = {
+            "https://example.com/following": {
+                "id": "https://example.com/following",
+                "type": "Collection",
+                "first": {
+                    "type": "CollectionPage",
+                    "items": ["https://example.com/actor0"],
+                    "next": "https://example.com/following?page=2",
+                },
+            },
+            "https://example.com/following?page=2": {
+                "id": "https://example.com/following?page=2",
+                "type": "CollectionPage",
+                "items": "https://example.com/actor1",
+            },
+            "https://example.com/outbox": {
+                "id": "https://example.com/outbox",
+                "type": "OrderedCollection",
+                "orderedItems": ["https://example.com/actor2"],
+            },
+        }
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get):
+            assert list(retrieve_collection_items("https://example.com/following")) == [
+                "https://example.com/actor0", "https://example.com/actor1",
+            ]
+            assert list(retrieve_collection_items("https://example.com/outbox")) == ["https://example.com/actor2"]
+
+    def test_stops_on_page_loop(self):
+        documents = collection_documents(pages=2)
+        documents["https://example.com/followers?page=2"]["next"] = "https://example.com/followers?page=1"
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get) as mock_fetch:
+            items = list(retrieve_collection_items("https://example.com/followers"))
+        assert len(items) == 4
+        assert mock_fetch.call_count == 3
+
+    def test_stops_on_failed_fetch(self):
+        documents = collection_documents()
+        del documents["https://example.com/followers?page=2"]
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get):
+            items = list(retrieve_collection_items("https://example.com/followers"))
+        assert items == ["https://example.com/actor0", "https://example.com/actor1"]
+
+    @patch("federation.utils.activitypub.fetch_activitypub_document", return_value=None)
+    def test_returns_nothing_for_missing_collection(self, mock_fetch):
+        assert list(retrieve_collection_items("https://example.com/followers")) == []
+
+
+class TestRetrieveAndParseCollection:
+    def test_maps_objects_and_returns_ids(self):
+        documents = {
+            "https://example.com/outbox": {
+                "id": "https://example.com/outbox",
+                "type": "OrderedCollection",
+                "first": {
+                    "type": "OrderedCollectionPage",
+                    "orderedItems": [ACTIVITYPUB_POST, {"foo": "bar"}, "https://example.com/activity"],
+                },
+            },
+        }
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get):
+            items = list(retrieve_and_parse_collection("https://example.com/outbox"))
+        assert len(items) == 2
+        assert isinstance(items[0], ActivitypubPost)
+        assert items[1] == "https://example.com/activity"
+
+    def test_max_items(self):
+        documents = collection_documents()
+        with patch("federation.utils.activitypub.fetch_activitypub_document", side_effect=documents.get) as mock_fetch:
+            items = list(retrieve_and_parse_collection("https://example.com/followers", max_items=2))
+        assert items == ["https://example.com/actor0", "https://example.com/actor1"]
+        assert mock_fetch.call_count == 2
+
+
 class TestRetrieveAndParseProfile:
     @patch("federation.utils.activitypub.retrieve_and_parse_document", autospec=True)
     def test_calls_retrieve_and_parse_document(self, mock_retrieve):
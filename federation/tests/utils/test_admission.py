@@ -0,0 +1,58 @@
+from federation.utils.admission import DomainIndex, SenderFilter, get_sender_domain
+
+
+def test_get_sender_domain():
+    assert get_sender_domain("foobar@example.com") == "example.com"
+    assert get_sender_domain("foobar@Example.com:3000") == "example.com"
+    assert get_sender_domain("https://example.com/u/foobar/") == "example.com"
+    assert get_sender_domain("https://Social.Example.com:8000/u/foobar/") == "social.example.com"
+    assert get_sender_domain("") == ""
+
+
+class TestDomainIndex:
+    def test_matches_domain_and_subdomains(self):
+        index = DomainIndex(["example.com", "bad.example.org"])
+        assert "example.com" in index
+        assert "social.example.com" in index
+        assert "bad.example.org" in index
+        assert "sub.bad.example.org" in index
+        assert "example.org" not in index
+        assert "goodexample.com" not in index
+        assert "com" not in index
+
+    def test_match_returns_indexed_domain(self):
+        index = DomainIndex(["Example.com."])
+        assert index.match("social.example.com") == "example.com"
+        assert index.match("example.net") is None
+        assert index.match("") is None
+
+    def test_len(self):
+        index = DomainIndex(["example.com", "example.com", "example.org"])
+        assert len(index) == 2
+
+    def test_empty_labels(self):
+        index = DomainIndex(["example.com"])
+        index.add("a..example.com")
+        assert len(index) == 2
+        assert index.match("a..example.com") == "example.com"
+        assert index.match("..example.org") is None
+
+
+class TestSenderFilter:
+    def test_blocked(self):
+        sender_filter = SenderFilter(blocked=["example.com"])
+        assert sender_filter("foobar@example.org")
+        assert sender_filter("https://example.org/u/foobar/")
+        assert not sender_filter("foobar@example.com")
+        assert not sender_filter("https://social.example.com/u/foobar/")
+
+    def test_allowed(self):
+        sender_filter = SenderFilter(blocked=["bad.example.com"], allowed=["example.com"])
+        assert sender_filter("foobar@example.com")
+        assert sender_filter("foobar@social.example.com")
+        assert not sender_filter("foobar@bad.example.com")
+        assert not sender_filter("foobar@example.org")
+
+    def test_empty_sender_is_not_admitted(self):
+        assert not SenderFilter()("")
+        assert not SenderFilter()(None)
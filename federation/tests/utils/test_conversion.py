@@ -0,0 +1,93 @@
+from unittest.mock import Mock, patch
+
+from federation.utils.conversion import (
+    ConversionCache, html_to_markdown, markdown_to_html, get_conversion_cache, set_conversion_cache,
+)
+
+
+class TestConversionCache:
+    def test_convert_caches_result(self):
+        cache = ConversionCache()
+        converter = Mock(return_value="converted")
+        assert cache.convert("test", converter, "content") == "converted"
+        assert cache.convert("test", converter, "content") == "converted"
+        converter.assert_called_once_with("content")
+        assert cache.hits == 1
+        assert cache.misses == 1
+        assert cache.hit_rate == 0.5
+
+    def test_convert_keeps_conversions_apart(self):
+        cache = ConversionCache()
+        assert cache.convert("upper", str.upper, "content") == "CONTENT"
+        assert cache.convert("title", str.title, "content") == "Content"
+        assert cache.misses == 2
+
+    def test_evicts_least_recently_used_by_entries(self):
+        cache = ConversionCache(max_entries=2)
+        cache.convert("test", str.upper, "a")
+        cache.convert("test", str.upper, "b")
+        cache.convert("test", str.upper, "a")
+        cache.convert("test", str.upper, "c")
+        assert len(cache) == 2
+        assert cache.evictions == 1
+        converter = Mock(return_value="A")
+        cache.convert("test", converter, "a")
+        assert not converter.called
+        converter = Mock(return_value="B")
+        cache.convert("test", converter, "b")
+        assert converter.called
+
+    def test_evicts_by_size(self):
+        cache = ConversionCache(max_size=10)
+        cache.convert("test", str.upper, "a" * 6)
+        cache.convert("test", str.upper, "b" * 6)
+        assert len(cache) == 1
+        assert cache.size == 6
+        assert cache.evictions == 1
+
+    def test_does_not_cache_results_larger_than_max_size(self):
+        cache = ConversionCache(max_size=10)
+        assert cache.convert("test", str.upper, "a" * 11) == "A" * 11
+        assert len(cache) == 0
+        assert cache.size == 0
+
+    def test_stats_and_clear(self):
+        cache = ConversionCache()
+        cache.convert("test", str.upper, "a")
+        cache.convert("test", str.upper, "a")
+        assert cache.stats() == {
+            "entries": 1,
+            "evictions": 0,
+            "hit_rate": 0.5,
+            "hits": 1,
+            "misses": 1,
+            "size": 1,
+        }
+        cache.clear()
+        assert cache.stats()["entries"] == 0
+        assert cache.hit_rate == 0.0
+
+
+class TestConversions:
+    def setup_method(self):
+        set_conversion_cache(ConversionCache())
+
+    def teardown_method(self):
+        set_conversion_cache(ConversionCache())
+
+    def test_html_to_markdown(self):
+        assert html_to_markdown("<p>foo <strong>bar</strong></p>").strip() == "foo **bar**"
+        assert html_to_markdown("<p>foo <strong>bar</strong></p>").strip() == "foo **bar**"
+        assert get_conversion_cache().hits == 1
+
+    def test_markdown_to_html(self):
+        assert markdown_to_html("foo **bar**") == "<p>foo <strong>bar</strong></p>\n"
+        assert markdown_to_html("foo **bar**") == "<p>foo <strong>bar</strong></p>\n"
+        assert get_conversion_cache().hits == 1
+
+    @patch("federation.utils.conversion.commonmark", return_value="<p>foo</p>")
+    def test_conversions_without_cache(self, mock_commonmark):
+        set_conversion_cache(None)
+        markdown_to_html("foo")
+        markdown_to_html("foo")
+        assert mock_commonmark.call_count == 2
@@ -0,0 +1,77 @@
+import pytest
+from Crypto.PublicKey import RSA
+
+from federation.tests.fixtures.keys import PUBKEY
+from federation.utils import crypto
+from federation.utils.crypto import (
+    CryptographyBackend, PycryptodomeBackend, get_crypto_backend, set_crypto_backend, import_rsa_key)
+
+
+@pytest.fixture(params=[CryptographyBackend, PycryptodomeBackend])
+def backend(request):
+    return request.param()
+
+
+@pytest.fixture
+def reset_backend():
+    yield
+    set_crypto_backend(None)
+
+
+class TestBackends:
+    def test_sign_and_verify(self, backend, private_key, public_key):
+        signature = backend.sign(private_key, b"foobar")
+        assert backend.verify(public_key, b"foobar", signature)
+        assert backend.verify(private_key.publickey(), b"foobar", signature)
+        assert not backend.verify(public_key, b"barfoo", signature)
+        assert not backend.verify(PUBKEY, b"foobar", signature)
+
+    def test_signatures_match_between_backends(self, private_key):
+        assert CryptographyBackend().sign(private_key, b"foobar") == PycryptodomeBackend().sign(private_key, b"foobar")
+
+    def test_encrypt_and_decrypt(self, backend, private_key, public_key):
+        encrypted = backend.encrypt(public_key, b"foobar")
+        assert backend.decrypt(private_key, encrypted) == b"foobar"
+        other = CryptographyBackend if isinstance(backend, PycryptodomeBackend) else PycryptodomeBackend
+        assert other().decrypt(private_key, encrypted) == b"foobar"
+
+    def test_decrypt_raises_on_failure(self, backend, private_key):
+        with pytest.raises(ValueError):
+            backend.decrypt(private_key, b"foobar")
+
+    def test_aes_encrypt_and_decrypt(self, backend):
+        key, iv = b"k" * 32, b"i" * 16
+        encrypted = backend.aes_encrypt(key, iv, b"a" * 32)
+        assert encrypted == PycryptodomeBackend().aes_encrypt(key, iv, b"a" * 32)
+        assert backend.aes_decrypt(key, iv, encrypted) == b"a" * 32
+
+    def test_accepts_pem_strings(self, backend, private_key):
+        signature = backend.sign(private_key.exportKey().decode("ascii"), b"foobar")
+        assert backend.verify(private_key.publickey().exportKey().decode("ascii"), b"foobar", signature)
+
+
+def test_import_rsa_key_is_cached():
+    assert import_rsa_key(PUBKEY) is import_rsa_key(PUBKEY)
+    assert import_rsa_key(PUBKEY) == RSA.importKey(PUBKEY)
+
+
+class TestGetCryptoBackend:
+    def test_defaults_to_cryptography(self, reset_backend):
+        set_crypto_backend(None)
+        assert get_crypto_backend().name == "cryptography"
+
+    def test_falls_back_to_pycryptodome(self, reset_backend, monkeypatch):
+        monkeypatch.setattr(crypto, "rsa", None)
+        set_crypto_backend(None)
+        assert get_crypto_backend().name == "pycryptodome"
+
+    def test_set_crypto_backend(self, reset_backend):
+        set_crypto_backend("pycryptodome")
+        assert isinstance(get_crypto_backend(), PycryptodomeBackend)
+        backend = CryptographyBackend()
+        set_crypto_backend(backend)
+        assert get_crypto_backend() is backend
+
+    def test_set_crypto_backend_raises_on_unknown_backend(self, reset_backend):
+        with pytest.raises(ValueError):
+            set_crypto_backend("foobar")
@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from federation.tests.django import utils
+from federation.utils.django import (
+    get_configuration, get_function_from_config, get_resolved_configuration, reset_configuration,
+)
+
+
+class TestGetConfiguration:
+    def test_combines_defaults_and_settings(self):
+        config = get_configuration()
+        assert config["base_url"] == "https://example.com"
+        assert config["hcard_path"] == "/hcard/users/"
+        assert config["nodeinfo2_function"] is None
+
+    def test_is_computed_once(self):
+        assert get_configuration() is get_configuration()
+
+    def test_is_read_only(self):
+        with pytest.raises(TypeError):
+            get_configuration()["base_url"] = "https://example.net"
+
+    def test_setting_change_invalidates(self, settings):
+        resolved = get_resolved_configuration()
+        settings.FEDERATION = dict(settings.FEDERATION, base_url="https://example.net")
+        assert get_resolved_configuration() is not resolved
+        assert get_configuration()["base_url"] == "https://example.net"
+
+    def test_raises_for_missing_settings(self, settings):
+        settings.FEDERATION = {"base_url": "https://example.com"}
+        with pytest.raises(ImproperlyConfigured):
+            get_configuration()
+
+    def test_reset_configuration(self):
+        resolved = get_resolved_configuration()
+        reset_configuration()
+        assert get_resolved_configuration() is not resolved
+
+
+class TestGetFunctionFromConfig:
+    def test_imports_module_once(self):
+        reset_configuration()
+        with patch("federation.utils.django.importlib.import_module", return_value=utils) as mock_import:
+            assert get_function_from_config("get_profile_function") is utils.get_profile
+            assert get_function_from_config("get_profile_function") is utils.get_profile
+        mock_import.assert_called_once_with("federation.tests.django.utils")
+
+    def test_patched_function_is_used(self):
+        get_function_from_config("get_profile_function")
+        with patch("federation.tests.django.utils.get_profile") as mock_get_profile:
+            assert get_function_from_config("get_profile_function") is mock_get_profile
+
+    def test_raises_for_unconfigured_function(self):
+        with pytest.raises(AttributeError):
+            get_function_from_config("nodeinfo2_function")
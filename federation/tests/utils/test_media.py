@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+import pytest
+
+from federation.utils import media
+from federation.utils.media import (
+    guess_media_type_from_bytes, guess_media_type_from_url, guess_media_type, fetch_media_type, probe_media_type,
+    set_media_type_probing,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    media._cache.clear()
+    yield
+    media._cache.clear()
+    set_media_type_probing(False)
+
+
+def test_guess_media_type_from_bytes():
+    assert guess_media_type_from_bytes(b"\xff\xd8\xff\xe0foobar") == "image/jpeg"
+    assert guess_media_type_from_bytes(b"\x89PNG\r\n\x1a\nfoobar") == "image/png"
+    assert guess_media_type_from_bytes(b"GIF89afoobar") == "image/gif"
+    assert guess_media_type_from_bytes(b"<html>") == ""
+    assert guess_media_type_from_bytes(b"") == ""
+
+
+class TestGuessMediaTypeFromUrl:
+    def test_extension(self):
+        assert guess_media_type_from_url("https://example.com/foo/bar.png") == "image/png"
+        assert guess_media_type_from_url("https://example.com/foo/bar.JPEG?size=large#foo") == "image/jpeg"
+        assert guess_media_type_from_url("https://example.com/foo/bar.gif") == "image/gif"
+
+    def test_unknown_or_missing_extension(self):
+        assert guess_media_type_from_url("https://example.com/foo/bar") == ""
+        assert guess_media_type_from_url("https://example.com/foo.d/bar") == ""
+        assert guess_media_type_from_url("https://example.com/foo/bar.html") == ""
+        assert guess_media_type_from_url("https://example.com/?image=bar.png") == ""
+
+    def test_data_uri(self):
+        assert guess_media_type_from_url("data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAAB") == "image/png"
+        assert guess_media_type_from_url("data:application/octet-stream;base64,R0lGODlhAQABAAAAACw=") == "image/gif"
+        assert guess_media_type_from_url("data:image/jpeg,foobar") == "image/jpeg"
+        assert guess_media_type_from_url("data:Image/GIF;base64,!!!!") == "image/gif"
+
+
+class TestFetchMediaType:
+    @patch("federation.utils.media.fetch_content_start")
+    @patch("federation.utils.media.fetch_content_type", return_value="image/png; charset=binary")
+    def test_uses_content_type(self, mock_fetch, mock_start):
+        assert fetch_media_type("https://example.com/foo") == "image/png"
+        assert not mock_start.called
+        assert guess_media_type("https://example.com/foo") == "image/png"
+
+    @patch("federation.utils.media.fetch_content_start", return_value=b"\xff\xd8\xff\xe0")
+    @patch("federation.utils.media.fetch_content_type", return_value="application/octet-stream")
+    def test_falls_back_to_content_bytes(self, mock_fetch, mock_start):
+        assert fetch_media_type("https://example.com/foo") == "image/jpeg"
+        mock_start.assert_called_once_with("https://example.com/foo", 8)
+
+    @patch("federation.utils.media.fetch_content_start", return_value=None)
+    @patch("federation.utils.media.fetch_content_type", return_value=None)
+    def test_failure_is_not_cached(self, mock_fetch, mock_start):
+        assert fetch_media_type("https://example.com/foo") == ""
+        assert "https://example.com/foo" not in media._cache
+
+
+def test_probing_is_disabled_by_default():
+    assert probe_media_type("https://example.com/foo") is None
+
+
+class TestProbeMediaType:
+    @pytest.fixture(autouse=True)
+    def enable_probing(self):
+        set_media_type_probing(True)
+
+    @patch("federation.utils.media.fetch_content_type", return_value="image/gif")
+    def test_probes_in_background(self, mock_fetch):
+        future = probe_media_type("https://example.com/foo")
+        assert future.result(timeout=5) == "image/gif"
+        mock_fetch.assert_called_once_with("https://example.com/foo")
+        assert "https://example.com/foo" not in media._pending
+
+    @patch("federation.utils.media.fetch_content_type", side_effect=Exception)
+    def test_returns_empty_on_error(self, mock_fetch):
+        assert probe_media_type("https://example.com/foo").result(timeout=5) == ""
+
+    def test_disabled(self):
+        set_media_type_probing(False)
+        assert probe_media_type("https://example.com/foo") is None
@@ -1,11 +1,16 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, Mock, call
 
 import pytest
+import requests
 from requests import HTTPError
-from requests.exceptions import SSLError, RequestException
+from requests.exceptions import SSLError, RequestException, Timeout, ConnectionError
 
 from federation.utils.network import (
-    fetch_document, USER_AGENT, send_document, fetch_country_by_ip, fetch_host_ip_and_country, fetch_host_ip)
+    fetch_document, USER_AGENT, send_document, fetch_country_by_ip, fetch_host_ip_and_country, fetch_host_ip,
+    fetch_content_start, FetchScope, fetch_scope, get_fetch_scope, get_request_timeout)
 
 
 @patch('federation.utils.network.ipdata', autospec=True)
@@ -18,6 +23,21 @@ class TestFetchCountryByIp:
         assert country == 'DE'
 
 
+class TestFetchContentStart:
+    @patch("federation.utils.network.requests.get")
+    def test_fetches_range(self, mock_get):
+        mock_get.return_value.__enter__.return_value.iter_content.return_value = iter([b"foobar"])
+        assert fetch_content_start("https://example.com/foo", 4) == b"foob"
+        mock_get.assert_called_once_with(
+            "https://example.com/foo", headers={'user-agent': USER_AGENT, 'Range': 'bytes=0-3'}, timeout=10,
+            stream=True,
+        )
+
+    @patch("federation.utils.network.requests.get", side_effect=RequestException)
+    def test_returns_none_on_error(self, mock_get):
+        assert fetch_content_start("https://example.com/foo") is None
+
+
 class TestFetchDocument:
     call_args = {"timeout": 10, "headers": {'user-agent': USER_AGENT}}
 
@@ -105,6 +125,123 @@ class TestFetchDocument:
         assert exc.__class__ == RequestException
 
 
+class TestFetchScope:
+    def test_fetch_scope__sets_and_restores_scope(self):
+        assert get_fetch_scope() is None
+        with fetch_scope() as scope:
+            assert get_fetch_scope() is scope
+            with fetch_scope(FetchScope()) as inner:
+                assert get_fetch_scope() is inner
+            assert get_fetch_scope() is scope
+        assert get_fetch_scope() is None
+
+    def test_get_request_timeout(self):
+        assert get_request_timeout(10) == 10
+        with fetch_scope(FetchScope(deadline=time.monotonic() + 5)):
+            assert 0 < get_request_timeout(10) <= 5
+            assert get_request_timeout(1) == 1
+
+    def test_share__calls_once_per_key(self):
+        scope = FetchScope()
+        func = Mock(side_effect=lambda value: value * 2)
+        assert scope.share("a", func, 1) == 2
+        assert scope.share("a", func, 1) == 2
+        assert scope.share("b", func, 2) == 4
+        assert func.call_count == 2
+
+    def test_share__concurrent_calls_wait_for_first(self):
+        scope = FetchScope()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(scope.share, "a", func)
+            started.wait(5)
+            second = executor.submit(scope.share, "a", func)
+            release.set()
+            assert first.result(5) == second.result(5) == "result"
+        assert len(calls) == 1
+
+    def test_share__exception_is_shared(self):
+        scope = FetchScope()
+        with pytest.raises(ValueError):
+            scope.share("a", Mock(side_effect=ValueError))
+        with pytest.raises(ValueError):
+            scope.share("a", Mock())
+
+    @patch("federation.utils.network.requests.get", return_value=Mock(status_code=200, text="foo"))
+    def test_fetch_document__fetches_once_in_scope(self, mock_get):
+        with fetch_scope():
+            assert fetch_document(host="example.com", path="/foo") == ("foo", 200, None)
+            assert fetch_document(host="example.com", path="/foo") == ("foo", 200, None)
+            fetch_document(host="example.com", path="/bar")
+        assert mock_get.call_count == 2
+        fetch_document(host="example.com", path="/foo")
+        assert mock_get.call_count == 3
+
+    @patch("federation.utils.network.requests.get", return_value=Mock(
+        status_code=200, text="foo", iter_content=Mock(return_value=[b"foo"]),
+    ))
+    def test_fetch_document__timeout_limited_by_deadline(self, mock_get):
+        with fetch_scope(FetchScope(deadline=time.monotonic() + 2)):
+            fetch_document(url="https://example.com")
+        assert mock_get.call_args[1]["timeout"] <= 2
+        assert mock_get.call_args[1]["stream"] is True
+
+    @patch("federation.utils.network.requests.get")
+    def test_fetch_document__reads_response_within_deadline(self, mock_get):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = Mock(spec=["stream"], stream=Mock(return_value=iter([b'{"foo": ', b'"bar"}'])))
+        mock_get.return_value = response
+        with fetch_scope(FetchScope(deadline=time.monotonic() + 2)):
+            assert fetch_document(url="https://example.com") == ('{"foo": "bar"}', 200, None)
+
+    @patch("federation.utils.network.requests.get")
+    def test_fetch_document__slow_response_stopped_at_deadline(self, mock_get):
+        def trickle():
+            while True:
+                time.sleep(0.05)
+                yield b"x"
+
+        mock_get.return_value = Mock(status_code=200, iter_content=Mock(return_value=trickle()))
+        started = time.monotonic()
+        with fetch_scope(FetchScope(deadline=time.monotonic() + 0.2)):
+            doc, status_code, error = fetch_document(url="https://example.com")
+        assert time.monotonic() - started < 1
+        assert doc is None
+        assert isinstance(error, Timeout)
+        assert mock_get.return_value.close.called
+
+    @patch("federation.utils.network.requests.get")
+    def test_fetch_document__http_fallback_within_deadline(self, mock_get):
+        def get(url, **kwargs):
+            time.sleep(0.3)
+            raise ConnectionError()
+
+        mock_get.side_effect = get
+        with fetch_scope(FetchScope(deadline=time.monotonic() + 0.2)):
+            doc, status_code, error = fetch_document(host="example.com")
+        assert isinstance(error, Timeout)
+        assert mock_get.call_count == 1
+
+    @patch("federation.utils.network.requests.get")
+    def test_fetch_document__deadline_passed(self, mock_get):
+        with fetch_scope(FetchScope(deadline=time.monotonic() - 1)):
+            doc, status_code, error = fetch_document(url="https://example.com")
+        assert doc is None
+        assert status_code is None
+        assert isinstance(error, Timeout)
+        assert not mock_get.called
+
+
 class TestFetchHostIp:
     @patch('federation.utils.network.socket.gethostbyname', autospec=True, return_value='127.0.0.1')
     def test_calls(self, mock_get_ip):
@@ -1,4 +1,14 @@
-from federation.utils.text import decode_if_bytes, encode_if_text, validate_handle
+from federation.utils.text import (
+    as_bytes, decode_if_bytes, encode_if_text, first_non_whitespace, lstrip_bytes, unquote_bytes, validate_handle,
+)
+
+
+def test_as_bytes():
+    data = b"foobar"
+    assert as_bytes(data) is data
+    assert as_bytes("foobär") == "foobär".encode("utf-8")
+    assert as_bytes(memoryview(b"foobar")) == b"foobar"
+    assert as_bytes(bytearray(b"foobar")) == b"foobar"
 
 
 def test_decode_if_bytes():
@@ -11,6 +21,25 @@ def test_encode_if_text():
     assert encode_if_text("foobar") == b"foobar"
 
 
+def test_first_non_whitespace():
+    assert first_non_whitespace(b"  \n\t<foo/>") == b"<"
+    assert first_non_whitespace(b"{}") == b"{"
+    assert first_non_whitespace(b" \n") == b""
+    assert first_non_whitespace(b"") == b""
+
+
+def test_lstrip_bytes():
+    data = b"<foo/>"
+    assert lstrip_bytes(data) is data
+    assert lstrip_bytes(b"\n  <foo/>") == b"<foo/>"
+
+
+def test_unquote_bytes():
+    data = b"<foo>bar</foo>"
+    assert unquote_bytes(data) is data
+    assert unquote_bytes(b"%3Cfoo%3Eb%C3%A4r%3C%2Ffoo%3E") == "<foo>bär</foo>".encode("utf-8")
+
+
 def test_validate_handle():
     assert validate_handle("foo@bar.com")
     assert validate_handle("Foo@baR.com")
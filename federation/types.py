@@ -10,8 +10,11 @@ from Crypto.PublicKey.RSA import RsaKey
 class RequestType:
     """
     Emulates structure of a Django HttpRequest for compatibility.
+
+    The body is preferably given as the raw bytes received. Inbound processing works on bytes and only decodes
+    where text is required, so passing text means an extra copy of the body.
     """
-    body: Union[str, bytes] = attr.ib()
+    body: Union[str, bytes, memoryview] = attr.ib()
 
     # Required when dealing with incoming AP payloads
     headers: Dict = attr.ib(default=None)
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Optional, Any
+from typing import Optional, Any, Dict, Iterator, Union
 
 from federation.entities.activitypub.entities import ActivitypubProfile
 from federation.entities.activitypub.mappers import message_to_objects
@@ -10,6 +10,18 @@ from federation.utils.text import decode_if_bytes
 logger = logging.getLogger('federation')
 
 
+def fetch_activitypub_document(id: str) -> Optional[Dict]:
+    """Fetch a remote ActivityPub document as a dictionary."""
+    document, _status_code, _ex = fetch_document(id, extra_headers={'accept': 'application/activity+json'})
+    if not document:
+        return None
+    try:
+        document = json.loads(decode_if_bytes(document))
+    except ValueError:
+        return None
+    return document if isinstance(document, dict) else None
+
+
 def retrieve_and_parse_content(**kwargs) -> Optional[Any]:
     return retrieve_and_parse_document(kwargs.get("id"))
 
@@ -42,3 +54,100 @@ def retrieve_and_parse_profile(fid: str) -> Optional[ActivitypubProfile]:
                        profile, ex)
         return
     return profile
+
+
+def _get_page(page: Union[Dict, str, None]) -> Optional[Dict]:
+    """Get a collection page, which can be embedded or a link."""
+    if isinstance(page, str):
+        return fetch_activitypub_document(page)
+    if isinstance(page, dict):
+        if "orderedItems" in page or "items" in page or "next" in page or not page.get("id"):
+            return page
+        return fetch_activitypub_document(page["id"])
+
+
+def _get_page_items(page: Dict) -> list:
+    items = page.get("orderedItems", page.get("items"))
+    if items is None:
+        return []
+    return items if isinstance(items, list) else [items]
+
+
+def retrieve_collection_items(fid: str, max_items: int = None, max_pages: int = None) -> Iterator[Union[Dict, str]]:
+    """
+    Retrieve the items of a remote collection, for example an ``outbox``, ``followers`` or ``following`` collection.
+
+    This is a generator. The ``first`` page and then each ``next`` page is fetched only when the items of the
+    previous page have been consumed, and only the current page is held in memory. Stopping the iteration early
+    doesn't fetch any further pages.
+
+    :arg fid: ID of the collection.
+    :arg max_items: (Optional) Maximum number of items to return.
+    :arg max_pages: (Optional) Maximum number of pages to fetch, not counting the collection document itself.
+    :returns: Iterator of items as they are in the collection, either dictionaries or ID's.
+    """
+    if max_items is not None and max_items <= 0:
+        return
+    collection = fetch_activitypub_document(fid)
+    if not collection:
+        logger.warning("retrieve_collection_items - failed to fetch collection %s", fid)
+        return
+    count = 0
+    pages = 0
+    # Guards against servers linking pages in a loop
+    seen = {fid}
+    page = collection
+    next_page = collection.get("first")
+    while True:
+        for item in _get_page_items(page):
+            yield item
+            count += 1
+            if max_items is not None and count >= max_items:
+                return
+        if max_pages is not None and pages >= max_pages:
+            return
+        next_id = next_page.get("id") if isinstance(next_page, dict) else next_page
+        if not next_page or next_id in seen:
+            return
+        if next_id:
+            seen.add(next_id)
+        page = _get_page(next_page)
+        if not page:
+            logger.warning("retrieve_collection_items - failed to fetch page %s of collection %s", next_id, fid)
+            return
+        pages += 1
+        next_page = page.get("next")
+
+
+def retrieve_and_parse_collection(
+        fid: str, max_items: int = None, max_pages: int = None,
+) -> Iterator[Union[Any, str]]:
+    """
+    Retrieve a remote collection and return its items as entities.
+
+    Pages are fetched lazily, see ``retrieve_collection_items``. Embedded objects are mapped to entities as they
+    are consumed. Items that are only linked to, like the actors in a ``followers`` collection, are returned as
+    ID's. Objects that cannot be mapped are skipped and don't count against ``max_items``.
+
+    :arg fid: ID of the collection.
+    :arg max_items: (Optional) Maximum number of items to return.
+    :arg max_pages: (Optional) Maximum number of pages to fetch, not counting the collection document itself.
+    :returns: Iterator of entities and ID's.
+    """
+    if max_items is not None and max_items <= 0:
+        return
+    count = 0
+    for item in retrieve_collection_items(fid, max_pages=max_pages):
+        if isinstance(item, dict):
+            # Receivers are only resolved if they are used, not for every item of the collection
+            entities = message_to_objects(item, fid, lazy=True)
+            if not entities:
+                logger.debug("retrieve_and_parse_collection - skipping item that failed to map: %s", item.get("id"))
+                continue
+            item = entities[0]
+        elif not isinstance(item, str):
+            continue
+        yield item
+        count += 1
+        if max_items is not None and count >= max_items:
+            return
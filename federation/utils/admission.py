@@ -0,0 +1,100 @@
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+# Marks the end of a domain in the label trie
+_TERMINAL = object()
+
+
+def get_sender_domain(sender: str) -> str:
+    """
+    Get the domain part of a sender ID.
+
+    Works for both URL format ID's (ActivityPub) and handles (Diaspora). Any port is dropped.
+    """
+    if not sender:
+        return ""
+    if "://" in sender:
+        return urlparse(sender).hostname or ""
+    domain = sender.rsplit("@", 1)[-1]
+    return domain.split(":", 1)[0].strip(".").lower()
+
+
+class DomainIndex:
+    """
+    Compiled index of domains for fast suffix lookups.
+
+    Domains are stored in a trie keyed by the reversed domain labels. A domain matches the index if it
+    or any of its parent domains has been added. So adding ``example.com`` will also match ``social.example.com``.
+
+    Lookups are a walk of at most as many dictionary lookups as the looked up domain has labels.
+
+    :arg domains: Iterable of domains to add to the index.
+    """
+    def __init__(self, domains: Iterable[str] = ()):
+        self._root = {}
+        self._count = 0
+        for domain in domains:
+            self.add(domain)
+
+    def __contains__(self, domain: str) -> bool:
+        return self.match(domain) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def _labels(domain: str):
+        return reversed(domain.strip().strip(".").lower().split("."))
+
+    def add(self, domain: str) -> None:
+        """Add a domain (and so all its subdomains) to the index."""
+        node = self._root
+        for label in self._labels(domain):
+            node = node.setdefault(label, {})
+        if _TERMINAL not in node:
+            node[_TERMINAL] = domain.strip().strip(".").lower()
+            self._count += 1
+
+    def match(self, domain: str) -> Optional[str]:
+        """
+        Find the indexed domain that matches the given domain.
+
+        :returns: The matching indexed domain or ``None``.
+        """
+        if not domain:
+            return None
+        node = self._root
+        for label in self._labels(domain):
+            node = node.get(label)
+            if node is None:
+                return None
+            if _TERMINAL in node:
+                return node[_TERMINAL]
+        return None
+
+
+class SenderFilter:
+    """
+    Sender admission filter for inbound payloads.
+
+    Can be passed as ``sender_filter`` to ``federation.inbound.handle_receive``. The filter is called with the sender
+    ID as soon as the protocol has extracted it from the payload, before any key fetching or signature verification
+    happens. Returns ``True`` if the sender is admitted.
+
+    :arg blocked: Iterable of blocked domains. Subdomains of these are also blocked.
+    :arg allowed: (Optional) Iterable of allowed domains. If given, only senders from these domains (or their
+        subdomains) are admitted.
+    """
+    def __init__(self, blocked: Iterable[str] = (), allowed: Iterable[str] = None):
+        self.blocked = DomainIndex(blocked)
+        self.allowed = DomainIndex(allowed) if allowed is not None else None
+
+    def __call__(self, sender: str) -> bool:
+        domain = get_sender_domain(sender)
+        if not domain:
+            return False
+        if domain in self.blocked:
+            return False
+        if self.allowed is not None and domain not in self.allowed:
+            return False
+        return True
@@ -0,0 +1,132 @@
+"""
+Cached content conversion between HTML and markdown.
+
+Boosts and relayed copies of the same content arrive many times, so conversions are cached. The cache is keyed on
+a hash of the content, so the source content itself is not kept around. The cache is bounded both by the number
+of entries and by the total length of the cached results. The least recently used entries are evicted first.
+"""
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Callable, Dict, Optional
+
+from commonmark import commonmark
+from markdownify import markdownify
+
+# Maximum number of cached conversions
+CONVERSION_CACHE_ENTRIES = 2048
+# Maximum total length of cached conversion results, in characters
+CONVERSION_CACHE_SIZE = 8 * 1024 * 1024
+
+
+class ConversionCache:
+    """
+    Bounded cache of content conversions, with hit statistics.
+
+    :arg max_entries: Maximum number of conversions to remember.
+    :arg max_size: Maximum total length of the remembered conversion results, in characters. Results longer than
+        this are not cached at all.
+    """
+    def __init__(self, max_entries: int = CONVERSION_CACHE_ENTRIES, max_size: int = CONVERSION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Remove all cached conversions and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups that were served from the cache, between 0 and 1."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict:
+        """Get the cache statistics as a dictionary."""
+        return {
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": self.size,
+        }
+
+    def convert(self, name: str, converter: Callable[[str], str], content: str) -> str:
+        """
+        Convert content, using a cached result if the same content has been converted before.
+
+        :arg name: Name of the conversion, to keep the results of different conversions apart.
+        :arg converter: Function doing the conversion.
+        :arg content: Content to convert.
+        """
+        key = (name, sha256(content.encode("utf-8", "surrogatepass")).digest())
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = converter(content)
+        if len(result) > self.max_size:
+            return result
+        with self._lock:
+            if key in self._entries:
+                return result
+            self._entries[key] = result
+            self.size += len(result)
+            while len(self._entries) > self.max_entries or self.size > self.max_size:
+                _key, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return result
+
+
+_cache = ConversionCache()
+
+
+def get_conversion_cache() -> Optional[ConversionCache]:
+    """Get the conversion cache in use. ``None`` if conversions are not cached."""
+    return _cache
+
+
+def set_conversion_cache(cache: Optional[ConversionCache]) -> None:
+    """
+    Set the conversion cache to use.
+
+    Pass ``None`` to not cache conversions at all.
+    """
+    global _cache
+    _cache = cache
+
+
+def _convert(name: str, converter: Callable[[str], str], content: str) -> str:
+    if not content:
+        return converter(content)
+    cache = _cache
+    if cache is None:
+        return converter(content)
+    return cache.convert(name, converter, content)
+
+
+def html_to_markdown(html: str) -> str:
+    """Convert HTML to markdown using ``markdownify``."""
+    return _convert("html_to_markdown", markdownify, html)
+
+
+def markdown_to_html(text: str) -> str:
+    """Render markdown to HTML using ``commonmark``."""
+    return _convert("markdown_to_html", commonmark, text)
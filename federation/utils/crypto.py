@@ -0,0 +1,191 @@
+"""
+Pluggable RSA and AES primitives.
+
+All Diaspora protocol signing, verification and encryption goes through the backend returned by
+``get_crypto_backend``. Two backends exist. ``CryptographyBackend`` uses the OpenSSL backed ``cryptography``
+package and is used by default when available. ``PycryptodomeBackend`` uses ``pycryptodome``.
+
+Keys can be given to both backends either as ``pycryptodome`` RSA key objects or as PEM strings. The
+``cryptography`` backend additionally accepts ``cryptography`` RSA key objects. Keys are converted once and the
+conversions are cached.
+"""
+from functools import lru_cache
+from typing import Union
+
+from Crypto.Cipher import AES, PKCS1_v1_5 as PKCS1_v1_5_Cipher
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.PublicKey.RSA import RsaKey
+from Crypto.Signature import PKCS1_v1_5 as PKCS1_v1_5_Signature
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    rsa = None
+
+# How many converted keys to keep around
+KEY_CACHE_SIZE = 256
+
+_backend = None
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def import_rsa_key(key: Union[str, bytes]) -> RsaKey:
+    """Import a key in any format ``pycryptodome`` understands, caching the result."""
+    return RSA.importKey(key)
+
+
+def get_rsa_key(key: Union[RsaKey, str, bytes]) -> RsaKey:
+    if isinstance(key, RsaKey):
+        return key
+    return import_rsa_key(key)
+
+
+class PycryptodomeBackend:
+    """Crypto backend using ``pycryptodome``."""
+    name = "pycryptodome"
+
+    def sign(self, private_key: Union[RsaKey, str, bytes], message: bytes) -> bytes:
+        """Sign a message using RSASSA-PKCS1-v1_5 with SHA256."""
+        cipher = PKCS1_v1_5_Signature.new(get_rsa_key(private_key))
+        return cipher.sign(SHA256.new(message))
+
+    def verify(self, public_key: Union[RsaKey, str, bytes], message: bytes, signature: bytes) -> bool:
+        """Verify a RSASSA-PKCS1-v1_5 with SHA256 signature of a message."""
+        cipher = PKCS1_v1_5_Signature.new(get_rsa_key(public_key))
+        return cipher.verify(SHA256.new(message), signature)
+
+    def encrypt(self, public_key: Union[RsaKey, str, bytes], message: bytes) -> bytes:
+        """Encrypt a message using RSAES-PKCS1-v1_5."""
+        cipher = PKCS1_v1_5_Cipher.new(get_rsa_key(public_key))
+        return cipher.encrypt(message)
+
+    def decrypt(self, private_key: Union[RsaKey, str, bytes], ciphertext: bytes) -> bytes:
+        """Decrypt a RSAES-PKCS1-v1_5 encrypted message.
+
+        :raises ValueError: If decryption fails.
+        """
+        cipher = PKCS1_v1_5_Cipher.new(get_rsa_key(private_key))
+        message = cipher.decrypt(ciphertext, sentinel=None)
+        if message is None:
+            raise ValueError("Failed to decrypt message")
+        return message
+
+    def aes_encrypt(self, key: bytes, iv: bytes, data: bytes) -> bytes:
+        """Encrypt already padded data using AES in CBC mode."""
+        return AES.new(key, AES.MODE_CBC, iv).encrypt(data)
+
+    def aes_decrypt(self, key: bytes, iv: bytes, data: bytes) -> bytes:
+        """Decrypt data using AES in CBC mode. Padding is not removed."""
+        return AES.new(key, AES.MODE_CBC, iv).decrypt(data)
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _cryptography_public_key(n: int, e: int):
+    return rsa.RSAPublicNumbers(e, n).public_key(default_backend())
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _cryptography_private_key(n: int, e: int, d: int, p: int, q: int):
+    return rsa.RSAPrivateNumbers(
+        p=p,
+        q=q,
+        d=d,
+        dmp1=rsa.rsa_crt_dmp1(d, p),
+        dmq1=rsa.rsa_crt_dmq1(d, q),
+        iqmp=rsa.rsa_crt_iqmp(p, q),
+        public_numbers=rsa.RSAPublicNumbers(e, n),
+    ).private_key(default_backend())
+
+
+class CryptographyBackend:
+    """Crypto backend using the OpenSSL backed ``cryptography`` package."""
+    name = "cryptography"
+
+    @staticmethod
+    def _public_key(key):
+        if isinstance(key, (rsa.RSAPublicKey, rsa.RSAPrivateKey)):
+            return key if isinstance(key, rsa.RSAPublicKey) else key.public_key()
+        key = get_rsa_key(key)
+        return _cryptography_public_key(key.n, key.e)
+
+    @staticmethod
+    def _private_key(key):
+        if isinstance(key, rsa.RSAPrivateKey):
+            return key
+        key = get_rsa_key(key)
+        return _cryptography_private_key(key.n, key.e, key.d, key.p, key.q)
+
+    def sign(self, private_key, message: bytes) -> bytes:
+        """Sign a message using RSASSA-PKCS1-v1_5 with SHA256."""
+        return self._private_key(private_key).sign(message, padding.PKCS1v15(), hashes.SHA256())
+
+    def verify(self, public_key, message: bytes, signature: bytes) -> bool:
+        """Verify a RSASSA-PKCS1-v1_5 with SHA256 signature of a message."""
+        try:
+            self._public_key(public_key).verify(signature, message, padding.PKCS1v15(), hashes.SHA256())
+        except InvalidSignature:
+            return False
+        return True
+
+    def encrypt(self, public_key, message: bytes) -> bytes:
+        """Encrypt a message using RSAES-PKCS1-v1_5."""
+        return self._public_key(public_key).encrypt(message, padding.PKCS1v15())
+
+    def decrypt(self, private_key, ciphertext: bytes) -> bytes:
+        """Decrypt a RSAES-PKCS1-v1_5 encrypted message.
+
+        :raises ValueError: If decryption fails.
+        """
+        return self._private_key(private_key).decrypt(ciphertext, padding.PKCS1v15())
+
+    def aes_encrypt(self, key: bytes, iv: bytes, data: bytes) -> bytes:
+        """Encrypt already padded data using AES in CBC mode."""
+        encryptor = Cipher(algorithms.AES(key), modes.CBC(iv), default_backend()).encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+
+    def aes_decrypt(self, key: bytes, iv: bytes, data: bytes) -> bytes:
+        """Decrypt data using AES in CBC mode. Padding is not removed."""
+        decryptor = Cipher(algorithms.AES(key), modes.CBC(iv), default_backend()).decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+
+
+BACKENDS = {
+    CryptographyBackend.name: CryptographyBackend,
+    PycryptodomeBackend.name: PycryptodomeBackend,
+}
+
+
+def get_crypto_backend():
+    """
+    Get the crypto backend in use.
+
+    Defaults to ``CryptographyBackend`` if the ``cryptography`` package is available, otherwise
+    ``PycryptodomeBackend``.
+    """
+    global _backend
+    if _backend is None:
+        _backend = CryptographyBackend() if rsa is not None else PycryptodomeBackend()
+    return _backend
+
+
+def set_crypto_backend(backend: Union[str, object, None]) -> None:
+    """
+    Set the crypto backend to use.
+
+    :arg backend: Backend name (``"cryptography"`` or ``"pycryptodome"``), a backend instance, or ``None`` to go
+        back to the default.
+    :raises ValueError: If the backend name is unknown or the backend is not available.
+    """
+    global _backend
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError("Unknown crypto backend %s" % backend)
+        if backend == CryptographyBackend.name and rsa is None:
+            raise ValueError("Crypto backend cryptography is not available")
+        backend = BACKENDS[backend]()
+    _backend = backend
@@ -1,40 +1,111 @@
 import importlib
+import threading
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
+DEFAULT_CONFIGURATION = MappingProxyType({
+    "get_object_function": None,
+    "hcard_path": "/hcard/users/",
+    "nodeinfo2_function": None,
+    # Seconds to cache NodeInfo2 responses, 0 to not cache
+    "nodeinfo2_cache_ttl": 300,
+    # Seconds to serve a stale NodeInfo2 response while it is refreshed
+    "nodeinfo2_stale_ttl": 3600,
+    "process_payload_function": None,
+    "search_path": None,
+    "tags_path": None,
+    # Seconds to cache webfinger responses, 0 to not cache
+    "webfinger_cache_ttl": 0,
+    # TODO remove or default to True once AP support is more ready
+    "activitypub": False,
+})
 
-def get_configuration():
+
+class ResolvedConfiguration:
+    """
+    Snapshot of the federation configuration.
+
+    Holds the defaults combined with ``settings.FEDERATION``, and the modules of the functions configured by dotted
+    path once they have been imported.
+    """
+    def __init__(self, federation_settings: Mapping):
+        configuration = dict(DEFAULT_CONFIGURATION)
+        configuration.update(federation_settings)
+        if not all([
+            "get_private_key_function" in configuration,
+            "get_profile_function" in configuration,
+            "base_url" in configuration,
+        ]):
+            raise ImproperlyConfigured("Missing required FEDERATION settings, please check documentation.")
+        self.configuration = MappingProxyType(configuration)
+        self._functions = {}
+
+    def get_function(self, item: str) -> Callable:
+        """
+        Get a configured function, importing its module on first use.
+
+        The function is looked up from the imported module on each call, so patching the function still works.
+
+        :raises AttributeError: If the item is not configured.
+        """
+        target = self._functions.get(item)
+        if target is None:
+            func_path = self.configuration.get(item)
+            module_path, func_name = func_path.rsplit(".", 1)
+            target = self._functions[item] = (importlib.import_module(module_path), func_name)
+        return getattr(*target)
+
+
+_resolved: Optional[ResolvedConfiguration] = None
+_lock = threading.Lock()
+
+
+def get_resolved_configuration() -> ResolvedConfiguration:
+    """
+    Get the configuration snapshot, creating it on first use.
+
+    The snapshot is dropped when the ``FEDERATION`` setting is changed, for example with ``override_settings``.
+    """
+    global _resolved
+    resolved = _resolved
+    if resolved is None:
+        with _lock:
+            resolved = _resolved
+            if resolved is None:
+                resolved = _resolved = ResolvedConfiguration(settings.FEDERATION)
+    return resolved
+
+
+def reset_configuration() -> None:
+    """Drop the configuration snapshot, so that it is created again from the settings on next use."""
+    global _resolved
+    _resolved = None
+
+
+@receiver(setting_changed)
+def _on_setting_changed(setting, **kwargs):
+    if setting == "FEDERATION":
+        reset_configuration()
+
+
+def get_configuration() -> Mapping:
     """
     Combine defaults with the Django configuration.
+
+    The combined configuration is computed once and returned as a read-only mapping.
     """
-    configuration = {
-        "get_object_function": None,
-        "hcard_path": "/hcard/users/",
-        "nodeinfo2_function": None,
-        "process_payload_function": None,
-        "search_path": None,
-        "tags_path": None,
-        # TODO remove or default to True once AP support is more ready
-        "activitypub": False,
-    }
-    configuration.update(settings.FEDERATION)
-    if not all([
-        "get_private_key_function" in configuration,
-        "get_profile_function" in configuration,
-        "base_url" in configuration,
-    ]):
-        raise ImproperlyConfigured("Missing required FEDERATION settings, please check documentation.")
-    return configuration
+    return get_resolved_configuration().configuration
 
 
 def get_function_from_config(item):
     """
-    Import the function to get profile by handle.
+    Get a function configured by dotted path, for example ``get_profile_function``.
+
+    The module of the function is imported on first use only.
     """
-    config = get_configuration()
-    func_path = config.get(item)
-    module_path, func_name = func_path.rsplit(".", 1)
-    module = importlib.import_module(module_path)
-    func = getattr(module, func_name)
-    return func
+    return get_resolved_configuration().get_function(item)
@@ -0,0 +1,164 @@
+"""
+Media type resolution for media URL's.
+
+Media types are first inferred without network access, from a ``data:`` URI or the URL file extension. If that
+is not possible and probing is enabled with ``set_media_type_probing``, the remote server is probed in the background
+with ``probe_media_type``. Probe results are cached.
+"""
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import unquote_to_bytes, urlparse
+
+from federation.utils.network import fetch_content_start, fetch_content_type
+
+logger = logging.getLogger("federation")
+
+MEDIA_TYPES_BY_EXTENSION = {
+    "gif": "image/gif",
+    "jpe": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+    "png": "image/png",
+}
+
+# Leading bytes of supported media formats
+MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+MAGIC_NUMBER_LENGTH = max(len(magic) for magic, _media_type in MAGIC_NUMBERS)
+
+# How many probed media types to remember
+MEDIA_TYPE_CACHE_SIZE = 1024
+# Maximum number of concurrent probes
+PROBE_WORKERS = 4
+# Seconds to wait for a probe when its result is needed
+PROBE_TIMEOUT = 5
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_pending = {}
+_executor = None
+_probing = False
+
+
+def guess_media_type_from_bytes(data: bytes) -> str:
+    """Get the media type of content from its leading bytes."""
+    for magic, media_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return media_type
+    return ""
+
+
+def guess_media_type_from_url(url: str) -> str:
+    """
+    Get the media type of a URL without network access.
+
+    For ``data:`` URI's the content is checked, falling back to the declared media type. For other URL's the
+    file extension is used.
+    """
+    if url.startswith("data:"):
+        header, _sep, data = url[5:].partition(",")
+        params = header.split(";")
+        data = data[:MAGIC_NUMBER_LENGTH * 2]
+        try:
+            if "base64" in params:
+                # Decode only the start of the data, in full base64 quanta
+                data = base64.b64decode(data[:len(data) // 4 * 4])
+            else:
+                data = unquote_to_bytes(data)
+        except ValueError:
+            data = b""
+        return guess_media_type_from_bytes(data) or params[0].strip().lower()
+    path = urlparse(url).path
+    _name, sep, extension = path.rpartition(".")
+    if not sep or "/" in extension:
+        return ""
+    return MEDIA_TYPES_BY_EXTENSION.get(extension.lower(), "")
+
+
+def get_cached_media_type(url: str) -> str:
+    """Get a previously probed media type for a URL."""
+    with _lock:
+        media_type = _cache.get(url, "")
+        if media_type:
+            _cache.move_to_end(url)
+    return media_type
+
+
+def _cache_media_type(url: str, media_type: str) -> None:
+    with _lock:
+        _cache[url] = media_type
+        _cache.move_to_end(url)
+        while len(_cache) > MEDIA_TYPE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def guess_media_type(url: str) -> str:
+    """Get the media type of a URL from the URL itself or the probe cache. Never does network access."""
+    if not url:
+        return ""
+    return guess_media_type_from_url(url) or get_cached_media_type(url)
+
+
+def fetch_media_type(url: str) -> str:
+    """
+    Fetch the media type of a URL from the remote server.
+
+    The ``Content-Type`` header from a HEAD request is used. If that is missing or generic, the first bytes of the
+    content are fetched and checked. Found media types are cached.
+    """
+    content_type = fetch_content_type(url) or ""
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if not media_type or media_type == "application/octet-stream":
+        media_type = guess_media_type_from_bytes(fetch_content_start(url, MAGIC_NUMBER_LENGTH) or b"")
+    if media_type:
+        _cache_media_type(url, media_type)
+    return media_type
+
+
+def _run_probe(url: str) -> str:
+    try:
+        return fetch_media_type(url)
+    except Exception as ex:
+        logger.warning("probe_media_type - failed to probe %s: %s", url, ex)
+        return ""
+    finally:
+        with _lock:
+            _pending.pop(url, None)
+
+
+def probe_media_type(url: str) -> Optional[Future]:
+    """
+    Start probing the media type of a URL in the background.
+
+    Concurrent probes of the same URL are shared.
+
+    :returns: Future resolving to the media type (or an empty string), or ``None`` if probing is disabled.
+    """
+    global _executor
+    if not _probing or not url:
+        return None
+    with _lock:
+        future = _pending.get(url)
+        if future is None:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="federation-media")
+            future = _pending[url] = _executor.submit(_run_probe, url)
+    return future
+
+
+def set_media_type_probing(enabled: bool) -> None:
+    """
+    Enable or disable probing remote servers for media types.
+
+    Probing is disabled by default, so media types are only inferred from the URL.
+    """
+    global _probing
+    _probing = enabled
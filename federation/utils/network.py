@@ -3,11 +3,15 @@ import datetime
 import logging
 import re
 import socket
-from typing import Optional, Tuple
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple
 
 import requests
 from ipdata import ipdata
-from requests.exceptions import RequestException, HTTPError, SSLError
+from requests.exceptions import RequestException, HTTPError, SSLError, Timeout
 from requests.exceptions import ConnectionError
 from requests.structures import CaseInsensitiveDict
 
@@ -16,6 +20,95 @@ from federation import __version__
 logger = logging.getLogger("federation")
 
 USER_AGENT = "python/federation/%s" % __version__
+# Bytes read at a time when fetching a document within a deadline
+DEADLINE_CHUNK_SIZE = 8192
+
+
+class FetchScope:
+    """
+    Scope for fetching remote documents.
+
+    Inside a scope, see ``fetch_scope``, ``fetch_document`` fetches each document only once. Concurrent fetches of
+    the same document from several threads share one request. Requests are timed out by the deadline of the scope.
+
+    :arg deadline: (Optional) ``time.monotonic()`` time by which all requests must be done.
+    """
+    def __init__(self, deadline: float = None):
+        self.deadline = deadline
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or ``None`` if there is no deadline."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def get_timeout(self, timeout: float) -> float:
+        """Get a request timeout that does not go past the deadline."""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return min(timeout, remaining)
+
+    def share(self, key: Hashable, func: Callable, *args, **kwargs):
+        """
+        Call a function once per key within the scope.
+
+        Later and concurrent calls with the same key get the result of the first call.
+
+        :raises concurrent.futures.TimeoutError: If the deadline passes while waiting for a call made by another
+            thread.
+        """
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+        if owner:
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as ex:
+                future.set_exception(ex)
+                raise
+            future.set_result(result)
+            return result
+        return future.result(timeout=self.remaining())
+
+
+_local = threading.local()
+
+
+def get_fetch_scope() -> Optional[FetchScope]:
+    """Get the fetch scope in use by the current thread, or ``None``."""
+    return getattr(_local, "fetch_scope", None)
+
+
+@contextmanager
+def fetch_scope(scope: FetchScope = None) -> Iterator[FetchScope]:
+    """
+    Fetch documents within a scope, see ``FetchScope``.
+
+    The scope is used by the current thread. A scope can be entered from several threads at the same time, to
+    share fetched documents between them.
+
+    :arg scope: (Optional) Scope to enter. A new scope without a deadline is created if not given.
+    """
+    scope = scope or FetchScope()
+    previous = get_fetch_scope()
+    _local.fetch_scope = scope
+    try:
+        yield scope
+    finally:
+        _local.fetch_scope = previous
+
+
+def get_request_timeout(timeout: float) -> float:
+    """Get a request timeout that does not go past the deadline of the fetch scope in use, if any."""
+    scope = get_fetch_scope()
+    if scope is None:
+        return timeout
+    return scope.get_timeout(timeout)
 
 
 def fetch_content_type(url: str) -> Optional[str]:
@@ -30,6 +123,21 @@ def fetch_content_type(url: str) -> Optional[str]:
         return response.headers.get('Content-Type')
 
 
+def fetch_content_start(url: str, length: int = 32) -> Optional[bytes]:
+    """
+    Fetch the first ``length`` bytes of the remote url.
+
+    Uses a range request. The rest of the content is not downloaded even if the server ignores the range.
+    """
+    headers = {'user-agent': USER_AGENT, 'Range': 'bytes=0-%s' % (length - 1)}
+    try:
+        with requests.get(url, headers=headers, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            return next(response.iter_content(length), b"")[:length]
+    except RequestException as ex:
+        logger.warning("fetch_content_start - %s when fetching url %s", ex, url)
+
+
 def fetch_country_by_ip(ip):
     """
     Fetches country code by IP
@@ -57,6 +165,9 @@ def fetch_document(url=None, host=None, path="/", timeout=10, raise_ssl_errors=T
     If ``url`` is given, only that will be tried without falling back to http from https.
     If ``host`` given, `path` will be added to it. Will fall back to http on non-success status code.
 
+    Inside a fetch scope, see ``fetch_scope``, each document is fetched only once and the whole fetch, including
+    reading the response and falling back to http, is stopped at the deadline of the scope.
+
     :arg url: Full url to fetch, including protocol
     :arg host: Domain part only without path or protocol
     :arg path: Path without domain (defaults to "/")
@@ -67,7 +178,50 @@ def fetch_document(url=None, host=None, path="/", timeout=10, raise_ssl_errors=T
     """
     if not url and not host:
         raise ValueError("Need url or host.")
+    scope = get_fetch_scope()
+    if scope is not None:
+        timeout = scope.get_timeout(timeout)
+        if timeout <= 0:
+            return None, None, Timeout("Fetch scope deadline passed")
+        key = (url, host, path, raise_ssl_errors, tuple(sorted(extra_headers.items())) if extra_headers else None)
+        try:
+            return scope.share(
+                key, _fetch_document, url, host, path, timeout, raise_ssl_errors, extra_headers, scope.deadline,
+            )
+        except FutureTimeoutError:
+            return None, None, Timeout("Fetch scope deadline passed")
+    return _fetch_document(url, host, path, timeout, raise_ssl_errors, extra_headers)
+
+
+def _get(url: str, timeout: float, headers: Dict, deadline: float = None) -> requests.Response:
+    """
+    Get a url, reading the response within a deadline.
 
+    The ``requests`` timeout applies to connecting and to each read, not to the whole response. With a deadline,
+    the response is streamed and reading it stops when the deadline passes.
+
+    :raises requests.exceptions.Timeout: If the deadline passes.
+    """
+    if deadline is None:
+        return requests.get(url, timeout=timeout, headers=headers)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise Timeout("Fetch scope deadline passed")
+    response = requests.get(url, timeout=min(timeout, remaining), headers=headers, stream=True)
+    try:
+        chunks = []
+        for chunk in response.iter_content(DEADLINE_CHUNK_SIZE):
+            if time.monotonic() > deadline:
+                raise Timeout("Fetch scope deadline passed")
+            chunks.append(chunk)
+        # Store the body like a response that wasn't streamed, so ``text`` and ``json`` work as usual
+        response._content = b"".join(chunks)
+    finally:
+        response.close()
+    return response
+
+
+def _fetch_document(url, host, path, timeout, raise_ssl_errors, extra_headers, deadline=None):
     logger.debug("fetch_document: url=%s, host=%s, path=%s, timeout=%s, raise_ssl_errors=%s",
                  url, host, path, timeout, raise_ssl_errors)
     headers = {'user-agent': USER_AGENT}
@@ -77,7 +231,7 @@ def fetch_document(url=None, host=None, path="/", timeout=10, raise_ssl_errors=T
         # Use url since it was given
         logger.debug("fetch_document: trying %s", url)
         try:
-            response = requests.get(url, timeout=timeout, headers=headers)
+            response = _get(url, timeout, headers, deadline)
             logger.debug("fetch_document: found document, code %s", response.status_code)
             return response.text, response.status_code, None
         except RequestException as ex:
@@ -89,7 +243,7 @@ def fetch_document(url=None, host=None, path="/", timeout=10, raise_ssl_errors=T
     url = "https://%s%s" % (host_string, path_string)
     logger.debug("fetch_document: trying %s", url)
     try:
-        response = requests.get(url, timeout=timeout, headers=headers)
+        response = _get(url, timeout, headers, deadline)
         logger.debug("fetch_document: found document, code %s", response.status_code)
         response.raise_for_status()
         return response.text, response.status_code, None
@@ -101,7 +255,7 @@ def fetch_document(url=None, host=None, path="/", timeout=10, raise_ssl_errors=T
         url = url.replace("https://", "http://")
         logger.debug("fetch_document: trying %s", url)
         try:
-            response = requests.get(url, timeout=timeout, headers=headers)
+            response = _get(url, timeout, headers, deadline)
             logger.debug("fetch_document: found document, code %s", response.status_code)
             response.raise_for_status()
             return response.text, response.status_code, None
@@ -205,6 +359,9 @@ def send_document(url, data, timeout=10, *args, **kwargs):
     if "headers" in kwargs:
         # Update from kwargs
         headers.update(kwargs.get("headers"))
+    timeout = get_request_timeout(timeout)
+    if timeout <= 0:
+        return None, Timeout("Fetch scope deadline passed")
     kwargs.update({
         "data": data, "timeout": timeout, "headers": headers
     })
@@ -1,5 +1,8 @@
 import re
-from urllib.parse import urlparse
+from typing import Union
+from urllib.parse import unquote_to_bytes, urlparse
+
+_non_whitespace = re.compile(rb"\S")
 
 
 def decode_if_bytes(text):
@@ -16,6 +19,41 @@ def encode_if_text(text):
         return text
 
 
+def as_bytes(data: Union[str, bytes, bytearray, memoryview]) -> bytes:
+    """
+    Get a request body as bytes.
+
+    Bytes are returned as is. Text is encoded as UTF-8 and other bytes-like objects are copied to bytes.
+    """
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    return bytes(data)
+
+
+def first_non_whitespace(data: bytes) -> bytes:
+    """Get the first non-whitespace byte of a document, without copying it. Empty if there is none."""
+    match = _non_whitespace.search(data)
+    if match is None:
+        return b""
+    return data[match.start():match.start() + 1]
+
+
+def lstrip_bytes(data: bytes) -> bytes:
+    """Strip leading whitespace. The data is only copied if there is whitespace to strip."""
+    if data[:1].isspace():
+        return data.lstrip()
+    return data
+
+
+def unquote_bytes(data: bytes) -> bytes:
+    """URL unquote bytes. The data is only copied if it contains quoted characters."""
+    if b"%" in data:
+        return unquote_to_bytes(data)
+    return data
+
+
 def get_path_from_url(url: str) -> str:
     """
     Return only the path part of an URL.
@@ -38,6 +38,7 @@ setup(
         "markdownify",
         "jsonschema>=2.0.0",
         "pycryptodome>=3.4.10",
+        "pyld>=2.0.0",
         "python-dateutil>=2.4.0",
         "python-xrd>=0.1",
         "pytz",